@@ -1,155 +1,99 @@
 #      -----      {{{     IMPORTS     }}}      -----      #
 
 import os
-import asyncio
-import threading
 from dotenv import load_dotenv
 
 from flask import Flask
 from flask_login import LoginManager
-from database_helpers import ensure_databases, close_databases, get_database, USER_DATABASE
+from database_helpers import close_databases, get_user_by_id
+from migrations import migrate_databases
+from storage_gc import start_gc_scheduler
+from metrics import clear_metrics_directory, instrument_app
 from models import User
+from user_cache import user_cache
 from app_routes import register_routes
 
 import logging
 from log_handler import setup_logging
 
-# Discord bot imports
-import discord
-from discord.ext import commands
-from cogs.bot_events import setup_bot_events
-
-# Init logging
-setup_logging()
-
 # Init login manager
 login_manager = LoginManager()
 
 # Load environment variables
 load_dotenv()
 
-# Discord bot configuration
-DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
-COMMAND_PREFIX = os.getenv("COMMAND_PREFIX", "!")
-ADMIN_ROLE_NAME = os.getenv("ADMIN_ROLE_NAME", "Admin")
-
-if not DISCORD_TOKEN:
-    raise RuntimeError("DISCORD_TOKEN is not set in .env")
-
-
-#      -----      {{{     SET UP     }}}      -----      #
-
-# Set up app with custom templates and static folders
-app = Flask(__name__, template_folder='templates (HTML pages)',
-            static_folder='static (css styles)')
-
-# Get secret key
-app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", "fd7gs6h9guohejtbgisfu")
-
-
-# Link login manager to app
-login_manager.init_app(app)
-login_manager.login_view = 'auth.login'
-
-# Register all routes
-register_routes(app)
-
-# ----- Discord Bot Setup -----
-intents = discord.Intents.default()
-intents.message_content = True
-intents.guilds = True
-intents.guild_messages = True
-intents.members = True
-
-# bot instance
-bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents)
 
-# Setup bot events and global commands
-setup_bot_events(bot)
+#      -----      {{{     USER LOADING     }}}      -----      #
 
-# How to load user
-
-
-@login_manager.user_loader
-def load_user(user_id):
-    db = get_database(USER_DATABASE)
-    user_data = db.execute(
-        'SELECT id, username, user_role, department FROM users WHERE id = ?',
-        (user_id,)
-    ).fetchone()
+def fetch_user(user_id: int) -> User | None:
+    user_data = get_user_by_id(user_id)
 
     if user_data:
-        return User(
-            id=user_data[0],
-            username=user_data[1],
-            user_role=user_data[2],
-            department=user_data[3]
-        )
+        return User.from_row(user_data)
     return None
 
-#      -----      {{{     BOT AND FLASK COORDINATION     }}}      -----      #
-
-
-# Global event loop for the bot
-bot_loop = None
 
+@login_manager.user_loader
+def load_user(user_id):
+    # Served from the in-process user cache; the database is only hit on a miss
+    return user_cache.get(user_id, fetch_user)
 
-async def run_bot():
-    """Run the Discord bot."""
-    async with bot:
-        # Load Cog FIRST so the sync in bot_events picks it up
-        try:
-            await bot.load_extension("cogs.collector_cog")
-            print("Loaded collector_cog.")
-        except Exception as e:
-            print(f"Failed to load collector_cog: {e}")
 
-        # This starts the connection; on_ready will handle the tree sync
-        await bot.start(DISCORD_TOKEN)
+#      -----      {{{     APP FACTORY     }}}      -----      #
 
+def create_app(rotate_logs: bool = False) -> Flask:
+    """Build the Flask app (the web tier only; the Discord bot lives in discord_bot.py).
 
-def start_bot_thread():
-    """Start the Discord bot in a background thread."""
-    global bot_loop
+    Web workers share the log files with the bot process, which rotates them,
+    so they only follow its renames unless rotate_logs is set.
+    """
+    setup_logging(rotate=rotate_logs)
 
-    def run_async_loop():
-        global bot_loop
-        bot_loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(bot_loop)
-        try:
-            bot_loop.run_until_complete(run_bot())
-        except Exception as e:
-            print(f"Bot error: {e}")
-        finally:
-            bot_loop.close()
+    # Set up app with custom templates and static folders
+    app = Flask(__name__, template_folder='templates (HTML pages)',
+                static_folder='static (css styles)')
 
-    bot_thread = threading.Thread(target=run_async_loop, daemon=True)
-    bot_thread.start()
-    print("Discord bot thread initialized.")
+    # Get secret key
+    app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", "fd7gs6h9guohejtbgisfu")
 
+    # Link login manager to app
+    login_manager.init_app(app)
+    login_manager.login_view = 'login'
 
-#      -----      {{{     SAFETY EVENT HANDLERS     }}}      -----      #
+    # Time every request (before the route hooks, so their redirects are timed too)
+    instrument_app(app)
 
-@app.before_request
-def before_request() -> None:
-    ensure_databases(app)
+    # Register all routes
+    register_routes(app)
 
+    @app.teardown_appcontext
+    def teardown_appcontext(error) -> None:
+        close_databases(error)
 
-@app.teardown_appcontext
-def teardown_appcontext(error) -> None:
-    close_databases(error)
+    return app
 
 
 #      -----      {{{     RUN APP     }}}      -----      #
 
+# Development mode. In production run the web tier with gunicorn/waitress
+# (wsgi.py) and the bot in its own process (bot_runner.py).
 if __name__ == '__main__':
-    # Initialize databases BEFORE starting bot
-    with app.app_context():
-        ensure_databases(app)
+    # One process writes the logs here, so it rotates them too
+    app = create_app(rotate_logs=True)
+
+    # Drop the /metrics snapshots of processes from an earlier run
+    clear_metrics_directory(stale_only=True)
+
+    # Create / migrate the databases BEFORE starting bot (once, not per request)
+    migrate_databases()
 
     # Start the Discord bot in background thread
+    from discord_bot import start_bot_thread
     start_bot_thread()
 
+    # Periodic storage reconciliation, next to the bot as in bot_runner.py (see storage_gc.py)
+    start_gc_scheduler()
+
     # Initial log entry
     logging.info("Starting Flask Web Server...")
 
@@ -1,10 +1,16 @@
 #      -----      {{{     IMPORTS     }}}      -----      #
 
-from flask import render_template, redirect, url_for, request
-from flask_login import current_user
+from flask import Response, render_template, stream_template, redirect, url_for, request
+from flask_login import current_user, login_required
 from auth_user_routes import register_auth_routes
-from database_helpers import get_database, USER_DATABASE, get_files_by_department, FILES_DATABASE
+from database_helpers import get_database, USER_DATABASE, get_files_by_department, FILES_DATABASE, get_files_page, DEFAULT_PAGE_SIZE, file_facets, release_blob
 from models import File
+from user_cache import user_cache
+from log_viewer import LOG_SOURCES, DEFAULT_LOG_PAGE_SIZE, LogFilter, get_log_page
+from export import EXPORT_FORMATS, export_filename, stream_export
+from previews import preview_kind, get_preview, serve_preview
+from metrics import CONTENT_TYPE, metrics_request_allowed, render_metrics
+from blob_store import stored_file_path
 import os
 from werkzeug.utils import secure_filename
 
@@ -62,19 +68,10 @@ def register_routes(app):
     #Settings page
     @app.route('/settings')
     def settings():
-        # Fetch the current user's email and phone from database
-        db = get_database(USER_DATABASE)
-        user_data = db.execute(
-            'SELECT email, phone_number FROM users WHERE id = ?',
-            (current_user.id,)
-        ).fetchone()
-        
-        email = user_data[0] if user_data else None
-        phone_number = user_data[1] if user_data else None
-        
+        # The current user's email and phone were loaded (and cached) with the user
         return render_template('settings.html', 
-                             user_email=email, 
-                             user_phone=phone_number)
+                             user_email=current_user.email, 
+                             user_phone=current_user.phone_number)
     
     #Validation for updating user's details
     @app.route('/update-profile', methods=['POST'])
@@ -101,6 +98,7 @@ def register_routes(app):
                 current_user.id)
             )
             db.commit()
+            user_cache.invalidate(current_user.id)
             return redirect(url_for('settings'))
         except Exception as e:
             print(f"Error updating profile: {e}")
@@ -109,47 +107,113 @@ def register_routes(app):
     # Files repository page
     @app.route('/files')
     def files():
-        # Get all unique departments for filter dropdown
-        db = get_database(FILES_DATABASE)
-        departments = db.execute(
-            'SELECT DISTINCT department FROM files ORDER BY department'
-        ).fetchall()
-        departments = [dept[0] for dept in departments if dept[0]]
+        # Get all unique departments for filter dropdown (cached, see FacetCache)
+        departments = file_facets.departments()
+        department_counts = file_facets.department_counts()
         
         # Get selected department from query parameter
         selected_dept = request.args.get('department', 'all')
         search_query = request.args.get('search', '').strip()
 
-        #Build queries based on filters
-        query = 'SELECT * FROM files'
-        conditions = []
-        params = []
-
-        if selected_dept and selected_dept != 'all':
-            conditions.append('department = ?')
-            params.append(selected_dept)
+        after = request.args.get('after', '').strip()
+        page_size = request.args.get('page_size', DEFAULT_PAGE_SIZE, type=int)
 
-        if search_query:
-            conditions.append('file_name LIKE ?')
-            params.append(f'%{search_query}%')
-        
-        if conditions:
-            query += ' WHERE ' + ' AND '.join(conditions)
-        
-        query += ' ORDER BY time_stamp DESC'
-
-        #Execute query
-        cursor = db.execute(query, tuple(params)).fetchall()
-        files_list = [File.from_row(row) for row in cursor]
+        # Only one page is fetched, and its rows are turned into cards while streaming
+        try:
+            files_page = get_files_page(selected_dept, search_query, after, page_size)
+        except ValueError:
+            return "Invalid page cursor", 400
     
-        return render_template('files.html',
-                            files=files_list,
+        return stream_template('files.html',
+                            files=files_page,
                             departments=departments,
+                            department_counts=department_counts,
                             selected_dept=selected_dept,
                             search_query=search_query,
+                            after=after,
                             get_file_icon=get_file_icon,
+                            preview_kind=preview_kind,
                             format_datetime=format_datetime)
 
+    # Log viewer, newest entries first (admins only)
+    @app.route('/logs')
+    @login_required
+    def logs():
+        if current_user.role != 'admin':
+            return "Unauthorized - Admin access required", 403
+
+        source = request.args.get('source', 'app')
+        if source not in LOG_SOURCES:
+            return "Unknown log source", 400
+
+        level = request.args.get('level', '').strip()
+        user = request.args.get('user', '').strip()
+        channel = request.args.get('channel', '').strip()
+        before = request.args.get('before', '').strip()
+        page_size = request.args.get('page_size', DEFAULT_LOG_PAGE_SIZE, type=int)
+
+        # Reads backwards from the cursor, so only this page's bytes are touched
+        try:
+            log_filter = LogFilter(level, user, channel)
+            log_page = get_log_page(source, log_filter, before or None, page_size)
+        except ValueError as e:
+            return f"Invalid log query: {e}", 400
+
+        return render_template('logs.html',
+                               entries=log_page,
+                               sources=list(LOG_SOURCES),
+                               source=source,
+                               level=level.upper(),
+                               user=user,
+                               channel=channel,
+                               before=before,
+                               page_size=page_size)
+
+    # Bulk export of the catalog (CSV / JSON lines) or the files themselves (zip), admins only
+    @app.route('/export')
+    @login_required
+    def export_files():
+        if current_user.role != 'admin':
+            return "Unauthorized - Admin access required", 403
+
+        export_format = request.args.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return "Unknown export format", 400
+        department = request.args.get('department', 'all')
+        search_query = request.args.get('search', '').strip()
+
+        # Generated while it is sent (chunked), so there is no Content-Length
+        response = Response(stream_export(export_format, department, search_query),
+                            mimetype=EXPORT_FORMATS[export_format][0])
+        response.headers.set('Content-Disposition', 'attachment',
+                             filename=export_filename(export_format, department))
+        # Stop nginx from buffering the whole export before passing it on
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    # Thumbnail of an image / PDF for its card on the files page
+    @app.route('/preview/<int:file_id>')
+    def file_preview(file_id):
+        file_data = get_database(FILES_DATABASE).execute(
+            'SELECT file_name, file_type, file_path, content_hash FROM files WHERE id = ?', (file_id,)
+        ).fetchone()
+        if not file_data:
+            return "File not found", 404
+
+        source_path = stored_file_path(file_data['file_name'], file_data['content_hash'], file_data['file_path'])
+        preview = source_path and get_preview(source_path, file_data['content_hash'],
+                                              file_data['file_type'], file_data['file_name'])
+        if not preview:
+            return "No preview available", 404
+        return serve_preview(*preview)
+
+    # Prometheus scrape target (bearer token from METRICS_TOKEN, or local scrapers only)
+    @app.route('/metrics')
+    def metrics():
+        if not metrics_request_allowed():
+            return "Forbidden", 403
+        return Response(render_metrics(), content_type=CONTENT_TYPE)
+
     # Download route (add this too)
     @app.route('/download/<filename>')
     def download_file(filename):
@@ -177,10 +241,7 @@ def register_routes(app):
         file = File.from_row(file_data)
         
         # Get all departments for dropdown
-        departments = db.execute(
-            'SELECT DISTINCT department FROM files ORDER BY department'
-        ).fetchall()
-        departments = [dept[0] for dept in departments if dept[0]]
+        departments = file_facets.departments()
         
         return render_template('edit-file.html', 
                             file=file, 
@@ -241,9 +302,12 @@ def register_routes(app):
                 (file_name, department, project, file_id)
             )
             db.commit()
+            file_facets.record_update(current_file['department'], current_file['file_type'],
+                                      department, current_file['file_type'])
             
-            # Rename the actual file if file name changed
-            if file_name != current_file['file_name']:
+            # Rename the actual file if file name changed (blob-stored files are
+            # addressed by content hash, so only their metadata changes)
+            if file_name != current_file['file_name'] and not current_file['content_hash']:
                 old_path = os.path.join('downloads', current_file['file_name'])
                 new_path = os.path.join('downloads', secure_filename(file_name))
                 
@@ -283,11 +347,16 @@ def register_routes(app):
             # Delete file from database
             db.execute('DELETE FROM files WHERE id = ?', (file_id,))
             db.commit()
+            file_facets.record_delete(file_data['department'], file_data['file_type'])
             
-            # Delete actual file from downloads folder
-            file_path = os.path.join('downloads', file_data['file_name'])
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            # Delete the blob once no other file references the same content
+            if file_data['content_hash']:
+                release_blob(file_data['content_hash'])
+            else:
+                # Delete actual file from downloads folder (where an edit may have renamed it)
+                file_path = stored_file_path(file_data['file_name'], None, file_data['file_path'])
+                if file_path:
+                    os.remove(file_path)
             
             return redirect(url_for('files'))
             
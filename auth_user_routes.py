@@ -2,8 +2,10 @@
 
 from flask import abort, render_template, request, redirect, url_for, flash, session
 from flask_login import login_required, login_user, logout_user, current_user
-from database_helpers import get_database, USER_DATABASE
+from database_helpers import get_database, USER_DATABASE, get_dashboard_stats
 from models import User
+from user_cache import user_cache
+from credentials import CredentialsBusy, hash_password, verify_login
 
 #      -----      {{{     AUTH ROUTES     }}}      -----      #
 
@@ -24,12 +26,26 @@ def register_auth_routes(app):
                 error = 'Username and password are required.'
             else:
                 curr = db.execute(
-                    'SELECT id, username, user_role, department FROM users WHERE username = ? AND user_password = ?',
-                    (username, password)
+                    'SELECT id, username, user_password, user_role, department FROM users WHERE username = ?',
+                    (username,)
                 )
                 user_data = curr.fetchone()
 
-                if user_data:
+                # Hash check runs in the credential worker pool
+                try:
+                    valid, upgraded_hash = verify_login(
+                        password, user_data['user_password'] if user_data else None)
+                except CredentialsBusy:
+                    return render_template('login.html',
+                                           error='Too many logins right now, please try again in a moment.'), 503
+
+                if valid:
+                    # Plaintext or outdated hashes are replaced on successful login
+                    if upgraded_hash:
+                        db.execute('UPDATE users SET user_password = ? WHERE id = ?',
+                                   (upgraded_hash, user_data['id']))
+                        db.commit()
+
                     # Create User Object
                     user_obj = User(
                         id=user_data['id'],
@@ -77,11 +93,12 @@ def register_auth_routes(app):
                 return render_template('register.html', error="Username taken.")
 
             try:
-                db.execute(
+                cursor = db.execute(
                     'INSERT INTO users (username, user_password, user_role, department) VALUES (?, ?, ?, ?)',
-                    (username, password, role, department)
+                    (username, hash_password(password), role, department)
                 )
                 db.commit()
+                user_cache.invalidate(cursor.lastrowid)
                 return redirect(url_for('manage_users'))
             except Exception:
                 return render_template('register.html', error="Registration failed.")
@@ -92,25 +109,22 @@ def register_auth_routes(app):
     @app.route('/dashboard')
     @login_required
     def dashboard():
-        # Mock Data for Charts
-        stats = { 'total': 1400, 'active': 1233, 'suspended': 145, 'new': 22 }
-
-        pie_data = [
-            ['Status', 'Count'],
-            ['Active', stats['active']],
-            ['Suspended', stats['suspended']],
-            ['New', stats['new']]
-        ]
-
-        line_data = [
-            ['Month', 'New Users', 'Total Users'],
-            ['Jan',  50,       400],
-            ['Feb',  80,       480],
-            ['Mar',  100,      580],
-            ['Apr',  150,      730],
-            ['May',  200,      930],
-            ['Jun',  250,      1180]
-        ]
+        # Precomputed counts (trigger-maintained stats tables, no scans of users/files)
+        dashboard_stats = get_dashboard_stats()
+        files_by_month = dashboard_stats['files_by_month']
+
+        stats = {
+            'total': dashboard_stats['total_users'],
+            'admins': dashboard_stats['users_by_role'].get('admin', 0),
+            'files': dashboard_stats['total_files'],
+            'files_this_month': files_by_month[-1][1] if files_by_month else 0,
+        }
+
+        pie_data = [['Department', 'Files']]
+        pie_data += [[department, count] for department, count in dashboard_stats['files_by_department'].items()]
+
+        line_data = [['Month', 'New Files', 'Total Files']]
+        line_data += [[month, new_files, total_files] for month, new_files, total_files in files_by_month]
 
         return render_template('dashboard.html', 
                                stats=stats, 
@@ -141,6 +155,7 @@ def register_auth_routes(app):
             db.execute('UPDATE users SET username = ?, user_role = ?, department = ? WHERE id = ?', 
                        (username, role, department, user_id))
             db.commit()
+            user_cache.invalidate(user_id)
             return redirect(url_for('manage_users'))
 
         user_row = db.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
@@ -156,6 +171,7 @@ def register_auth_routes(app):
         if request.method == 'POST':
             db.execute('DELETE FROM users WHERE id = ?', (user_id,))
             db.commit()
+            user_cache.invalidate(user_id)
             return redirect(url_for('manage_users'))
 
         user_row = db.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
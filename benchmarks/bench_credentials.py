@@ -0,0 +1,69 @@
+"""
+Benchmark: logins/sec at different password hashing cost settings.
+
+Simulates concurrent logins through credentials.verify_login (the same worker
+pool the /login route uses). Run from the project root:
+
+    python benchmarks/bench_credentials.py [--clients 8] [--logins 64]
+
+CREDENTIAL_WORKERS in .env sets the pool size being measured.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import credentials
+from credentials import HashPolicy, hash_password, verify_login
+
+
+#      -----      {{{     COST SETTINGS     }}}      -----      #
+
+def cost_settings() -> list[HashPolicy]:
+    policies = [HashPolicy('scrypt', scrypt_n=2 ** n) for n in (12, 13, 14, 15)]
+    if credentials.PasswordHasher is not None:
+        policies += [HashPolicy('argon2', argon2_time_cost=t, argon2_memory_cost=m)
+                     for t, m in ((1, 8192), (2, 19456), (3, 65536))]
+    return policies
+
+
+#      -----      {{{     BENCHMARK     }}}      -----      #
+
+def bench(policy: HashPolicy, clients: int, logins: int) -> tuple[float, float]:
+    stored = hash_password('correct horse battery staple', policy)
+
+    def one_login(_):
+        start = time.perf_counter()
+        valid, _ = verify_login('correct horse battery staple', stored, policy)
+        assert valid
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as client_threads:
+        latencies = list(client_threads.map(one_login, range(logins)))
+    elapsed = time.perf_counter() - start
+    return logins / elapsed, sum(latencies) / len(latencies) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=8, help='concurrent login requests')
+    parser.add_argument('--logins', type=int, default=64, help='logins per cost setting')
+    args = parser.parse_args()
+
+    print(f"{args.clients} concurrent clients, {credentials.CREDENTIAL_WORKERS} credential worker(s), "
+          f"{os.cpu_count()} CPU(s)")
+    print(f"{'cost setting':<40} {'logins/sec':>12} {'avg latency':>14}")
+    for policy in cost_settings():
+        rate, latency_ms = bench(policy, args.clients, args.logins)
+        print(f"{policy.describe():<40} {rate:>12.1f} {latency_ms:>11.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: messages/sec through link extraction on a synthetic busy channel.
+
+Compares the old per-call regex compile, run twice per message (once in
+on_message and again in build_payload_from_message), with
+cogs.link_extractor.extract_links run once. Run from the project root:
+
+    python benchmarks/bench_link_extraction.py [--messages 200000]
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.link_extractor import extract_links
+
+
+#      -----      {{{     SYNTHETIC CHANNEL     }}}      -----      #
+
+WORDS = ("ok", "lgtm", "meeting at 3", "can someone check this", "thanks!", "see the doc",
+         "deploying now", "who has the slides?", "lol", "merged")
+
+URLS = ("https://cdn.discordapp.com/attachments/1/2/report.pdf?ex=65&is=64&hm=abc",
+        "https://github.com/notJ0sh/apex-legend/pull/42",
+        "https://drive.google.com/file/d/1AbC/view?usp=sharing&utm_source=chat",
+        "https://www.youtube.com/watch?v=dQw4w9WgXcQ&si=xyz",
+        "https://example.com/some/page#section",
+        "HTTPS://Docs.Google.com/document/d/xyz/edit")
+
+
+def synthetic_messages(count: int, unique: bool = False, seed: int = 7) -> list[str]:
+    """Mostly chatter; about 1 in 5 messages carries 1-3 links, repeated unless `unique`."""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 6)))
+        if rng.random() < 0.2:
+            links = [rng.choice(URLS) for _ in range(rng.randint(1, 3))]
+            if unique:
+                links = [f"{link.split('#')[0]}{'&' if '?' in link else '?'}n={rng.random()}"
+                         for link in links]
+            text += " " + " ".join(f"({link})" if rng.random() < 0.2 else link for link in links)
+        messages.append(text)
+    return messages
+
+
+#      -----      {{{     IMPLEMENTATIONS     }}}      -----      #
+
+def old_extract_links(text: str) -> list[str]:
+    pattern = re.compile(r"(https?://[^\s]+)", re.IGNORECASE)
+    return pattern.findall(text or "")
+
+
+def old_on_message(text: str) -> list[str]:
+    if not old_extract_links(text):
+        return []
+    return old_extract_links(text)
+
+
+def new_on_message(text: str) -> list:
+    return extract_links(text)
+
+
+def bench(handler, messages: list[str]) -> float:
+    start = time.perf_counter()
+    for text in messages:
+        handler(text)
+    return len(messages) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=200_000)
+    parser.add_argument('--unique', action='store_true',
+                        help='make every posted link distinct (worst case for the parse cache)')
+    args = parser.parse_args()
+
+    messages = synthetic_messages(args.messages, unique=args.unique)
+    with_links = sum(1 for text in messages if "://" in text)
+    print(f"{len(messages)} messages, {with_links} with links")
+
+    old_rate = bench(old_on_message, messages)
+    new_rate = bench(new_on_message, messages)
+    print(f"{'old (compile per call, parsed twice)':<40} {old_rate:>12,.0f} msg/s")
+    print(f"{'link_extractor (compiled, parsed once)':<40} {new_rate:>12,.0f} msg/s")
+    print(f"speed-up: {new_rate / old_rate:.2f}x (new path also normalizes, dedupes and classifies)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: File objects built per second and bytes per File, old vs new mapping.
+
+Fills an in-memory files table, then reads every row back the old way
+(sqlite3.Row + dict-backed File.from_row with nine key lookups) and the new
+way (File.row_factory building __slots__ objects straight from the tuples).
+Run from the project root:
+
+    python benchmarks/bench_models.py [--rows 100000] [--repeat 3]
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import File
+
+
+#      -----      {{{     PREVIOUS MODEL     }}}      -----      #
+
+class DictFile:
+    """The File class before __slots__ (kept here as the baseline)."""
+
+    def __init__(self, id, file_name, file_type, file_path, department,
+                 time_stamp=None, user=None, project=None, source=None):
+        self.id = id
+        self.file_name = file_name
+        self.file_type = file_type
+        self.file_path = file_path
+        self.department = department
+        self.time_stamp = time_stamp
+        self.user = user
+        self.project = project
+        self.source = source
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            id=row['id'],
+            file_name=row['file_name'],
+            file_type=row['file_type'],
+            file_path=row['file_path'],
+            department=row['department'],
+            time_stamp=row['time_stamp'],
+            user=row['user'],
+            project=row['project'],
+            source=row['source']
+        )
+
+
+#      -----      {{{     BENCHMARK     }}}      -----      #
+
+def make_database(rows: int) -> sqlite3.Connection:
+    database = sqlite3.connect(':memory:')
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'files_schema.sql')) as f:
+        database.executescript(f.read())
+    database.executemany(
+        'INSERT INTO files (file_name, file_type, file_path, department, user, project, source, time_stamp) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(f'report_{i}.pdf', 'application/pdf', f'downloads/blobs/{i:064x}', f'DEPT{i % 12}',
+          f'user{i % 500}', f'project {i % 40}', 'discord', f'2025-{i % 12 + 1:02d}-01 12:00:00')
+         for i in range(rows)]
+    )
+    database.commit()
+    return database
+
+
+def load_old(database: sqlite3.Connection) -> list:
+    cursor = database.cursor()
+    cursor.row_factory = sqlite3.Row
+    return [DictFile.from_row(row) for row in cursor.execute('SELECT * FROM files')]
+
+
+def load_new(database: sqlite3.Connection) -> list:
+    cursor = database.cursor()
+    cursor.row_factory = File.row_factory
+    return cursor.execute(f'SELECT {File.SELECT_COLUMNS} FROM files').fetchall()
+
+
+def bench(load, database: sqlite3.Connection, repeat: int) -> tuple[float, float]:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        files = load(database)
+        best = min(best, time.perf_counter() - start)
+    rows = len(files)
+    del files
+
+    # Memory held by the objects (the column strings are counted too, the same for both)
+    tracemalloc.start()
+    files = load(database)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del files
+    return rows / best, held / rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=100_000, help='rows in the files table')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per variant (best is kept)')
+    args = parser.parse_args()
+
+    database = make_database(args.rows)
+    print(f"{args.rows} rows, best of {args.repeat}")
+    print(f"{'mapping':<34}{'rows/sec':>12}{'bytes/row':>12}")
+    for name, load in (('sqlite3.Row + dict File (before)', load_old),
+                       ('tuple row_factory + slots File', load_new)):
+        rate, per_row = bench(load, database, args.repeat)
+        print(f"{name:<34}{rate:>12,.0f}{per_row:>12,.0f}")
+
+
+if __name__ == '__main__':
+    main()
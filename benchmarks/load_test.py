@@ -0,0 +1,117 @@
+"""
+Load test: requests/sec and latency of a running web server.
+
+Logs in once per client, then has every client request the given pages in a
+loop over a keep-alive connection. Run it against each serving mode with the
+same settings to compare them:
+
+    python app.py                                   # dev server + bot thread
+    gunicorn -c gunicorn.conf.py wsgi:app           # or: python wsgi.py (waitress)
+
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 [--clients 16] [--seconds 20]
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit, urlencode
+
+
+#      -----      {{{     CLIENT     }}}      -----      #
+
+class Client:
+    """One simulated user: a logged-in session on its own keep-alive connection."""
+
+    def __init__(self, base_url: str, timeout: float):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+        self.cookie = ''
+
+    def request(self, method: str, path: str, body: str | None = None) -> int:
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        response.read()
+        set_cookie = response.getheader('Set-Cookie')
+        if set_cookie:
+            self.cookie = set_cookie.split(';', 1)[0]
+        return response.status
+
+    def login(self, username: str, password: str) -> None:
+        status = self.request('POST', '/login', urlencode({'username': username, 'password': password}))
+        if status != 302:
+            raise RuntimeError(f"Login failed with HTTP {status}")
+
+
+#      -----      {{{     BENCHMARK     }}}      -----      #
+
+def run(args) -> None:
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+
+    def client_loop():
+        nonlocal errors
+        client = Client(args.url, args.timeout)
+        client.login(args.username, args.password)
+        own_latencies, own_errors = [], 0
+        index = 0
+        while time.perf_counter() < deadline:
+            path = args.paths[index % len(args.paths)]
+            index += 1
+            start = time.perf_counter()
+            try:
+                status = client.request('GET', path)
+            except (OSError, http.client.HTTPException):
+                own_errors += 1
+                client = Client(args.url, args.timeout)
+                client.login(args.username, args.password)
+                continue
+            own_latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                own_errors += 1
+        with lock:
+            latencies.extend(own_latencies)
+            errors += own_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client_loop) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+    print(f"{args.url}  {args.clients} clients  {elapsed:.1f}s  paths: {', '.join(args.paths)}")
+    print(f"  requests: {len(latencies)}  errors: {errors}  throughput: {len(latencies) / elapsed:.1f} req/s")
+    print(f"  latency ms  p50 {percentile(0.50):.1f}  p95 {percentile(0.95):.1f}  p99 {percentile(0.99):.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='base URL of the running server')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent clients')
+    parser.add_argument('--seconds', type=float, default=20, help='test duration')
+    parser.add_argument('--paths', default='/files,/dashboard,/logs', help='comma-separated pages to request')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='adminpass')
+    parser.add_argument('--timeout', type=float, default=30, help='per-request timeout in seconds')
+    args = parser.parse_args()
+    args.paths = [path.strip() for path in args.paths.split(',') if path.strip()]
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Content-addressed storage for downloaded attachments.
+
+Files are stored once per unique content under downloads/blobs/<aa>/<bb>/<sha256>,
+so re-posting the same file costs no extra disk and two different files with
+the same name can never overwrite each other. Reference counts live in the
+`blobs` table of the files database (see files_storage.sql).
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import time
+import uuid
+import hashlib
+
+from dotenv import load_dotenv
+from werkzeug.security import safe_join
+
+load_dotenv()
+
+
+#      -----      {{{     DIRECTORY CONSTANTS     }}}      -----      #
+
+UPLOAD_DIRECTORY = 'downloads'
+BLOB_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, 'blobs')
+TEMP_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, 'tmp')
+
+# Blobs stored or reused more recently than this are never deleted: the files
+# row that references them may still be waiting in the write-behind queue
+BLOB_GRACE_SECONDS = float(os.getenv("GC_GRACE_SECONDS", "3600"))
+
+
+#      -----      {{{     BLOB HELPERS     }}}      -----      #
+
+class HashingWriter:
+    """File wrapper that hashes and counts bytes as they are written."""
+
+    def __init__(self, f):
+        self._file = f
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+
+# Get the sharded path of a blob relative to BLOB_DIRECTORY.
+def blob_relative_path(sha256: str) -> str:
+    return os.path.join(sha256[:2], sha256[2:4], sha256)
+
+
+# Get the sharded path of a blob.
+def blob_path(sha256: str) -> str:
+    return os.path.join(BLOB_DIRECTORY, blob_relative_path(sha256))
+
+
+# Get a unique temporary path to stream a download into.
+def new_temp_path() -> str:
+    os.makedirs(TEMP_DIRECTORY, exist_ok=True)
+    return os.path.join(TEMP_DIRECTORY, f"{uuid.uuid4().hex}.part")
+
+
+# Move a finished download into the store, dropping it if the content is already stored.
+def store_blob(temp_path: str, sha256: str) -> str:
+    """Move a hashed temp file to its blob path and return that path."""
+    path = blob_path(sha256)
+    try:
+        # Duplicate content: the existing blob is reused, the new copy is discarded.
+        # Touching it keeps it inside the grace period of remove_blob / the storage GC.
+        os.utime(path)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        return path
+
+    os.remove(temp_path)
+    return path
+
+
+# Check whether a file was written or touched within the blob grace period.
+def is_recent(path: str) -> bool:
+    try:
+        return time.time() - os.path.getmtime(path) < BLOB_GRACE_SECONDS
+    except FileNotFoundError:
+        return False
+
+
+# Remove an unreferenced blob from disk; returns False if it was kept as recently used.
+def remove_blob(sha256: str) -> bool:
+    path = blob_path(sha256)
+    if is_recent(path):
+        return False
+
+    # Move it aside first: a store_blob racing with us has either touched it
+    # already (seen below, so it is put back) or finds it gone and writes a fresh copy
+    aside = new_temp_path()
+    try:
+        os.replace(path, aside)
+    except FileNotFoundError:
+        return True
+    if is_recent(aside):
+        os.replace(aside, path)
+        return False
+    os.remove(aside)
+    return True
+
+
+# Remove a temp file left behind by a failed download.
+def discard_temp(temp_path: str) -> None:
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+
+# Find where a file's bytes live on disk (None if they are missing).
+def stored_file_path(file_name: str, content_hash: str | None, file_path: str | None = None) -> str | None:
+    """Blob path for content-addressed files, the downloads/ file for older ones.
+
+    Older files live at their recorded file_path (renamed through
+    secure_filename when edited) or, failing that, at downloads/<file_name>.
+    Rows kept as metadata only point at a Discord URL and have no file here.
+    """
+    if not content_hash and file_path and file_path.startswith(('http://', 'https://')):
+        return None
+    if content_hash:
+        candidates = [os.path.join('blobs', blob_relative_path(content_hash))]
+    else:
+        candidates = [file_name]
+        if file_path:
+            relative_path = file_path.replace('\\', '/').lstrip('/')
+            if relative_path.startswith(UPLOAD_DIRECTORY + '/'):
+                relative_path = relative_path[len(UPLOAD_DIRECTORY) + 1:]
+            candidates.insert(0, relative_path)
+
+    for relative_path in candidates:
+        # safe_join refuses names that would escape the downloads folder
+        path = safe_join(UPLOAD_DIRECTORY, relative_path)
+        if path is not None and os.path.isfile(path):
+            return path
+    return None
@@ -0,0 +1,66 @@
+"""
+Run the Discord collector bot as its own process.
+
+In production the bot no longer shares a process (and the GIL) with the web
+server: start it next to the WSGI server with
+
+    python bot_runner.py
+
+or let gunicorn spawn it (RUN_BOT_WITH_WEB=1 in gunicorn.conf.py).
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import signal
+import asyncio
+import logging
+
+from discord_bot import bot, run_bot
+from log_handler import setup_logging
+from metrics import clear_metrics_directory
+from migrations import migrate_databases
+from storage_gc import start_gc_scheduler
+
+
+#      -----      {{{     RUN BOT     }}}      -----      #
+
+async def run_until_stopped() -> None:
+    """Run the bot until it exits or SIGTERM asks for a clean shutdown."""
+    bot_task = asyncio.create_task(run_bot())
+    stop_requested = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop_requested.set)
+    except NotImplementedError:  # Windows: Ctrl+C only
+        pass
+
+    stop_task = asyncio.create_task(stop_requested.wait())
+    await asyncio.wait([bot_task, stop_task], return_when=asyncio.FIRST_COMPLETED)
+    stop_task.cancel()
+    if not bot_task.done():
+        # close() unloads the cogs, which drains the download and ingest queues
+        await bot.close()
+    await bot_task
+
+
+def main() -> None:
+    # The bot is the one process that rotates the shared log files
+    setup_logging(rotate=True)
+
+    # Drop the /metrics snapshots of processes from an earlier run
+    clear_metrics_directory(stale_only=True)
+
+    # The bot writes to the same databases as the web tier; make sure they exist first
+    migrate_databases()
+
+    # Periodic storage reconciliation runs next to the bot (one process, not every web worker)
+    start_gc_scheduler()
+
+    logging.info("Starting Discord bot process...")
+    try:
+        asyncio.run(run_until_stopped())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -13,14 +13,17 @@ def cleanup():
             print(f"Removed: {pycache_path}")
 
     # Remove specific files (like the db's and other stuff add the name here)
-    files_to_remove = ['user_data.db', 'files_data.db']
+    files_to_remove = []
+    for db_file in ['user_data.db', 'files_data.db']:
+        # WAL mode keeps -wal / -shm side files next to each database
+        files_to_remove += [db_file, db_file + '-wal', db_file + '-shm']
     for file in files_to_remove:
         if os.path.exists(file):
             os.remove(file)
             print(f"Removed: {file}")
 
     # Remove all files from specific folders
-    folders_to_clean = ['Logs', 'downloads']
+    folders_to_clean = ['Logs', 'downloads', 'metrics_snapshots']
     for folder in folders_to_clean:
         if os.path.exists(folder):
             for filename in os.listdir(folder):
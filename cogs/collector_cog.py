@@ -1,6 +1,8 @@
 # collector_cog.py
 import os
 import re
+import time
+import asyncio
 import discord
 from discord.ext import commands
 from discord import app_commands
@@ -8,12 +10,50 @@ from dotenv import load_dotenv
 
 # Import the check from your existing admin_checks file
 from .admin_checks import admin_only_check
-from database_helpers import add_data_from_discord
+from .link_extractor import Link, extract_links
+from download_pipeline import DownloadBatch, DownloadPipeline
+from database_helpers import add_links_from_discord, get_link_ingest_queue, get_file_ingest_queue, find_known_message_ids
+from ingest_policy import DOWNLOAD, METADATA_ONLY, SKIP, get_ingest_policy, refund_quota
 
 load_dotenv()
 
 API_BASE_URL = os.getenv("API_BASE_URL", "").strip()
 
+# Messages fetched per known-id lookup while backfilling (Discord returns 100 per request)
+BACKFILL_PAGE_SIZE = int(os.getenv("BACKFILL_PAGE_SIZE", "100"))
+
+# Seconds between progress updates on the /backfill response (each one is a message edit)
+BACKFILL_PROGRESS_INTERVAL = float(os.getenv("BACKFILL_PROGRESS_INTERVAL", "30"))
+
+# Channel mentions (<#id>) or raw channel ids
+CHANNEL_ID_PATTERN = re.compile(r"\d{15,20}")
+
+
+class BackfillProgress:
+    """Counters shared by the channel walkers of one /backfill run."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        # Only this run's downloads, so live traffic doesn't inflate the numbers
+        self.downloads = DownloadBatch()
+        self.scanned = 0
+        self.skipped = 0
+        self.collected = 0
+        self.attachments = 0
+        self.channels_done = 0
+
+    def summary(self, channel_count: int) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        downloaded = self.downloads.bytes_downloaded
+        return (
+            f"Channels: {self.channels_done}/{channel_count} done, {elapsed:.0f}s elapsed.\n"
+            f"Messages: {self.scanned} scanned ({self.scanned / elapsed:.1f} msg/s), "
+            f"{self.skipped} already known, {self.collected} collected.\n"
+            f"Attachments: {self.attachments} queued, {self.downloads.pending} waiting, "
+            f"{self.downloads.completed} stored, {self.downloads.failed} failed, "
+            f"{downloaded / 1024 / 1024:.1f} MiB downloaded ({downloaded / 1024 / elapsed:.1f} KiB/s)."
+        )
+
 
 class CollectorCog(commands.Cog):
     """Collects files and links from Discord and sends them to backend."""
@@ -21,18 +61,26 @@ class CollectorCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.collect_active: bool = True
+        self.backfill_running: bool = False
+        self.downloads = DownloadPipeline(on_not_stored=refund_quota)
+        self.policy = None
         print(f"CollectorCog initialised. API_BASE_URL={API_BASE_URL!r}")
 
-    # ---------- helpers ----------
+    # ---------- lifecycle ----------
+
+    async def cog_load(self):
+        # Loads the rules and the current quota usage (one small read)
+        self.policy = await asyncio.to_thread(get_ingest_policy)
+        await self.downloads.start()
+
+    async def cog_unload(self):
+        await self.downloads.stop()
+        await asyncio.to_thread(get_link_ingest_queue().flush)
 
-    # extract links from text
-    @staticmethod
-    def extract_links(text: str) -> list[str]:
-        pattern = re.compile(r"(https?://[^\s]+)", re.IGNORECASE)
-        return pattern.findall(text or "")
+    # ---------- helpers ----------
 
-    # build payload from message into dict
-    def build_payload_from_message(self, message: discord.Message) -> dict:
+    # build payload from message into dict (links are extracted once by on_message)
+    def build_payload_from_message(self, message: discord.Message, links: list[Link]) -> dict:
         attachments_data = []
         for att in message.attachments:
             attachments_data.append({
@@ -42,8 +90,6 @@ class CollectorCog(commands.Cog):
                 "size": att.size,
             })
 
-        links = self.extract_links(message.content or "")
-
         return {
             "message_id": str(message.id),
             "uploader_id": str(message.author.id),
@@ -56,9 +102,15 @@ class CollectorCog(commands.Cog):
             "timestamp": message.created_at.isoformat(),
         }
 
-    # save file data to database
-    def save_files_to_database(self, message: discord.Message, attachments_data: list[dict]):
-        """Save file data to the files table in the database."""
+    # check each attachment against the ingest policy, then queue it for download
+    # or save only its metadata
+    async def save_files_to_database(self, message: discord.Message, attachments_data: list[dict],
+                                     batch: DownloadBatch | None = None):
+        """Queue allowed attachments for the download pipeline, which saves them to the files table."""
+        if self.policy.usage.is_stale():
+            await asyncio.to_thread(self.policy.usage.load)
+
+        department = getattr(message.channel, "name", "N/A").upper()
         for att_data in attachments_data:
             file_record = {
                 "file_name": att_data["filename"],
@@ -66,16 +118,105 @@ class CollectorCog(commands.Cog):
                 "file_path": att_data["url"],
                 "user": message.author.name,
                 "group_name": getattr(message.channel, "name", "DM"),
-                "department": getattr(message.channel, "name", "N/A").upper(),
+                "department": department,
                 "source": "discord",
                 "user_id": str(message.author.id),
                 "message_id": str(message.id),
                 "channel_id": str(message.channel.id),
             }
-            try:
-                add_data_from_discord(file_record)
-            except Exception as e:
-                print(f"Error saving file to database: {e}")
+            action, reason = self.policy.decide(file_record["channel_id"], department, file_record["user_id"],
+                                                att_data["filename"], att_data["content_type"], att_data["size"])
+            if action == DOWNLOAD:
+                # The size charged to the quotas, refunded if the download doesn't get stored
+                file_record["file_size"] = att_data["size"]
+                if not await self.downloads.enqueue(file_record, batch):
+                    refund_quota(file_record)
+            elif action == METADATA_ONLY:
+                # Listed with its Discord URL (and no content hash) instead of a stored copy
+                print(f"Not downloading {att_data['filename']}: {reason}")
+                await asyncio.to_thread(get_file_ingest_queue().submit, file_record)
+            else:
+                print(f"Skipping {att_data['filename']}: {reason}")
+
+    # queue links for the links table (one row per URL, counted per sighting)
+    async def save_links_to_database(self, message: discord.Message, links: list[Link]):
+        """Queue the message's links for the batched links insert."""
+        posted_at = message.created_at.strftime("%Y-%m-%d %H:%M:%S")
+        link_records = [{
+            "url": link.url,
+            "kind": link.kind,
+            "user": message.author.name,
+            "user_id": str(message.author.id),
+            "group_name": getattr(message.channel, "name", "DM"),
+            "message_id": str(message.id),
+            "channel_id": str(message.channel.id),
+            "timestamp": posted_at,
+        } for link in links]
+        # submit only blocks when the buffer is full, so keep it off the event loop
+        await asyncio.to_thread(add_links_from_discord, link_records)
+
+    # queue a message's attachments and links; returns False if it had neither
+    async def collect_message(self, message: discord.Message, batch: DownloadBatch | None = None) -> bool:
+        # Parse the message text once; the payload reuses the result
+        links = extract_links(message.content)
+        has_attachments = len(message.attachments) > 0
+        has_links = len(links) > 0
+
+        if not (has_attachments or has_links):
+            return False
+
+        payload = self.build_payload_from_message(message, links)
+
+        if has_attachments:
+            await self.save_files_to_database(message, payload['attachments'], batch)
+
+        if has_links:
+            await self.save_links_to_database(message, payload['links'])
+        return True
+
+    # resolve "<#id> <#id> 1234..." into text channels/threads of this guild
+    async def resolve_channels(self, guild: discord.Guild, text: str) -> list[discord.abc.Messageable]:
+        channels = []
+        for channel_id in dict.fromkeys(CHANNEL_ID_PATTERN.findall(text)):
+            channel = guild.get_channel_or_thread(int(channel_id))
+            if channel is None:
+                try:
+                    channel = await guild.fetch_channel(int(channel_id))
+                except discord.HTTPException:
+                    continue
+            if isinstance(channel, (discord.TextChannel, discord.Thread)):
+                channels.append(channel)
+        return channels
+
+    # walk one channel's history newest-first, collecting messages not seen before
+    async def backfill_channel(self, channel, limit: int | None, progress: BackfillProgress):
+        page: list[discord.Message] = []
+
+        async def flush_page():
+            # One indexed lookup per page instead of one query per message
+            known = await asyncio.to_thread(find_known_message_ids, [str(m.id) for m in page])
+            for message in page:
+                progress.scanned += 1
+                if message.author.bot or str(message.id) in known:
+                    progress.skipped += 1
+                    continue
+                # enqueue waits while the download queue is full, which paces the walk
+                if await self.collect_message(message, progress.downloads):
+                    progress.collected += 1
+                    progress.attachments += len(message.attachments)
+            page.clear()
+
+        try:
+            async for message in channel.history(limit=limit):
+                page.append(message)
+                if len(page) >= BACKFILL_PAGE_SIZE:
+                    await flush_page()
+            if page:
+                await flush_page()
+        except discord.Forbidden:
+            print(f"Backfill: no permission to read history of #{channel}")
+        finally:
+            progress.channels_done += 1
 
     # ---------- event listener ----------
 
@@ -85,17 +226,8 @@ class CollectorCog(commands.Cog):
         if message.guild is None or message.author.bot or not self.collect_active:
             return
 
-        has_attachments = len(message.attachments) > 0
-        has_links = len(self.extract_links(message.content or "")) > 0
-
-        if not (has_attachments or has_links):
-            return
-
-        payload = self.build_payload_from_message(message)
-        print(f"Collecting from {message.author} in #{message.channel}")
-
-        if has_attachments:
-            self.save_files_to_database(message, payload['attachments'])
+        if await self.collect_message(message):
+            print(f"Collecting from {message.author} in #{message.channel}")
 
     # ---------- slash commands ----------
 
@@ -117,13 +249,81 @@ class CollectorCog(commands.Cog):
         self.collect_active = False
         await interaction.response.send_message("❌ Collection disabled.")
 
+    @app_commands.command(
+        name="backfill",
+        description="Collect files and links from channel history posted while the bot was offline."
+    )
+    @app_commands.describe(
+        channels="Channel mentions or ids, separated by spaces",
+        limit="Max messages to scan per channel (default: whole history)"
+    )
+    @app_commands.check(admin_only_check)
+    async def backfill(self, interaction: discord.Interaction, channels: str,
+                       limit: app_commands.Range[int, 1] | None = None):
+        if self.backfill_running:
+            await interaction.response.send_message("⏳ A backfill is already running.", ephemeral=True)
+            return
+
+        targets = await self.resolve_channels(interaction.guild, channels)
+        if not targets:
+            await interaction.response.send_message("❌ No readable text channels given.", ephemeral=True)
+            return
+
+        await interaction.response.defer(thinking=True)
+        self.backfill_running = True
+        progress = BackfillProgress()
+        # Message edited instead of the response once the interaction token has expired
+        fallback: discord.Message | None = None
+
+        async def report(prefix: str):
+            nonlocal fallback
+            text = f"{prefix}\n{progress.summary(len(targets))}"
+            try:
+                if fallback is None:
+                    await interaction.edit_original_response(content=text)
+                else:
+                    await fallback.edit(content=text)
+            except discord.HTTPException:
+                # Interaction tokens expire after 15 minutes; post one message and keep editing it
+                try:
+                    fallback = await interaction.channel.send(text)
+                except discord.HTTPException as e:
+                    print(f"Backfill progress not delivered: {e}")
+
+        async def report_periodically():
+            while True:
+                await asyncio.sleep(BACKFILL_PROGRESS_INTERVAL)
+                await report("🔄 Backfill running…")
+
+        reporter = asyncio.create_task(report_periodically())
+        try:
+            # Channels are paged concurrently; downloads share the pipeline's limits
+            await asyncio.gather(*(self.backfill_channel(channel, limit, progress) for channel in targets))
+            # Wait for this run's downloads only, not for live traffic queued meanwhile
+            await progress.downloads.wait()
+        finally:
+            reporter.cancel()
+            self.backfill_running = False
+
+        await report("✅ Backfill finished.")
+
     @app_commands.command(
         name="collector_status",
         description="Show current collector status."
     )
     async def collector_status(self, interaction: discord.Interaction):
         status = "active ✅" if self.collect_active else "inactive ❌"
-        await interaction.response.send_message(f"Collector is currently **{status}**.")
+        stats = self.downloads.stats()
+        await interaction.response.send_message(
+            f"Collector is currently **{status}**.\n"
+            f"Download queue: {stats['queue_depth']}/{stats['queue_size']} waiting, "
+            f"{stats['in_flight']} in flight, {stats['completed']} done, {stats['failed']} failed, "
+            f"{stats['skipped']} already stored.\n"
+            f"Ingest policy: {self.policy.decisions[METADATA_ONLY]} saved as metadata only, "
+            f"{self.policy.decisions[SKIP]} skipped.\n"
+            f"Waiting to be saved: {stats['ingest_pending']} file(s), "
+            f"links of {get_link_ingest_queue().depth} message(s)."
+        )
 
     # Shared error handler for this Cog
     async def cog_app_command_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
@@ -0,0 +1,149 @@
+"""
+Link extraction for collected Discord messages.
+
+Patterns are compiled once at import. Each message is parsed once per event;
+URLs are normalized (lower-case scheme/host, no fragment, no tracking params),
+deduplicated in order of appearance and classified by host.
+"""
+
+import re
+from functools import lru_cache
+from typing import NamedTuple
+from urllib.parse import urlsplit, urlunsplit
+
+
+#      -----      {{{     PATTERNS     }}}      -----      #
+
+LINK_PATTERN = re.compile(r"https?://[^\s<>]+", re.IGNORECASE)
+
+# Punctuation that usually ends a sentence rather than the URL
+TRAILING_PUNCTUATION = ".,;:!?'\"*_~|>"
+
+# Query parameters that only track where a link was clicked
+TRACKING_PARAM_PATTERN = re.compile(r"^(utm_[a-z]+|fbclid|gclid|igshid|ref_src)$", re.IGNORECASE)
+TRACKING_QUERY_PATTERN = re.compile(r"(?:^|&)(?:utm_[a-z]+|fbclid|gclid|igshid|ref_src)=", re.IGNORECASE)
+
+# "si" is a share-tracking id on these hosts only; elsewhere it can be a real parameter
+SHARE_ID_HOSTS = frozenset({"youtube.com", "m.youtube.com", "music.youtube.com", "youtu.be",
+                            "open.spotify.com", "spotify.link"})
+SHARE_TRACKING_PARAM_PATTERN = re.compile(r"^(utm_[a-z]+|fbclid|gclid|igshid|si|ref_src)$", re.IGNORECASE)
+SHARE_TRACKING_QUERY_PATTERN = re.compile(r"(?:^|&)(?:utm_[a-z]+|fbclid|gclid|igshid|si|ref_src)=", re.IGNORECASE)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+#      -----      {{{     LINK KINDS     }}}      -----      #
+
+DISCORD_CDN = "discord_cdn"
+DISCORD = "discord"
+GITHUB = "github"
+GOOGLE_DRIVE = "google_drive"
+YOUTUBE = "youtube"
+OTHER = "other"
+
+# Exact host -> kind lookups (a "www." prefix is ignored)
+HOST_KINDS = {
+    "cdn.discordapp.com": DISCORD_CDN,
+    "media.discordapp.net": DISCORD_CDN,
+    "discord.com": DISCORD,
+    "discord.gg": DISCORD,
+    "discordapp.com": DISCORD,
+    "github.com": GITHUB,
+    "gist.github.com": GITHUB,
+    "raw.githubusercontent.com": GITHUB,
+    "drive.google.com": GOOGLE_DRIVE,
+    "docs.google.com": GOOGLE_DRIVE,
+    "youtube.com": YOUTUBE,
+    "m.youtube.com": YOUTUBE,
+    "youtu.be": YOUTUBE,
+}
+
+
+class Link(NamedTuple):
+    url: str
+    kind: str
+
+
+#      -----      {{{     HELPERS     }}}      -----      #
+
+# Strip sentence punctuation and unbalanced closing brackets off the end of a match.
+def _trim(raw: str) -> str:
+    while raw:
+        last = raw[-1]
+        if last in TRAILING_PUNCTUATION:
+            raw = raw[:-1]
+        elif last == ')' and raw.count('(') < raw.count(')'):
+            raw = raw[:-1]
+        else:
+            break
+    return raw
+
+
+# Split a raw match into (normalized url, host), or None if it isn't a usable URL.
+def _normalize(raw: str) -> tuple[str, str] | None:
+    try:
+        parts = urlsplit(_trim(raw))
+        host = (parts.hostname or "").lower()
+        port = parts.port
+    except ValueError:
+        return None
+    if not host:
+        return None
+
+    scheme = parts.scheme.lower()
+    netloc = host if port in (None, DEFAULT_PORTS.get(scheme)) else f"{host}:{port}"
+
+    # Only rebuild the query when it actually carries tracking params; the rest
+    # keep their original encoding (signed Discord CDN params must stay intact)
+    query = parts.query
+    if (host[4:] if host.startswith("www.") else host) in SHARE_ID_HOSTS:
+        query_pattern, param_pattern = SHARE_TRACKING_QUERY_PATTERN, SHARE_TRACKING_PARAM_PATTERN
+    else:
+        query_pattern, param_pattern = TRACKING_QUERY_PATTERN, TRACKING_PARAM_PATTERN
+    if query and query_pattern.search(query):
+        query = "&".join(param for param in query.split("&")
+                         if not param_pattern.match(param.split("=", 1)[0]))
+    return urlunsplit((scheme, netloc, parts.path or "/", query, "")), host
+
+
+# Normalize a URL so the same link always compares (and hashes) equal.
+def normalize_url(raw: str) -> str | None:
+    normalized = _normalize(raw)
+    return None if normalized is None else normalized[0]
+
+
+# Classify a host into a link kind.
+def classify_host(host: str) -> str:
+    if host.startswith("www."):
+        host = host[4:]
+    return HOST_KINDS.get(host, OTHER)
+
+
+# Normalize + classify one raw match. Busy channels repeat the same links a lot,
+# so results are memoized and a repeat costs one dict lookup instead of a URL parse.
+@lru_cache(maxsize=4096)
+def _parse_link(raw: str) -> Link | None:
+    normalized = _normalize(raw)
+    if normalized is None:
+        return None
+    url, host = normalized
+    return Link(url, classify_host(host))
+
+
+#      -----      {{{     EXTRACTION     }}}      -----      #
+
+# Extract normalized, deduplicated, classified links from message text.
+def extract_links(text: str | None) -> list[Link]:
+    # Cheap pre-check: most messages contain no links at all
+    if not text or "://" not in text:
+        return []
+
+    links = []
+    seen = set()
+    for raw in LINK_PATTERN.findall(text):
+        link = _parse_link(raw)
+        if link is None or link.url in seen:
+            continue
+        seen.add(link.url)
+        links.append(link)
+    return links
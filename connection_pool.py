@@ -0,0 +1,281 @@
+"""
+Thread-safe SQLite connection pool shared by the Flask handlers and the Discord bot thread.
+
+Each thread reuses the connection it already holds, so nested helpers inside one
+request share a single connection. Released connections go back to an idle list
+instead of being closed, which removes the per-request connect/pragma setup.
+Statements run on pooled connections are timed into sqlite_query_duration_seconds.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+from metrics import Histogram
+
+load_dotenv()
+
+
+#      -----      {{{     POOL CONSTANTS     }}}      -----      #
+
+# Max number of open connections per database file
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Milliseconds SQLite waits on a locked database before raising "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+# Bytes of the database file memory-mapped for reads
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Page cache size in KiB (passed to SQLite as a negative cache_size)
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16000"))
+
+# Applied to every new connection. WAL lets readers run alongside the single writer.
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}',
+    f'PRAGMA mmap_size = {DB_MMAP_SIZE}',
+    f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}',
+)
+
+
+#      -----      {{{     TIMED CONNECTIONS     }}}      -----      #
+
+SQL_QUERY_SECONDS = Histogram(
+    'sqlite_query_duration_seconds', 'Time to run a statement (until its first row for queries)',
+    ('statement',), buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+
+# First table a statement reads from or writes to
+TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+([\w.]+)', re.IGNORECASE)
+COMMENT_PATTERN = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql: str) -> str:
+    """'SELECT files', 'INSERT blobs', 'CREATE TRIGGER'... so the label stays low-cardinality."""
+    sql = COMMENT_PATTERN.sub(' ', sql)
+    words = sql.split(None, 2)
+    if not words:
+        return 'EMPTY'
+    verb = words[0].upper()
+    if verb in ('CREATE', 'DROP', 'ALTER'):
+        return f"{verb} {words[1].upper()}" if len(words) > 1 else verb
+    table = TABLE_PATTERN.search(sql)
+    return f"{verb} {table.group(1)}" if table else verb
+
+
+def _timed(label: str, call, *args):
+    started = time.perf_counter()
+    try:
+        return call(*args)
+    finally:
+        SQL_QUERY_SECONDS.observe(time.perf_counter() - started, label)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor from TimedConnection.cursor(), timed the same way as the connection's shortcuts."""
+
+    def execute(self, sql, parameters=()):
+        return _timed(statement_label(sql), super().execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return _timed(statement_label(sql), super().executemany, sql, parameters)
+
+    def executescript(self, script):
+        return _timed('SCRIPT', super().executescript, script)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection that records how long each statement takes.
+
+    connection.execute() doesn't go through cursor().execute(), so both paths
+    are timed without counting a statement twice.
+    """
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return _timed(statement_label(sql), super().execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return _timed(statement_label(sql), super().executemany, sql, parameters)
+
+    def executescript(self, script):
+        return _timed('SCRIPT', super().executescript, script)
+
+
+#      -----      {{{     CONNECTION POOL     }}}      -----      #
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections to one database file."""
+
+    def __init__(self, db_name: str, max_size: int = DB_POOL_SIZE,
+                 timeout: float = DB_POOL_TIMEOUT):
+        self.db_name = db_name
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self._idle: list[sqlite3.Connection] = []
+        self._open = 0
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    # ---------- connections ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        database = sqlite3.connect(
+            self.db_name,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            factory=TimedConnection
+        )
+        database.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            database.execute(pragma)
+        return database
+
+    @staticmethod
+    def _is_healthy(database: sqlite3.Connection) -> bool:
+        try:
+            database.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, database: sqlite3.Connection) -> None:
+        try:
+            database.close()
+        except sqlite3.Error:
+            pass
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    # take an idle connection, open a new one, or wait for one to be released
+    def _checkout(self) -> sqlite3.Connection:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._condition:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise sqlite3.OperationalError(
+                            f"Timed out waiting for a connection to {self.db_name}")
+                    self._condition.wait(remaining)
+
+                if self._idle:
+                    database = self._idle.pop()
+                else:
+                    self._open += 1
+                    database = None
+
+            if database is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._condition:
+                        self._open -= 1
+                        self._condition.notify()
+                    raise
+
+            # Health check idle connections before handing them out
+            if self._is_healthy(database):
+                return database
+            self._discard(database)
+
+    # ---------- public API ----------
+
+    def acquire(self) -> sqlite3.Connection:
+        """Return this thread's connection, checking one out of the pool if needed."""
+        database = getattr(self._local, 'database', None)
+        if database is not None:
+            self._local.depth += 1
+            return database
+
+        database = self._checkout()
+        self._local.database = database
+        self._local.depth = 1
+        return database
+
+    def release(self, database: sqlite3.Connection) -> None:
+        """Give the connection back once the outermost holder in this thread is done."""
+        if getattr(self._local, 'database', None) is not database:
+            return
+
+        self._local.depth -= 1
+        if self._local.depth > 0:
+            return
+        self._local.database = None
+
+        # Never hand out a connection with a half-finished transaction
+        try:
+            if database.in_transaction:
+                database.rollback()
+        except sqlite3.Error:
+            self._discard(database)
+            return
+
+        with self._condition:
+            self._idle.append(database)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Context manager around acquire()/release()."""
+        database = self.acquire()
+        try:
+            yield database
+        finally:
+            self.release(database)
+
+    def close_all(self) -> None:
+        """Close every idle connection (used at shutdown)."""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for database in idle:
+            database.close()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {"open": self._open, "idle": len(self._idle), "max_size": self.max_size}
+
+
+#      -----      {{{     POOL REGISTRY     }}}      -----      #
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+# Get (or lazily create) the shared pool for a database file.
+def get_pool(db_name: str) -> ConnectionPool:
+    """Get the process-wide connection pool for a database file."""
+    pool = _pools.get(db_name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_name)
+            if pool is None:
+                pool = ConnectionPool(db_name)
+                _pools[db_name] = pool
+    return pool
+
+
+# Close all idle pooled connections.
+def close_all_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
@@ -0,0 +1,225 @@
+"""
+Password hashing and verification.
+
+Passwords are stored as scrypt hashes (stdlib) or argon2id hashes when
+argon2-cffi is installed and PASSWORD_HASH_ALGORITHM=argon2. Cost parameters
+come from the environment; hashes made with older parameters (or legacy
+plaintext rows) are transparently upgraded on the next successful login.
+
+Verification runs in a small thread pool: both hash functions release the
+GIL, so slow hashes use spare cores, and the pool size caps how much CPU
+concurrent logins can take. The request thread still waits for its hash, so
+that wait is bounded too: when more than CREDENTIAL_MAX_WAITING logins are
+already waiting, or a hash doesn't finish within CREDENTIAL_TIMEOUT seconds,
+verify_login raises CredentialsBusy (a 503 for the login page) rather than
+tying up request workers behind a login burst.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import hmac
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from dotenv import load_dotenv
+
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import InvalidHashError, VerificationError
+except ImportError:  # argon2-cffi is optional
+    PasswordHasher = None
+
+load_dotenv()
+
+
+#      -----      {{{     CREDENTIAL CONSTANTS     }}}      -----      #
+
+# 'scrypt' (always available) or 'argon2' (needs argon2-cffi)
+PASSWORD_HASH_ALGORITHM = os.getenv("PASSWORD_HASH_ALGORITHM", "scrypt").strip().lower()
+
+# scrypt cost: memory used is 128 * N * r bytes
+SCRYPT_N = int(os.getenv("SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SCRYPT_P", "1"))
+
+# argon2id cost (memory in KiB)
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "2"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "19456"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+
+# Max number of password hashes computed at the same time
+CREDENTIAL_WORKERS = int(os.getenv("CREDENTIAL_WORKERS", "2"))
+
+# Max number of logins waiting for (or in) the pool before new ones are refused
+CREDENTIAL_MAX_WAITING = int(os.getenv("CREDENTIAL_MAX_WAITING", str(CREDENTIAL_WORKERS * 4)))
+
+# Seconds a login waits for its hash before giving up
+CREDENTIAL_TIMEOUT = float(os.getenv("CREDENTIAL_TIMEOUT", "10"))
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+#      -----      {{{     HASH POLICY     }}}      -----      #
+
+class HashPolicy:
+    """Algorithm and cost parameters used for new hashes."""
+
+    def __init__(self, algorithm: str = PASSWORD_HASH_ALGORITHM,
+                 scrypt_n: int = SCRYPT_N, scrypt_r: int = SCRYPT_R, scrypt_p: int = SCRYPT_P,
+                 argon2_time_cost: int = ARGON2_TIME_COST,
+                 argon2_memory_cost: int = ARGON2_MEMORY_COST,
+                 argon2_parallelism: int = ARGON2_PARALLELISM):
+        if algorithm == 'argon2' and PasswordHasher is None:
+            print("argon2-cffi is not installed, falling back to scrypt password hashes")
+            algorithm = 'scrypt'
+        self.algorithm = algorithm
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+        self.argon2 = None
+        if algorithm == 'argon2':
+            self.argon2 = PasswordHasher(time_cost=argon2_time_cost,
+                                         memory_cost=argon2_memory_cost,
+                                         parallelism=argon2_parallelism)
+
+    def describe(self) -> str:
+        if self.argon2 is not None:
+            params = self.argon2
+            return f"argon2id t={params.time_cost} m={params.memory_cost}KiB p={params.parallelism}"
+        return f"scrypt N={self.scrypt_n} r={self.scrypt_r} p={self.scrypt_p}"
+
+
+DEFAULT_POLICY = HashPolicy()
+
+
+#      -----      {{{     SCRYPT FORMAT     }}}      -----      #
+
+# Stored as: scrypt$n=<N>,r=<r>,p=<p>$<salt b64>$<key b64>
+
+def _b64encode(raw: bytes) -> str:
+    return base64.b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p + 1024 * 1024, dklen=KEY_BYTES)
+
+
+def _parse_scrypt(stored: str) -> tuple[int, int, int, bytes, bytes] | None:
+    try:
+        _, params, salt, key = stored.split('$')
+        values = dict(item.split('=') for item in params.split(','))
+        return int(values['n']), int(values['r']), int(values['p']), _b64decode(salt), _b64decode(key)
+    except (ValueError, KeyError):
+        return None
+
+
+#      -----      {{{     HASH / VERIFY     }}}      -----      #
+
+# Hash a password with the given policy.
+def hash_password(password: str, policy: HashPolicy = DEFAULT_POLICY) -> str:
+    if policy.argon2 is not None:
+        return policy.argon2.hash(password)
+
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, policy.scrypt_n, policy.scrypt_r, policy.scrypt_p)
+    return (f"scrypt$n={policy.scrypt_n},r={policy.scrypt_r},p={policy.scrypt_p}"
+            f"${_b64encode(salt)}${_b64encode(key)}")
+
+
+# Check a password against a stored hash (or legacy plaintext value).
+def verify_password(password: str, stored: str) -> bool:
+    if stored.startswith('scrypt$'):
+        parsed = _parse_scrypt(stored)
+        if parsed is None:
+            return False
+        n, r, p, salt, key = parsed
+        return hmac.compare_digest(_scrypt(password, salt, n, r, p), key)
+
+    if stored.startswith('$argon2'):
+        if PasswordHasher is None:
+            print("Cannot verify an argon2 hash: argon2-cffi is not installed")
+            return False
+        try:
+            return PasswordHasher().verify(stored, password)
+        except (VerificationError, InvalidHashError):
+            return False
+
+    # Legacy rows stored the password itself
+    return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+
+
+# Check whether a stored hash was made with different parameters than the policy.
+def needs_rehash(stored: str, policy: HashPolicy = DEFAULT_POLICY) -> bool:
+    if policy.argon2 is not None:
+        if not stored.startswith('$argon2'):
+            return True
+        try:
+            return policy.argon2.check_needs_rehash(stored)
+        except InvalidHashError:
+            return True
+
+    if not stored.startswith('scrypt$'):
+        return True
+    parsed = _parse_scrypt(stored)
+    return parsed is None or parsed[:3] != (policy.scrypt_n, policy.scrypt_r, policy.scrypt_p)
+
+
+def _verify_and_upgrade(password: str, stored: str, policy: HashPolicy) -> tuple[bool, str | None]:
+    if not verify_password(password, stored):
+        return False, None
+    if needs_rehash(stored, policy):
+        return True, hash_password(password, policy)
+    return True, None
+
+
+#      -----      {{{     WORKER POOL     }}}      -----      #
+
+class CredentialsBusy(Exception):
+    """The credential pool is saturated; the login should be retried later."""
+
+
+_credential_pool = ThreadPoolExecutor(max_workers=max(1, CREDENTIAL_WORKERS),
+                                      thread_name_prefix="credentials")
+_waiting = threading.BoundedSemaphore(max(1, CREDENTIAL_MAX_WAITING))
+
+# Hash checked when the username doesn't exist, so both cases take the same time
+_DUMMY_HASH = hash_password('not-a-real-password')
+
+
+def _run_in_pool(function, *args):
+    if not _waiting.acquire(blocking=False):
+        raise CredentialsBusy("Too many logins waiting")
+    try:
+        future = _credential_pool.submit(function, *args)
+        try:
+            return future.result(timeout=CREDENTIAL_TIMEOUT)
+        except TimeoutError:
+            # Not started yet: drop it so the pool doesn't work on an abandoned login
+            future.cancel()
+            raise CredentialsBusy(f"Password check took over {CREDENTIAL_TIMEOUT:g}s")
+    finally:
+        _waiting.release()
+
+
+# Verify a login in the credential pool and return (ok, upgraded hash or None).
+def verify_login(password: str, stored: str | None,
+                 policy: HashPolicy = DEFAULT_POLICY) -> tuple[bool, str | None]:
+    """Verify a password in the worker pool.
+
+    Returns (True, new_hash) when the stored value should be replaced because
+    it is plaintext or was hashed with outdated parameters. Raises
+    CredentialsBusy when the pool is saturated.
+    """
+    if stored is None:
+        _run_in_pool(verify_password, password, _DUMMY_HASH)
+        return False, None
+    return _run_in_pool(_verify_and_upgrade, password, stored, policy)
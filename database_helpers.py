@@ -2,8 +2,20 @@
 
 import sqlite3
 import os
-from flask import g, Flask, Response, send_from_directory
+import hashlib
+import threading
+import time
+from flask import g, Response, redirect
+from werkzeug.security import safe_join
 from models import File
+from connection_pool import get_pool
+from write_behind import WriteBehindQueue
+from metrics import Gauge
+from blob_store import (UPLOAD_DIRECTORY, HashingWriter, blob_relative_path,
+                        blob_path, new_temp_path, store_blob, remove_blob, discard_temp, is_recent)
+from download_serving import serve_stored_file
+from discord_cdn import fresh_attachment_url
+from previews import queue_preview, discard_preview
 import requests
 
 from log_handler import log_db_entry
@@ -14,9 +26,24 @@ USER_DATABASE = 'user_data.db'
 FILES_DATABASE = 'files_data.db'
 
 
-#      -----      {{{     DIRECTORY CONSTANTS     }}}      -----      #
+#      -----      {{{     INGESTION CONSTANTS     }}}      -----      #
 
-UPLOAD_DIRECTORY = 'downloads'
+# Collected files are written in batches of this many rows...
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "50"))
+
+# ...or after this many seconds, whichever comes first
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0"))
+
+# Producers block once this many records are waiting to be written
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "1000"))
+
+# One row per attachment; backed by the idx_files_message_file unique index
+FILE_UNIQUE_COLUMNS = ('message_id', 'file_name')
+
+# Columns written for each collected file record
+FILE_RECORD_COLUMNS = ('file_name', 'file_type', 'file_path', 'user', 'group_name',
+                       'department', 'source', 'user_id', 'message_id', 'channel_id',
+                       'content_hash')
 
 
 #      -----      {{{     DATABASE HELPERS     }}}      -----      #
@@ -29,125 +56,113 @@ def get_database(db_name: str) -> sqlite3.Connection:
     database = getattr(g, db_attr, None)
 
     if database is None:
-        database = sqlite3.connect(db_name)
-        database.row_factory = sqlite3.Row
+        database = get_pool(db_name).acquire()
         setattr(g, db_attr, database)
 
     return database
 
 
-# Initialize database with schema from specified SQL file.
-def init_database(db_name: str, schema_file: str, app: Flask) -> None:
-    """Initialize database with schema from specified SQL file."""
-    with app.app_context():
-        database = get_database(db_name)
-        with app.open_resource(schema_file) as f:
-            sql_script = f.read().decode('utf-8')
-            database.executescript(sql_script)
-        database.commit()
-
-
-# Ensure databases are created if they don't exist.
-def ensure_databases(app: Flask) -> None:
-    """Ensures databases are initialized at startup."""
-    if not os.path.exists(USER_DATABASE):
-        print(f"Creating {USER_DATABASE}...")
-        init_database(USER_DATABASE, 'user_schema.sql', app)
-        print(f"✅ {USER_DATABASE} created successfully")
-
-    if not os.path.exists(FILES_DATABASE):
-        print(f"Creating {FILES_DATABASE}...")
-        init_database(FILES_DATABASE, 'files_schema.sql', app)
-        print(f"✅ {FILES_DATABASE} created successfully")
-
-
-# Close database connections at the end of request context.
+# Return database connections to the pool at the end of request context.
 
 
 def close_databases(error) -> None:
-    """Close all database connections when the request context ends."""
-    user_db = getattr(g, '_db_' + USER_DATABASE, None)
-    if user_db is not None:
-        user_db.close()
-
-    files_db = getattr(g, '_db_' + FILES_DATABASE, None)
-    if files_db is not None:
-        files_db.close()
+    """Release all database connections when the request context ends."""
+    for db_name in (USER_DATABASE, FILES_DATABASE):
+        database = g.pop('_db_' + db_name, None)
+        if database is not None:
+            get_pool(db_name).release(database)
 
 
 # Add data to specified table in the database.
 
 
-def add_data(db_name: str, table: str, data: dict) -> None:
+def add_data(db_name: str, table: str, data: dict,
+             conflict_columns: tuple[str, ...] | None = None,
+             update_columns: tuple[str, ...] = ()) -> bool:
     """Add data to specified table in the database.
 
-    Works with or without Flask application context.
-    """
-    try:
-        # Try to use Flask's g object first (request context)
-        database = get_database(db_name)
-        should_close = False
-    except RuntimeError:
-        # Fallback for outside of Flask context (e.g., Discord bot thread)
-        database = sqlite3.connect(db_name)
-        database.row_factory = sqlite3.Row
-        should_close = True
+    Works with or without Flask application context: the pool hands back the
+    request's connection inside Flask and a pooled one in the Discord bot thread.
 
+    With `conflict_columns` (matching a unique index) the insert is an upsert:
+    a row that already exists is left alone, or has `update_columns` overwritten.
+    Returns True if a row was inserted or updated.
+    """
     try:
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join('?' * len(data))
-        sql = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
-        database.execute(sql, tuple(data.values()))
-        database.commit()
+        with get_pool(db_name).connection() as database:
+            columns = ', '.join(data.keys())
+            placeholders = ', '.join('?' * len(data))
+            sql = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
+            if conflict_columns:
+                sql += f' ON CONFLICT ({", ".join(conflict_columns)}) '
+                if update_columns:
+                    sql += 'DO UPDATE SET ' + ', '.join(f'{column} = excluded.{column}'
+                                                         for column in update_columns)
+                else:
+                    sql += 'DO NOTHING'
+            cursor = database.execute(sql, tuple(data.values()))
+            database.commit()
+            return cursor.rowcount > 0
     finally:
-        # Only close if we created the connection outside Flask context
-        if should_close:
-            database.close()
-
         # Log the information and success
         log_db_entry(data=data)
 
 
-# Download file from URL to destination path.
+# Download file from URL into the content-addressed store.
 
 
-def download_file(url: str, dest_path: str) -> bool:
+def download_file(url: str) -> tuple[str, str, int] | None:
+    """Stream a URL to a temp file, hashing it on the way.
+
+    Returns (temp_path, sha256, size), or None if the download failed.
+    """
+    temp_path = new_temp_path()
     try:
         response = requests.get(url, stream=True)
         if response.status_code == 200:
-            with open(dest_path, 'wb') as f:
+            with open(temp_path, 'wb') as f:
+                writer = HashingWriter(f)
                 for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return True
-        return False
+                    writer.write(chunk)
+            return temp_path, writer.sha256, writer.size
+        discard_temp(temp_path)
+        return None
     except Exception as e:
         print(f"Error downloading file from {url}: {e}")
-        return False
+        discard_temp(temp_path)
+        return None
+
+
+# Save the metadata of an already downloaded file to the database.
+
+
+def save_downloaded_file(data: dict, temp_path: str, sha256: str, size: int) -> None:
+    """Move the download into the blob store and queue its record for the files table."""
+    # Update the file_path to the blob path before saving to DB
+    data["file_path"] = store_blob(temp_path, sha256)
+    data["content_hash"] = sha256
+    data["file_size"] = size
+    print(f"Downloaded file to {data['file_path']}")
+
+    # Thumbnail rendered in the preview process pool while the record is queued
+    queue_preview(data["file_path"], sha256, data.get("file_type"), data.get("file_name"))
+
+    # Save to database (batched by the write-behind ingestion queue)
+    get_file_ingest_queue().submit(data)
+
 
 # Add data from Discord message to the database.
 
 
 def add_data_from_discord(data: dict) -> None:
-    # Define downloads folder
-    downloads_folder = 'downloads'
-    if not os.path.exists(downloads_folder):
-        os.makedirs(downloads_folder)
-
+    """Download a Discord attachment and save it (blocking, for non-async callers)."""
     # Get the discord download link n data
     download_link = data.get("file_path")
-    file_name = data.get("file_name")
-
-    # Get local path
-    local_path = os.path.join(downloads_folder, file_name)
 
-    # Download the file + save the file metadata to the database along with the file path
-    if download_file(download_link, local_path):
-        # Update the file_path to local path before saving to DB
-        data["file_path"] = local_path
-        print(f"Downloaded file to {local_path}")
-
-        # Save to database
-        add_file_data(data)
+    # Download the file + save the file metadata to the database along with the blob path
+    downloaded = download_file(download_link)
+    if downloaded:
+        save_downloaded_file(data, *downloaded)
     else:
         print(f"Failed to download file from {download_link}")
 
@@ -163,7 +178,227 @@ def add_user_data(data: dict) -> None:
 
 
 def add_file_data(data: dict) -> None:
-    add_data(FILES_DATABASE, 'files', data)
+    if add_data(FILES_DATABASE, 'files', data, conflict_columns=FILE_UNIQUE_COLUMNS):
+        file_facets.record_insert(data.get('department'), data.get('file_type'))
+
+
+# Check whether an attachment has already been stored (uses the unique index).
+
+
+def file_record_exists(message_id: str | None, file_name: str) -> bool:
+    if message_id is None:
+        return False
+    with get_pool(FILES_DATABASE).connection() as database:
+        return database.execute(
+            'SELECT 1 FROM files WHERE message_id = ? AND file_name = ?', (message_id, file_name)
+        ).fetchone() is not None
+
+
+# Insert a batch of collected file records in one statement.
+
+
+def insert_file_batch(database: sqlite3.Connection, records: list[dict]) -> list[dict]:
+    """Insert file records, skipping any (message_id, file_name) already stored.
+
+    Retried batches and replayed gateway events may contain rows that were
+    committed before; the unique index turns those into no-ops, so ingestion
+    stays at-least-once without duplicating rows. Returns the records that
+    were skipped.
+    """
+    # Register the blobs first so the ref_count triggers on files have a row to update
+    database.executemany(
+        'INSERT OR IGNORE INTO blobs (sha256, size) VALUES (?, ?)',
+        [(record['content_hash'], record.get('file_size', 0))
+         for record in records if record.get('content_hash')]
+    )
+
+    columns = ', '.join(FILE_RECORD_COLUMNS)
+    placeholders = ', '.join('?' * len(FILE_RECORD_COLUMNS))
+    sql = (f'INSERT INTO files ({columns}) VALUES ({placeholders}) '
+           f'ON CONFLICT ({", ".join(FILE_UNIQUE_COLUMNS)}) DO NOTHING')
+    # One statement per row (still one transaction) so each skipped record is known
+    skipped = []
+    for record in records:
+        cursor = database.execute(sql, tuple(record.get(column) for column in FILE_RECORD_COLUMNS))
+        if not cursor.rowcount:
+            skipped.append(record)
+    return skipped
+
+
+# Log every record of a batch and update the facets once it has been committed.
+
+
+def on_file_batch_flushed(records: list[dict], skipped: list[dict]) -> None:
+    for record in records:
+        log_db_entry(data=record)
+
+    skipped_ids = {id(record) for record in skipped}
+    for record in records:
+        if id(record) not in skipped_ids:
+            file_facets.record_insert(record.get('department'), record.get('file_type'))
+
+    if skipped:
+        # Imported here: ingest_policy reads its usage through this module
+        from ingest_policy import refund_quota
+        for record in skipped:
+            # Already stored, so its bytes were counted before this download was charged
+            refund_quota(record)
+        # Blobs downloaded only for skipped duplicates are referenced by nothing
+        for content_hash in {record.get('content_hash') for record in skipped} - {None}:
+            release_blob(content_hash)
+
+
+# Insert a batch of collected links, one row per URL plus a sighting counter.
+
+
+def insert_link_batch(database: sqlite3.Connection, messages: list[dict]) -> None:
+    """Insert new links and bump seen_count for every sighting.
+
+    Each queued record is one message with all of its links, so a batch never
+    splits a message. Sightings of the same URL within the batch are folded
+    together first, so a link posted 500 times costs one row and a counter
+    update. Messages already recorded in link_messages are skipped, so
+    replaying a message (e.g. a second /backfill over the same history)
+    doesn't count it twice.
+    """
+    records = []
+    for message in messages:
+        if message.get('message_id') is not None:
+            cursor = database.execute(
+                'INSERT OR IGNORE INTO link_messages (message_id) VALUES (?)', (message['message_id'],)
+            )
+            if not cursor.rowcount:
+                continue
+        records.extend(message['links'])
+
+    sightings: dict[str, list] = {}
+    for record in records:
+        url_hash = hashlib.sha256(record['url'].encode('utf-8')).hexdigest()
+        if url_hash in sightings:
+            sightings[url_hash][0] += 1
+            sightings[url_hash][2] = max(sightings[url_hash][2], record.get('timestamp') or '')
+        else:
+            sightings[url_hash] = [1, record, record.get('timestamp') or '']
+
+    database.executemany(
+        'INSERT OR IGNORE INTO links (url_hash, url, kind, user, user_id, group_name, '
+        'message_id, channel_id, timestamp, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [(url_hash, record['url'], record.get('kind'), record.get('user'), record.get('user_id'),
+          record.get('group_name'), record.get('message_id'), record.get('channel_id'),
+          record.get('timestamp'), record.get('timestamp'))
+         for url_hash, (_, record, _) in sightings.items()]
+    )
+    database.executemany(
+        'UPDATE links SET seen_count = seen_count + ?, last_seen = max(COALESCE(last_seen, \'\'), ?) '
+        'WHERE url_hash = ?',
+        [(count, last_seen, url_hash) for url_hash, (count, _, last_seen) in sightings.items()]
+    )
+
+
+# Queue links from a Discord message for the links table.
+
+
+def add_links_from_discord(records: list[dict]) -> None:
+    # One queue entry per message: its links are counted (or skipped as a replay) together
+    if records:
+        get_link_ingest_queue().submit({'message_id': records[0].get('message_id'), 'links': records})
+
+
+_ingest_queues: dict[str, WriteBehindQueue] = {}
+_ingest_queues_lock = threading.Lock()
+
+# Read when metrics are collected; only queues this process has started show up
+INGEST_QUEUE_DEPTH = Gauge(
+    'ingest_queue_depth', 'Records waiting to be written to the files database', ('queue',),
+    function=lambda: {(name,): queue.depth for name, queue in list(_ingest_queues.items())})
+
+
+def _get_ingest_queue(name: str, write_batch, on_flushed=None) -> WriteBehindQueue:
+    queue = _ingest_queues.get(name)
+    if queue is None:
+        with _ingest_queues_lock:
+            queue = _ingest_queues.get(name)
+            if queue is None:
+                queue = WriteBehindQueue(
+                    name, FILES_DATABASE, write_batch,
+                    on_flushed=on_flushed,
+                    batch_size=INGEST_BATCH_SIZE,
+                    flush_interval=INGEST_FLUSH_INTERVAL,
+                    max_pending=INGEST_MAX_PENDING
+                )
+                _ingest_queues[name] = queue
+    return queue
+
+
+# Get the shared write-behind queue for collected files.
+
+
+def get_file_ingest_queue() -> WriteBehindQueue:
+    """Get (or lazily start) the write-behind queue feeding the files table."""
+    return _get_ingest_queue('file-ingest', insert_file_batch, on_file_batch_flushed)
+
+
+# Get the shared write-behind queue for collected links.
+
+
+def get_link_ingest_queue() -> WriteBehindQueue:
+    """Get (or lazily start) the write-behind queue feeding the links table."""
+    return _get_ingest_queue('link-ingest', insert_link_batch)
+
+
+# Message ids already collected (have a file row or had their links recorded).
+
+
+# Keep well under SQLite's bound-parameter limit
+KNOWN_MESSAGE_CHUNK = 400
+
+
+def find_known_message_ids(message_ids: list[str]) -> set[str]:
+    """Return the subset of message_ids that already appear in files or link_messages."""
+    known = set()
+    with get_pool(FILES_DATABASE).connection() as database:
+        for start in range(0, len(message_ids), KNOWN_MESSAGE_CHUNK):
+            chunk = message_ids[start:start + KNOWN_MESSAGE_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor = database.execute(
+                f'SELECT message_id FROM files WHERE message_id IN ({placeholders}) '
+                f'UNION SELECT message_id FROM link_messages WHERE message_id IN ({placeholders})',
+                chunk + chunk
+            )
+            known.update(row[0] for row in cursor)
+    return known
+
+
+# Drop a blob once the last file referencing it has been deleted.
+
+
+def release_blob(sha256: str) -> bool:
+    """Delete an unreferenced blob row and its file; returns True if it was removed.
+
+    A blob stored or reused within the grace period is kept, since a download
+    of the same content may have a files row for it still in the write-behind
+    queue; the storage GC removes it later if nothing claims it.
+    """
+    with get_pool(FILES_DATABASE).connection() as database:
+        # IMMEDIATE holds off ingestion between the ref_count check and the delete
+        database.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = database.execute(
+                'DELETE FROM blobs WHERE sha256 = ? AND ref_count <= 0', (sha256,)
+            )
+            if cursor.rowcount and is_recent(blob_path(sha256)):
+                database.rollback()
+                return False
+            database.commit()
+        except Exception:
+            database.rollback()
+            raise
+
+    # Unlinked only after the commit, so a failed delete never leaves a row without its file
+    if cursor.rowcount and remove_blob(sha256):
+        discard_preview(sha256)
+        return True
+    return False
 
 
 # Retrieve user data by user ID.
@@ -171,37 +406,290 @@ def add_file_data(data: dict) -> None:
 
 def get_user_by_id(user_id: int) -> dict | None:
     """Retrieve user data by user ID."""
-    try:
-        # Try to use Flask's g object first (request context)
-        database = get_database(USER_DATABASE)
-        should_close = False
-    except RuntimeError:
-        # Fallback for outside of Flask context (e.g., Discord bot thread)
-        database = sqlite3.connect(USER_DATABASE)
-        database.row_factory = sqlite3.Row
-        should_close = True
-
-    try:
+    with get_pool(USER_DATABASE).connection() as database:
         sql = 'SELECT * FROM users WHERE id = ?'
         cursor = database.execute(sql, (user_id,))
         row = cursor.fetchone()
         return dict(row) if row else None
-    finally:
-        # Only close if we created the connection outside Flask context
-        if should_close:
-            database.close()
+
+
+# Turn a free-text search box value into an FTS5 prefix query.
+
+
+def build_fts_query(search_query: str) -> str:
+    """Build an FTS5 MATCH expression where every word must prefix-match.
+
+    Each word is quoted so user input can't inject FTS5 syntax; returns an
+    empty string when there is nothing to search for.
+    """
+    terms = []
+    for word in search_query.split():
+        word = word.replace('"', '""')
+        if any(ch.isalnum() for ch in word):
+            terms.append(f'"{word}"*')
+    return ' '.join(terms)
+
+
+#      -----      {{{     FACET CACHE     }}}      -----      #
+
+# Seconds before cached facets are reloaded from the database
+FACET_CACHE_TTL = float(os.getenv("FACET_CACHE_TTL", "300"))
+
+
+class FacetCache:
+    """In-memory department and file type counts for the /files filters.
+
+    Department counts come from the trigger-maintained file_stats_department
+    table and file types from a GROUP BY; both are then kept current by the
+    insert / update / delete hooks so the dropdowns don't query on every request.
+    The TTL bounds drift from writes made by other processes.
+    """
+
+    def __init__(self, ttl: float = FACET_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._department_counts: dict[str, int] | None = None
+        self._file_type_counts: dict[str, int] = {}
+        self._loaded_at = 0.0
+
+    # ---------- loading ----------
+
+    def _load(self) -> None:
+        with get_pool(FILES_DATABASE).connection() as database:
+            department_counts = dict(database.execute(
+                'SELECT department, file_count FROM file_stats_department'
+            ).fetchall())
+            file_type_counts = dict(database.execute(
+                'SELECT file_type, COUNT(*) FROM files GROUP BY file_type'
+            ).fetchall())
+
+        self._department_counts = department_counts
+        self._file_type_counts = file_type_counts
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self) -> None:
+        if self._department_counts is None or time.monotonic() - self._loaded_at > self.ttl:
+            self._load()
+
+    def refresh(self) -> None:
+        """Reload all facets from the database now."""
+        with self._lock:
+            self._load()
+
+    def invalidate(self) -> None:
+        """Drop the cached facets; the next read reloads them."""
+        with self._lock:
+            self._department_counts = None
+
+    # ---------- reads ----------
+
+    def departments(self) -> list[str]:
+        """Sorted non-empty departments that still have files."""
+        with self._lock:
+            self._ensure_loaded()
+            return sorted(dept for dept, count in self._department_counts.items()
+                          if dept and count > 0)
+
+    def department_counts(self) -> dict[str, int]:
+        with self._lock:
+            self._ensure_loaded()
+            return {dept: count for dept, count in self._department_counts.items() if count > 0}
+
+    def file_type_counts(self) -> dict[str, int]:
+        with self._lock:
+            self._ensure_loaded()
+            return {file_type: count for file_type, count in self._file_type_counts.items()
+                    if count > 0}
+
+    # ---------- incremental updates ----------
+
+    def _adjust(self, department: str | None, file_type: str | None, delta: int) -> None:
+        # Nothing to adjust until the facets are loaded; the first read loads fresh counts
+        if self._department_counts is None:
+            return
+        self._department_counts[department] = self._department_counts.get(department, 0) + delta
+        self._file_type_counts[file_type] = self._file_type_counts.get(file_type, 0) + delta
+
+    def record_insert(self, department: str | None, file_type: str | None) -> None:
+        with self._lock:
+            self._adjust(department, file_type, 1)
+
+    def record_delete(self, department: str | None, file_type: str | None) -> None:
+        with self._lock:
+            self._adjust(department, file_type, -1)
+
+    def record_update(self, old_department: str | None, old_file_type: str | None,
+                      new_department: str | None, new_file_type: str | None) -> None:
+        with self._lock:
+            self._adjust(old_department, old_file_type, -1)
+            self._adjust(new_department, new_file_type, 1)
+
+
+file_facets = FacetCache()
+
+
+#      -----      {{{     DASHBOARD STATS     }}}      -----      #
+
+# Number of months shown in the dashboard's files-per-month chart
+DASHBOARD_MONTHS = 6
+
+
+def _recent_months(count: int) -> list[str]:
+    """'YYYY-MM' keys of the last `count` months, oldest first."""
+    year, month = map(int, time.strftime('%Y %m', time.gmtime()).split())
+    months = []
+    for _ in range(count):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return months[::-1]
+
+
+# Read the dashboard numbers from the trigger-maintained stats tables.
+def get_dashboard_stats(months: int = DASHBOARD_MONTHS) -> dict:
+    """Counts per role, per department and per month without scanning users or files.
+
+    Returns a dict with users_by_role, files_by_department, total_users,
+    total_files and files_by_month ([(month, new files, running total)]).
+    """
+    with get_pool(USER_DATABASE).connection() as database:
+        users_by_role = dict(database.execute(
+            'SELECT user_role, user_count FROM user_stats_role'
+        ).fetchall())
+
+    with get_pool(FILES_DATABASE).connection() as database:
+        files_by_department = dict(database.execute(
+            'SELECT department, file_count FROM file_stats_department ORDER BY file_count DESC'
+        ).fetchall())
+        month_counts = dict(database.execute(
+            'SELECT month, file_count FROM file_stats_month'
+        ).fetchall())
+
+    total_files = sum(files_by_department.values())
+    recent = _recent_months(months)
+
+    # Running total at the end of each month: everything up to and including it
+    running_total = total_files - sum(count for month, count in month_counts.items()
+                                       if month > recent[-1] and month != 'unknown')
+    files_by_month = []
+    for month in reversed(recent):
+        files_by_month.append((month, month_counts.get(month, 0), running_total))
+        running_total -= month_counts.get(month, 0)
+
+    return {
+        "users_by_role": users_by_role,
+        "total_users": sum(users_by_role.values()),
+        "files_by_department": files_by_department,
+        "total_files": total_files,
+        "files_by_month": files_by_month[::-1],
+    }
+
+
+#      -----      {{{     FILE LISTING     }}}      -----      #
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+# Encode the (time_stamp, id) of the last row shown into a page cursor.
+
+
+def encode_page_cursor(time_stamp: str, file_id: int) -> str:
+    return f"{time_stamp}|{file_id}"
+
+
+# Decode a page cursor back into (time_stamp, id).
+
+
+def decode_page_cursor(cursor: str) -> tuple[str, int]:
+    """Split a page cursor, raising ValueError if it was tampered with."""
+    time_stamp, _, file_id = cursor.rpartition('|')
+    if not time_stamp:
+        raise ValueError(f"Invalid page cursor: {cursor!r}")
+    return time_stamp, int(file_id)
+
+
+class FilePage:
+    """One page of files, built lazily from an open cursor while the template renders.
+
+    The cursor uses File.row_factory, so rows arrive as File objects.
+
+    `count` and `next_cursor` are filled in as the rows are consumed, so they
+    can be read after the template's loop over the page.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor, page_size: int):
+        self._cursor = cursor
+        self.page_size = page_size
+        self.count = 0
+        self.next_cursor = None
+
+    def __iter__(self):
+        last_file = None
+        try:
+            # The query fetches one extra row to know whether a next page exists
+            for file in self._cursor:
+                if self.count == self.page_size:
+                    self.next_cursor = encode_page_cursor(last_file.time_stamp, last_file.id)
+                    break
+                self.count += 1
+                last_file = file
+                yield file
+        finally:
+            self._cursor.close()
+
+
+# Retrieve one keyset-paginated page of files for the /files page.
+
+
+def get_files_page(department: str | None, search_query: str, after: str | None,
+                   page_size: int = DEFAULT_PAGE_SIZE) -> FilePage:
+    """Query a page of files, newest first, starting after the given cursor.
+
+    Pages are keyed on (time_stamp, id) rather than OFFSET, so every page is
+    an index range scan no matter how deep the user pages.
+    """
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+    query = f'SELECT {File.SELECT_COLUMNS} FROM files'
+    conditions = []
+    params = []
+
+    # Full-text search goes through the files_fts index instead of LIKE '%q%'
+    fts_query = build_fts_query(search_query)
+    if fts_query:
+        query += ' JOIN files_fts ON files_fts.rowid = files.id'
+        conditions.append('files_fts MATCH ?')
+        params.append(fts_query)
+
+    if department and department != 'all':
+        # When searching, the unary + stops SQLite from walking the whole department
+        # through its index and probing files_fts per row; the FTS match drives instead
+        conditions.append('+files.department = ?' if fts_query else 'files.department = ?')
+        params.append(department)
+
+    if after:
+        conditions.append('(files.time_stamp, files.id) < (?, ?)')
+        params.extend(decode_page_cursor(after))
+
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+
+    query += ' ORDER BY files.time_stamp DESC, files.id DESC LIMIT ?'
+    params.append(page_size + 1)
+
+    cursor = get_database(FILES_DATABASE).cursor()
+    cursor.row_factory = File.row_factory
+    return FilePage(cursor.execute(query, tuple(params)), page_size)
 
 
 # Retrieve files by department
 def get_files_by_department(department_name: str) -> list[File]:
-    db = get_database(FILES_DATABASE)
-    cursor = db.execute(
-        'SELECT * FROM files WHERE department = ? ORDER BY time_stamp DESC',
+    cursor = get_database(FILES_DATABASE).cursor()
+    cursor.row_factory = File.row_factory
+    return cursor.execute(
+        f'SELECT {File.SELECT_COLUMNS} FROM files WHERE department = ? ORDER BY time_stamp DESC',
         (department_name,)
     ).fetchall()
 
-    return [File.from_row(row) for row in cursor]
-
 
 # Check file exists by file name
 def check_file_exists(filename: str) -> bool:
@@ -212,15 +700,37 @@ def check_file_exists(filename: str) -> bool:
 
 
 def get_file_download(filename: str) -> Response:
-    # Check if file exists
-    if not check_file_exists(filename=filename):
+    # Newest file with this name; stored content lives in the blob store
+    db = get_database(FILES_DATABASE)
+    file_data = db.execute(
+        'SELECT content_hash, file_path, time_stamp, channel_id, message_id FROM files WHERE file_name = ? '
+        'ORDER BY time_stamp DESC, id DESC LIMIT 1',
+        (filename,)
+    ).fetchone()
+
+    # Kept as metadata only by the ingest policy: the file is still on Discord,
+    # behind a signed link that expires after about a day
+    if file_data and not file_data['content_hash'] and (file_data['file_path'] or '').startswith(('http://', 'https://')):
+        return redirect(fresh_attachment_url(file_data['file_path'], file_data['channel_id'],
+                                             file_data['message_id'], filename))
+
+    if file_data and file_data['content_hash']:
+        relative_path = os.path.join('blobs', blob_relative_path(file_data['content_hash']))
+        time_stamp = file_data['time_stamp']
+        content_hash = file_data['content_hash']
+    else:
+        # Files saved before content-addressed storage are still under downloads/<name>
+        relative_path = filename
+        time_stamp = file_data['time_stamp'] if file_data else None
+        content_hash = None
+
+    # safe_join refuses names that would escape the downloads folder
+    path = safe_join(UPLOAD_DIRECTORY, relative_path)
+    if path is None or not os.path.isfile(path):
         return Response("File not found.", status=404)
 
-    return send_from_directory(
-        UPLOAD_DIRECTORY,
-        filename,
-        as_attachment=True
-    )
+    return serve_stored_file(path, filename, content_hash=content_hash,
+                             time_stamp=time_stamp, accel_path=relative_path)
 
 
 '''
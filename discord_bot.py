@@ -0,0 +1,91 @@
+"""
+The Discord collector bot.
+
+Kept apart from the Flask app (app.py) so the web tier never needs a bot
+token or builds a bot. bot_runner.py runs it as its own process; in
+development `python app.py` runs it in a thread next to Flask.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import asyncio
+import threading
+from dotenv import load_dotenv
+
+import discord
+from discord.ext import commands
+
+from cogs.bot_events import setup_bot_events
+from metrics import monitor_event_loop_lag
+
+# Load environment variables
+load_dotenv()
+
+# Discord bot configuration
+DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+COMMAND_PREFIX = os.getenv("COMMAND_PREFIX", "!")
+
+if not DISCORD_TOKEN:
+    raise RuntimeError("DISCORD_TOKEN is not set in .env")
+
+
+#      -----      {{{     SET UP     }}}      -----      #
+
+intents = discord.Intents.default()
+intents.message_content = True
+intents.guilds = True
+intents.guild_messages = True
+intents.members = True
+
+# bot instance
+bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents)
+
+# Setup bot events and global commands
+setup_bot_events(bot)
+
+
+#      -----      {{{     RUN BOT     }}}      -----      #
+
+# Global event loop for the bot
+bot_loop = None
+
+
+async def run_bot():
+    """Run the Discord bot."""
+    async with bot:
+        # Reports how long handlers block the loop (discord_event_loop_lag_seconds)
+        lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+
+        # Load Cog FIRST so the sync in bot_events picks it up
+        try:
+            await bot.load_extension("cogs.collector_cog")
+            print("Loaded collector_cog.")
+        except Exception as e:
+            print(f"Failed to load collector_cog: {e}")
+
+        # This starts the connection; on_ready will handle the tree sync
+        try:
+            await bot.start(DISCORD_TOKEN)
+        finally:
+            lag_monitor.cancel()
+
+
+def start_bot_thread():
+    """Start the Discord bot in a background thread."""
+    global bot_loop
+
+    def run_async_loop():
+        global bot_loop
+        bot_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(bot_loop)
+        try:
+            bot_loop.run_until_complete(run_bot())
+        except Exception as e:
+            print(f"Bot error: {e}")
+        finally:
+            bot_loop.close()
+
+    bot_thread = threading.Thread(target=run_async_loop, daemon=True)
+    bot_thread.start()
+    print("Discord bot thread initialized.")
@@ -0,0 +1,103 @@
+"""
+Fresh links for attachments that were kept as metadata only.
+
+Discord CDN attachment URLs are signed and expire after about a day (the
+`ex` query parameter is the expiry as a hex unix time), so the URL saved
+with a metadata-only files row stops working. When one is requested after
+it has expired, the message is fetched again through the Discord REST API
+(with the bot token) and the attachment's current URL is used instead.
+Fresh URLs are cached until they expire in turn.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import time
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+#      -----      {{{     CDN CONSTANTS     }}}      -----      #
+
+DISCORD_API_BASE = "https://discord.com/api/v10"
+
+# Bot token for the REST lookups; without it stored links are used as they are
+DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+
+# Seconds allowed for one REST lookup
+DISCORD_API_TIMEOUT = float(os.getenv("DISCORD_API_TIMEOUT", "10"))
+
+# A URL this close to its expiry is refreshed already
+EXPIRY_MARGIN_SECONDS = 300
+
+# Max fresh URLs kept in memory
+FRESH_URL_CACHE_SIZE = 1024
+
+
+#      -----      {{{     EXPIRY     }}}      -----      #
+
+# Get the unix time a signed CDN URL expires at (None if it carries no expiry).
+def url_expires_at(url: str) -> float | None:
+    try:
+        return float(int(parse_qs(urlsplit(url).query)['ex'][0], 16))
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+# Check whether a URL has expired (or is about to).
+def is_expired(url: str) -> bool:
+    expires_at = url_expires_at(url)
+    return expires_at is not None and expires_at - EXPIRY_MARGIN_SECONDS < time.time()
+
+
+#      -----      {{{     REFRESH     }}}      -----      #
+
+_fresh_urls: dict[tuple, str] = {}
+_fresh_urls_lock = threading.Lock()
+
+
+def _fetch_attachment_url(channel_id: str, message_id: str, file_name: str) -> str | None:
+    response = requests.get(f"{DISCORD_API_BASE}/channels/{channel_id}/messages/{message_id}",
+                            headers={"Authorization": f"Bot {DISCORD_TOKEN}"}, timeout=DISCORD_API_TIMEOUT)
+    if response.status_code != 200:
+        print(f"Could not refresh the link of {file_name}: Discord answered {response.status_code}")
+        return None
+    for attachment in response.json().get("attachments", []):
+        if attachment.get("filename") == file_name:
+            return attachment.get("url")
+    return None
+
+
+def fresh_attachment_url(url: str, channel_id: str | None, message_id: str | None, file_name: str) -> str:
+    """A working URL for a metadata-only attachment: the stored one while it is valid, else a fresh one.
+
+    Falls back to the stored URL when there is no bot token, the message is
+    gone, or Discord can't be reached.
+    """
+    if not is_expired(url) or not (DISCORD_TOKEN and channel_id and message_id):
+        return url
+
+    key = (channel_id, message_id, file_name)
+    with _fresh_urls_lock:
+        cached = _fresh_urls.get(key)
+    if cached and not is_expired(cached):
+        return cached
+
+    try:
+        fresh = _fetch_attachment_url(channel_id, message_id, file_name)
+    except (requests.RequestException, ValueError) as e:
+        print(f"Could not refresh the link of {file_name}: {e}")
+        fresh = None
+    if not fresh:
+        return url
+
+    with _fresh_urls_lock:
+        if len(_fresh_urls) >= FRESH_URL_CACHE_SIZE:
+            _fresh_urls.clear()
+        _fresh_urls[key] = fresh
+    return fresh
@@ -0,0 +1,306 @@
+"""
+Asynchronous download stage for Discord attachments.
+
+Attachments are queued by the collector and downloaded by a fixed pool of
+worker tasks on the bot's event loop, so a large file never blocks gateway
+events. Each download is hashed while it streams to a temp file, then moved
+into the blob store and saved to the database from a thread.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Callable
+
+import aiohttp
+from dotenv import load_dotenv
+
+from database_helpers import save_downloaded_file, get_file_ingest_queue, file_record_exists
+from blob_store import HashingWriter, new_temp_path, discard_temp
+from metrics import Counter, Gauge, Histogram
+
+load_dotenv()
+
+
+#      -----      {{{     PIPELINE CONSTANTS     }}}      -----      #
+
+# Max number of attachments being downloaded at the same time
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "4"))
+
+# Max number of simultaneous connections to a single host (e.g. cdn.discordapp.com)
+DOWNLOAD_PER_HOST_LIMIT = int(os.getenv("DOWNLOAD_PER_HOST_LIMIT", "2"))
+
+# Max number of attachments waiting to be downloaded before enqueue() waits
+DOWNLOAD_QUEUE_SIZE = int(os.getenv("DOWNLOAD_QUEUE_SIZE", "100"))
+
+# Total seconds allowed for a single download
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "300"))
+
+# Number of recently queued (message_id, file_name) keys remembered to drop replays
+DOWNLOAD_RECENT_KEYS = int(os.getenv("DOWNLOAD_RECENT_KEYS", "10000"))
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Bytes collected from the network before each write to disk (done in a thread)
+DOWNLOAD_WRITE_SIZE = 1024 * 1024
+
+
+#      -----      {{{     METRICS     }}}      -----      #
+
+DOWNLOAD_BYTES = Counter('discord_download_bytes_total', 'Attachment bytes downloaded')
+DOWNLOAD_SECONDS = Histogram(
+    'discord_download_duration_seconds', 'Time to download one attachment', ('result',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+DOWNLOADS = Counter('discord_downloads_total', 'Attachments handled by the download workers', ('result',))
+DOWNLOAD_QUEUE_DEPTH = Gauge('discord_download_queue_depth', 'Attachments waiting to be downloaded')
+DOWNLOADS_IN_FLIGHT = Gauge('discord_downloads_in_flight', 'Attachments being downloaded')
+
+
+#      -----      {{{     DOWNLOAD BATCHES     }}}      -----      #
+
+class DownloadBatch:
+    """Attachments queued by one caller (e.g. a /backfill run), tracked apart from live traffic."""
+
+    def __init__(self):
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.bytes_downloaded = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def _added(self) -> None:
+        self.pending += 1
+        self._idle.clear()
+
+    def _finished(self) -> None:
+        self.pending -= 1
+        if not self.pending:
+            self._idle.set()
+
+    # wait until every attachment of this batch has been handled
+    async def wait(self) -> None:
+        await self._idle.wait()
+
+
+#      -----      {{{     RECENT KEYS     }}}      -----      #
+
+class RecentKeys:
+    """Bounded LRU set of attachment keys that were queued recently.
+
+    Gateway reconnects replay the last messages, so an exact in-memory check
+    catches almost every duplicate before any network or database I/O. Older
+    keys fall out and are caught by the indexed lookup in the worker instead.
+    """
+
+    def __init__(self, max_size: int = DOWNLOAD_RECENT_KEYS):
+        self.max_size = max(1, max_size)
+        self._keys: OrderedDict[tuple, None] = OrderedDict()
+
+    def add(self, key: tuple) -> bool:
+        """Remember key; returns False if it was already present."""
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return False
+        self._keys[key] = None
+        if len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
+        return True
+
+    def discard(self, key: tuple) -> None:
+        self._keys.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+#      -----      {{{     DOWNLOAD PIPELINE     }}}      -----      #
+
+class DownloadPipeline:
+    """Bounded queue of attachment records drained by concurrent download workers."""
+
+    def __init__(self,
+                 concurrency: int = DOWNLOAD_CONCURRENCY,
+                 per_host_limit: int = DOWNLOAD_PER_HOST_LIMIT,
+                 queue_size: int = DOWNLOAD_QUEUE_SIZE,
+                 on_not_stored: Callable[[dict], None] | None = None):
+        self.concurrency = max(1, concurrency)
+        self.per_host_limit = max(1, per_host_limit)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.in_flight: int = 0
+        self.completed: int = 0
+        self.failed: int = 0
+        self.bytes_downloaded: int = 0
+        self.skipped: int = 0
+        self.recent = RecentKeys()
+        # Called with each record that ends up not stored (failed, or already stored before)
+        self.on_not_stored = on_not_stored
+        self._session: aiohttp.ClientSession | None = None
+        self._workers: list[asyncio.Task] = []
+
+    # ---------- lifecycle ----------
+
+    # start the HTTP session and the worker tasks (must run on the bot loop)
+    async def start(self) -> None:
+        if self._workers:
+            return
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency,
+                                         limit_per_host=self.per_host_limit)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)
+        )
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"download-worker-{i}")
+            for i in range(self.concurrency)
+        ]
+        DOWNLOAD_QUEUE_DEPTH.set_function(self.queue.qsize)
+        DOWNLOADS_IN_FLIGHT.set_function(lambda: self.in_flight)
+
+    # wait for queued downloads to finish, then stop the workers
+    async def stop(self, drain_timeout: float = 30.0) -> None:
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"Download queue not drained, {self.queue.qsize()} attachment(s) dropped")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+        # Write out any downloaded files still buffered for the database
+        await asyncio.to_thread(get_file_ingest_queue().flush)
+
+    # ---------- queue ----------
+
+    # queue a file record for download (waits only while the queue is full);
+    # returns False if the same attachment was queued recently
+    async def enqueue(self, record: dict, batch: DownloadBatch | None = None) -> bool:
+        if not self.recent.add(_record_key(record)):
+            self.skipped += 1
+            return False
+        if batch is not None:
+            batch._added()
+        await self.queue.put((record, batch))
+        return True
+
+    # wait until every queued attachment has been downloaded
+    async def wait_idle(self) -> None:
+        await self.queue.join()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+    def stats(self) -> dict:
+        """Snapshot of the pipeline counters."""
+        return {
+            "queue_depth": self.queue_depth,
+            "queue_size": self.queue.maxsize,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "bytes_downloaded": self.bytes_downloaded,
+            "ingest_pending": get_file_ingest_queue().depth,
+        }
+
+    # ---------- workers ----------
+
+    async def _worker(self) -> None:
+        while True:
+            record, batch = await self.queue.get()
+            self.in_flight += 1
+            result = False
+            try:
+                result = await self._process(record, batch)
+                if result is None:
+                    self.skipped += 1
+                    DOWNLOADS.inc(1, 'skipped')
+                elif result:
+                    self.completed += 1
+                    DOWNLOADS.inc(1, 'stored')
+                else:
+                    self.failed += 1
+                    DOWNLOADS.inc(1, 'failed')
+            except Exception as e:
+                self.failed += 1
+                DOWNLOADS.inc(1, 'failed')
+                print(f"Error saving file to database: {e}")
+            finally:
+                self.in_flight -= 1
+                if not result and self.on_not_stored is not None:
+                    self.on_not_stored(record)
+                if batch is not None:
+                    if result:
+                        batch.completed += 1
+                    elif result is not None:
+                        batch.failed += 1
+                    batch._finished()
+                self.queue.task_done()
+
+    # download one attachment and save its metadata off the event loop
+    # (returns None when it was already stored)
+    async def _process(self, record: dict, batch: DownloadBatch | None = None) -> bool | None:
+        download_link = record.get("file_path")
+
+        # Already stored by an earlier run: skip the download entirely
+        if await asyncio.to_thread(file_record_exists, record.get("message_id"), record.get("file_name")):
+            return None
+
+        started = time.perf_counter()
+        downloaded = await self._fetch(download_link)
+        DOWNLOAD_SECONDS.observe(time.perf_counter() - started, 'failed' if downloaded is None else 'ok')
+        if downloaded is None:
+            print(f"Failed to download file from {download_link}")
+            # Let a replay of the message try again
+            self.recent.discard(_record_key(record))
+            return False
+
+        self.bytes_downloaded += downloaded[2]
+        if batch is not None:
+            batch.bytes_downloaded += downloaded[2]
+        DOWNLOAD_BYTES.inc(downloaded[2])
+        await asyncio.to_thread(save_downloaded_file, record, *downloaded)
+        return True
+
+    # stream the URL to a temp file in chunks, hashing as it goes; the file I/O
+    # and hashing run in a thread, in DOWNLOAD_WRITE_SIZE pieces
+    async def _fetch(self, url: str) -> tuple[str, str, int] | None:
+        temp_path = new_temp_path()
+        try:
+            async with self._session.get(url) as response:
+                if response.status != 200:
+                    await asyncio.to_thread(discard_temp, temp_path)
+                    return None
+                f = await asyncio.to_thread(open, temp_path, 'wb')
+                try:
+                    writer = HashingWriter(f)
+                    buffer = bytearray()
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        buffer += chunk
+                        if len(buffer) >= DOWNLOAD_WRITE_SIZE:
+                            await asyncio.to_thread(writer.write, bytes(buffer))
+                            buffer.clear()
+                    if buffer:
+                        await asyncio.to_thread(writer.write, bytes(buffer))
+                finally:
+                    await asyncio.to_thread(f.close)
+            return temp_path, writer.sha256, writer.size
+        except Exception as e:
+            print(f"Error downloading file from {url}: {e}")
+            await asyncio.to_thread(discard_temp, temp_path)
+            return None
+
+
+def _record_key(record: dict) -> tuple:
+    return record.get("message_id"), record.get("file_name")
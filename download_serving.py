@@ -0,0 +1,207 @@
+"""
+HTTP serving of stored files for /download/<filename>.
+
+Adds strong ETags from the stored content hash, conditional GET
+(If-None-Match / If-Modified-Since), single and multi-range responses,
+and an optional mode where a fronting proxy (nginx X-Accel-Redirect or
+Apache/lighttpd X-Sendfile) pushes the bytes instead of a Flask worker.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import uuid
+import mimetypes
+import unicodedata
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+from flask import Response, request
+from werkzeug.http import http_date, parse_range_header, quote_etag, unquote_etag
+
+load_dotenv()
+
+
+#      -----      {{{     SERVING CONSTANTS     }}}      -----      #
+
+# Cache policy for downloads. The same URL can point at newer content later,
+# so clients keep their copy but revalidate it (cheap 304 thanks to the ETag).
+DOWNLOAD_CACHE_CONTROL = os.getenv("DOWNLOAD_CACHE_CONTROL", "private, no-cache")
+
+# '' (Flask sends the bytes), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd)
+DOWNLOAD_ACCEL_MODE = os.getenv("DOWNLOAD_ACCEL_MODE", "").strip().lower()
+
+# nginx `internal` location that maps onto the downloads/ folder, e.g.
+#   location /protected-downloads/ { internal; alias /srv/apex/downloads/; }
+DOWNLOAD_ACCEL_PREFIX = os.getenv("DOWNLOAD_ACCEL_PREFIX", "/protected-downloads/")
+
+# More ranges than this in one request are answered with the whole file
+MAX_RANGES = 16
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+#      -----      {{{     HEADER HELPERS     }}}      -----      #
+
+def _content_disposition(response: Response, download_name: str) -> None:
+    try:
+        download_name.encode('ascii')
+        options = {'filename': download_name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        options = {'filename': simple,
+                   'filename*': "UTF-8''" + quote(download_name, safe="!#$&+-.^_`|~")}
+    response.headers.set('Content-Disposition', 'attachment', **options)
+
+
+def _to_datetime(time_stamp: str | None, path: str) -> datetime:
+    """Last-Modified from the stored time stamp, falling back to the file's mtime."""
+    if time_stamp:
+        try:
+            modified = datetime.fromisoformat(str(time_stamp).replace('Z', '+00:00'))
+            return (modified if modified.tzinfo else modified.replace(tzinfo=timezone.utc)).replace(microsecond=0)
+        except ValueError:
+            pass
+    return datetime.fromtimestamp(int(os.path.getmtime(path)), tz=timezone.utc)
+
+
+def _is_not_modified(etag: str, last_modified: datetime) -> bool:
+    # If-None-Match wins over If-Modified-Since when both are sent (RFC 9110 13.2.2)
+    if request.headers.get('If-None-Match'):
+        return request.if_none_match.star_tag or request.if_none_match.contains_weak(unquote_etag(etag)[0])
+
+    if_modified_since = request.if_modified_since
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def _if_range_allows(etag: str, last_modified: datetime) -> bool:
+    """A Range is honoured only if If-Range (when sent) still matches the file."""
+    if 'If-Range' not in request.headers:
+        return True
+    if_range = request.if_range
+    if if_range.etag is not None:
+        # If-Range requires a strong comparison, so weak ETags never match
+        value, weak = unquote_etag(etag)
+        return not weak and if_range.etag == value
+    return if_range.date is not None and last_modified <= if_range.date
+
+
+def _satisfiable_ranges(size: int) -> list[tuple[int, int]] | None:
+    """Byte ranges from the Range header as (start, stop) with stop exclusive.
+
+    Returns None when there is no usable Range header and [] when none of the
+    requested ranges overlaps the file (416).
+    """
+    parsed = parse_range_header(request.headers.get('Range'))
+    if parsed is None or parsed.units != 'bytes' or len(parsed.ranges) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for start, stop in parsed.ranges:
+        if start < 0:
+            # Suffix range: the last -start bytes
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+
+def _read_ranges(path: str, ranges: list[tuple[int, int]], parts: list[bytes] | None = None):
+    """Yield the bytes of each range, preceded by its multipart header if given."""
+    with open(path, 'rb') as f:
+        for index, (start, stop) in enumerate(ranges):
+            if parts is not None:
+                yield parts[index]
+            f.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        if parts is not None:
+            yield parts[-1]
+
+
+#      -----      {{{     SERVE FILE     }}}      -----      #
+
+def serve_stored_file(path: str, download_name: str, content_hash: str | None = None,
+                      time_stamp: str | None = None, accel_path: str | None = None) -> Response:
+    """Serve a stored file as a download with caching, conditional and range support.
+
+    `content_hash` gives a strong ETag; files without one get a weak ETag from
+    their mtime and size. `accel_path` is the path relative to downloads/ that
+    the proxy should serve when DOWNLOAD_ACCEL_MODE is set.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    if content_hash:
+        etag = quote_etag(content_hash)
+    else:
+        etag = quote_etag(f"{int(stat.st_mtime)}-{size}", weak=True)
+    last_modified = _to_datetime(time_stamp, path)
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+    def with_validators(response: Response) -> Response:
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        response.headers['Cache-Control'] = DOWNLOAD_CACHE_CONTROL
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+    if _is_not_modified(etag, last_modified):
+        return with_validators(Response(status=304))
+
+    # Let the fronting proxy stream the file (it handles Range itself)
+    if DOWNLOAD_ACCEL_MODE and accel_path:
+        response = Response(mimetype=mimetype)
+        if DOWNLOAD_ACCEL_MODE == 'x-accel-redirect':
+            internal_path = quote(accel_path.replace(os.sep, '/'))
+            response.headers['X-Accel-Redirect'] = DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + internal_path
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+        _content_disposition(response, download_name)
+        return with_validators(response)
+
+    ranges = None
+    if request.method == 'GET' and _if_range_allows(etag, last_modified):
+        ranges = _satisfiable_ranges(size)
+
+    if ranges == []:
+        response = Response(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return with_validators(response)
+
+    if not ranges:
+        response = Response(_read_ranges(path, [(0, size)]), mimetype=mimetype,
+                            direct_passthrough=True)
+        response.content_length = size
+
+    elif len(ranges) == 1:
+        start, stop = ranges[0]
+        response = Response(_read_ranges(path, ranges), status=206, mimetype=mimetype,
+                            direct_passthrough=True)
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        response.content_length = stop - start
+
+    else:
+        # multipart/byteranges: one part header before each range, closing boundary at the end
+        boundary = uuid.uuid4().hex
+        parts = [
+            (f'\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n'
+             f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('ascii')
+            for start, stop in ranges
+        ]
+        parts.append(f'\r\n--{boundary}--\r\n'.encode('ascii'))
+        response = Response(_read_ranges(path, ranges, parts), status=206,
+                            direct_passthrough=True)
+        response.headers['Content-Type'] = f'multipart/byteranges; boundary={boundary}'
+        response.content_length = (sum(len(part) for part in parts)
+                                   + sum(stop - start for start, stop in ranges))
+
+    _content_disposition(response, download_name)
+    return with_validators(response)
@@ -0,0 +1,268 @@
+"""
+Streaming bulk export of the file catalog, for /export and the command line.
+
+Catalog metadata comes out as CSV or JSON lines, and the stored files
+themselves as a zip bundle. Everything is generated while it is sent: rows
+are read from an open SQLite cursor one at a time and each stored file is
+copied into the zip in fixed-size chunks, so no temporary file is written
+and memory does not grow with the data exported. (A zip still keeps one small
+record per entry for the directory written at its end, about 0.5 KB each.)
+
+    python export.py --format zip --department HR --output hr.zip
+    python export.py --format csv > catalog.csv
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import io
+import os
+import csv
+import sys
+import json
+import logging
+import zipfile
+import argparse
+from datetime import datetime
+from typing import Iterator
+
+from blob_store import stored_file_path
+from connection_pool import get_pool
+from database_helpers import FILES_DATABASE, build_fts_query
+
+
+#      -----      {{{     EXPORT CONSTANTS     }}}      -----      #
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'zip': ('application/zip', 'zip'),
+}
+
+# Catalog columns, in output order
+EXPORT_COLUMNS = ('id', 'file_name', 'file_type', 'file_path', 'time_stamp', 'user', 'group_name',
+                  'department', 'project', 'source', 'user_id', 'message_id', 'channel_id', 'content_hash')
+
+# Rows serialised per yielded chunk of CSV / JSON lines
+EXPORT_BATCH_ROWS = 500
+
+# Bytes copied from a stored file into the zip per write
+ZIP_CHUNK_SIZE = 256 * 1024
+
+# Attachments are mostly compressed already (PDF, Office, images), so the bundle
+# stores them as they are instead of spending CPU on deflate
+ZIP_COMPRESSION = zipfile.ZIP_STORED
+
+
+#      -----      {{{     CATALOG QUERY     }}}      -----      #
+
+def _export_rows(columns: tuple[str, ...], department: str | None, search_query: str,
+                 order_by: str) -> Iterator[tuple]:
+    """Yield the matching files rows as tuples, straight off the database cursor."""
+    query = f"SELECT {', '.join('files.' + column for column in columns)} FROM files"
+    conditions = []
+    params = []
+
+    # Same filters as the /files page, so an export matches what the user was looking at
+    fts_query = build_fts_query(search_query)
+    if fts_query:
+        query += ' JOIN files_fts ON files_fts.rowid = files.id'
+        conditions.append('files_fts MATCH ?')
+        params.append(fts_query)
+
+    if department and department != 'all':
+        conditions.append('+files.department = ?' if fts_query else 'files.department = ?')
+        params.append(department)
+
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += f' ORDER BY {order_by}'
+
+    # A dedicated cursor on a pooled connection: rows are stepped out of SQLite
+    # as the consumer asks for them, never materialised as a list
+    with get_pool(FILES_DATABASE).connection() as database:
+        cursor = database.cursor()
+        cursor.row_factory = None
+        try:
+            yield from cursor.execute(query, tuple(params))
+        finally:
+            cursor.close()
+
+
+def export_filename(export_format: str, department: str | None) -> str:
+    """Download name for an export, e.g. files-HR-20250101-120000.zip."""
+    scope = department if department and department != 'all' else 'all'
+    scope = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in scope)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    return f"files-{scope}-{stamp}.{EXPORT_FORMATS[export_format][1]}"
+
+
+#      -----      {{{     CATALOG FORMATS     }}}      -----      #
+
+def stream_csv(department: str | None = None, search_query: str = '') -> Iterator[bytes]:
+    """Yield the catalog as UTF-8 CSV with a header row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for row in _export_rows(EXPORT_COLUMNS, department, search_query, 'files.id'):
+        writer.writerow(row)
+        pending += 1
+        if pending == EXPORT_BATCH_ROWS:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode('utf-8')
+
+
+def stream_jsonl(department: str | None = None, search_query: str = '') -> Iterator[bytes]:
+    """Yield the catalog as one JSON object per line."""
+    lines = []
+    for row in _export_rows(EXPORT_COLUMNS, department, search_query, 'files.id'):
+        lines.append(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False))
+        if len(lines) == EXPORT_BATCH_ROWS:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines.clear()
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+#      -----      {{{     ZIP BUNDLE     }}}      -----      #
+
+class _ZipSink:
+    """Write-only file object for ZipFile that hands written bytes to the generator.
+
+    It has no tell()/seek(), so ZipFile writes in streaming mode: each entry's
+    CRC and sizes go in a data descriptor after its bytes instead of being
+    patched into the header afterwards.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _archive_name(department: str, file_name: str, file_id: int) -> str:
+    """<department>/<file name>, flattened so entries can't escape their folder."""
+    folder = department.replace('/', '_').replace('\\', '_') or 'unknown'
+    name = os.path.basename(file_name.replace('\\', '/')) or str(file_id)
+    return f"{folder}/{name}"
+
+
+def _with_id(archive_name: str, file_id: int | str) -> str:
+    stem, extension = os.path.splitext(archive_name)
+    return f"{stem} ({file_id}){extension}"
+
+
+def _zip_date_time(time_stamp: str | None) -> tuple:
+    try:
+        modified = datetime.fromisoformat(str(time_stamp))
+    except (TypeError, ValueError):
+        modified = datetime.now()
+    # The zip format cannot date anything before 1980
+    return max(modified.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def stream_zip(department: str | None = None, search_query: str = '') -> Iterator[bytes]:
+    """Yield a zip of the matching stored files, one folder per department.
+
+    Files whose bytes are missing from downloads/ are skipped. Entry names
+    are flattened (see _archive_name), so different rows can end up with the
+    same one; every name used is remembered (the zip keeps an entry per file
+    for its central directory anyway) and a repeat gets the row id added.
+    """
+    sink = _ZipSink()
+    archived = missing = 0
+    columns = ('id', 'file_name', 'file_path', 'department', 'time_stamp', 'content_hash')
+    order_by = 'files.department, files.file_name, files.id'
+
+    with zipfile.ZipFile(sink, mode='w', compression=ZIP_COMPRESSION, allowZip64=True) as bundle:
+        used_names = set()
+        for file_id, file_name, file_path, file_department, time_stamp, content_hash in \
+                _export_rows(columns, department, search_query, order_by):
+            path = stored_file_path(file_name, content_hash, file_path)
+            if path is None:
+                missing += 1
+                continue
+
+            # Repeats of a name get the row id added (the first keeps the plain name),
+            # then a counter in the unlikely case a file is already called that
+            archive_name = _archive_name(file_department, file_name, file_id)
+            unique_name = archive_name
+            if unique_name in used_names:
+                unique_name = _with_id(archive_name, file_id)
+                counter = 2
+                while unique_name in used_names:
+                    unique_name = _with_id(archive_name, f"{file_id}-{counter}")
+                    counter += 1
+            used_names.add(unique_name)
+            info = zipfile.ZipInfo(unique_name, date_time=_zip_date_time(time_stamp))
+            info.compress_type = ZIP_COMPRESSION
+            # The size up front lets ZipFile pick zip64 headers for files over 4 GiB
+            info.file_size = os.path.getsize(path)
+
+            with open(path, 'rb') as source, bundle.open(info, mode='w') as entry:
+                while chunk := source.read(ZIP_CHUNK_SIZE):
+                    entry.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+            archived += 1
+
+    # Closing the ZipFile wrote the central directory
+    yield sink.drain()
+    logging.info(f"Export zip finished: {archived} file(s), {missing} missing on disk",
+                 extra={'fields': {'department': department or 'all', 'search': search_query,
+                                   'archived': archived, 'missing': missing}})
+
+
+EXPORT_STREAMS = {
+    'csv': stream_csv,
+    'jsonl': stream_jsonl,
+    'zip': stream_zip,
+}
+
+
+def stream_export(export_format: str, department: str | None = None,
+                  search_query: str = '') -> Iterator[bytes]:
+    """Yield an export in the given format; raises ValueError for an unknown one."""
+    if export_format not in EXPORT_STREAMS:
+        raise ValueError(f"Unknown export format: {export_format!r}")
+    return EXPORT_STREAMS[export_format](department, search_query)
+
+
+#      -----      {{{     COMMAND LINE     }}}      -----      #
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Export the file catalog or a zip of the stored files.')
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+    parser.add_argument('--department', default=None, help='only files of this department')
+    parser.add_argument('--search', default='', help='only files matching this search (as on /files)')
+    parser.add_argument('--output', default='-', help="file to write, '-' for stdout (default)")
+    args = parser.parse_args()
+
+    output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    try:
+        written = 0
+        for chunk in stream_export(args.format, args.department, args.search):
+            output.write(chunk)
+            written += len(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    if args.output != '-':
+        print(f"Wrote {written} bytes to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
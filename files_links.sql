@@ -0,0 +1,28 @@
+-- files_links.sql
+
+-- Links collected from Discord messages, one row per normalized URL.
+-- Safe to run on new and existing databases (everything is IF NOT EXISTS).
+
+CREATE TABLE IF NOT EXISTS links (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url_hash TEXT NOT NULL UNIQUE,          -- sha256 of the normalized URL
+    url TEXT NOT NULL,
+    kind TEXT NOT NULL,                     -- discord_cdn, github, google_drive, ...
+    user TEXT,                              -- first poster
+    user_id TEXT,
+    group_name TEXT,
+    message_id TEXT,                        -- first message it was seen in
+    channel_id TEXT,
+    timestamp TIMESTAMP,                    -- first time it was posted
+    last_seen TIMESTAMP,
+    seen_count INTEGER NOT NULL DEFAULT 0
+);
+
+-- Per-channel history, newest first
+CREATE INDEX IF NOT EXISTS idx_links_channel_timestamp ON links (channel_id, timestamp);
+
+-- Messages whose links have been counted (makes replays idempotent; backfill
+-- also uses it to skip known messages)
+CREATE TABLE IF NOT EXISTS link_messages (
+    message_id TEXT PRIMARY KEY
+) WITHOUT ROWID;
@@ -0,0 +1,53 @@
+-- files_quota.sql
+
+-- Stored bytes per uploader and per department, for the ingest quotas in
+-- ingest_policy.py. Kept current by triggers on files (sizes come from the
+-- blobs row registered just before each files row), so the bot loads the
+-- totals with one small read instead of summing the files table.
+-- Safe to run on new and existing databases (everything is IF NOT EXISTS);
+-- migration 8 fills the table from the existing rows.
+
+-- scope is 'user' (key = Discord user id) or 'department'
+CREATE TABLE IF NOT EXISTS ingest_usage (
+    scope TEXT NOT NULL,
+    key TEXT NOT NULL,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    file_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, key)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS ingest_usage_insert AFTER INSERT ON files
+WHEN new.content_hash IS NOT NULL BEGIN
+    INSERT INTO ingest_usage (scope, key, bytes, file_count)
+        VALUES ('user', COALESCE(new.user_id, ''),
+                COALESCE((SELECT size FROM blobs WHERE sha256 = new.content_hash), 0), 1)
+        ON CONFLICT (scope, key) DO UPDATE SET bytes = bytes + excluded.bytes, file_count = file_count + 1;
+    INSERT INTO ingest_usage (scope, key, bytes, file_count)
+        VALUES ('department', new.department,
+                COALESCE((SELECT size FROM blobs WHERE sha256 = new.content_hash), 0), 1)
+        ON CONFLICT (scope, key) DO UPDATE SET bytes = bytes + excluded.bytes, file_count = file_count + 1;
+END;
+
+-- Runs before blobs_ref_delete can let release_blob drop the blobs row, since
+-- the row is only deleted after the DELETE on files has committed
+CREATE TRIGGER IF NOT EXISTS ingest_usage_delete AFTER DELETE ON files
+WHEN old.content_hash IS NOT NULL BEGIN
+    UPDATE ingest_usage
+        SET bytes = bytes - COALESCE((SELECT size FROM blobs WHERE sha256 = old.content_hash), 0),
+            file_count = file_count - 1
+        WHERE (scope = 'user' AND key = COALESCE(old.user_id, ''))
+           OR (scope = 'department' AND key = old.department);
+END;
+
+-- An edit that moves a file to another department moves its bytes with it
+CREATE TRIGGER IF NOT EXISTS ingest_usage_update AFTER UPDATE OF department ON files
+WHEN old.content_hash IS NOT NULL AND old.department IS NOT new.department BEGIN
+    UPDATE ingest_usage
+        SET bytes = bytes - COALESCE((SELECT size FROM blobs WHERE sha256 = old.content_hash), 0),
+            file_count = file_count - 1
+        WHERE scope = 'department' AND key = old.department;
+    INSERT INTO ingest_usage (scope, key, bytes, file_count)
+        VALUES ('department', new.department,
+                COALESCE((SELECT size FROM blobs WHERE sha256 = old.content_hash), 0), 1)
+        ON CONFLICT (scope, key) DO UPDATE SET bytes = bytes + excluded.bytes, file_count = file_count + 1;
+END;
@@ -1,7 +1,10 @@
 -- files_schema.sql
 
--- Schema for files table
-DROP TABLE IF EXISTS files;
+-- Base schema for the files table (migration 1 in migrations.py, applied once
+-- to a new database). Indexes and search live in files_search.sql, blob
+-- bookkeeping in files_storage.sql, collected links in files_links.sql,
+-- dashboard aggregates in files_stats.sql and ingest quota usage in
+-- files_quota.sql; later changes are new migrations.
 
 CREATE TABLE files (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -16,7 +19,8 @@ CREATE TABLE files (
     source TEXT NOT NULL,
     user_id TEXT,
     message_id TEXT,
-    channel_id TEXT
+    channel_id TEXT,
+    content_hash TEXT
 );
 
 -- Test data insertions
@@ -0,0 +1,49 @@
+-- files_search.sql
+
+-- Indexes and full-text search for the /files page.
+-- Safe to run on new and existing databases (everything is IF NOT EXISTS).
+
+-- Department filter + newest-first sort (the rowid id is implicitly the last key,
+-- so both indexes also serve the (time_stamp, id) page cursor)
+CREATE INDEX IF NOT EXISTS idx_files_department_time_stamp ON files (department, time_stamp);
+
+-- Newest-first sort when no department is selected
+CREATE INDEX IF NOT EXISTS idx_files_time_stamp ON files (time_stamp);
+
+-- Exact file name lookups (duplicate-name check when editing a file)
+CREATE INDEX IF NOT EXISTS idx_files_file_name ON files (file_name);
+
+-- One row per attachment: replayed messages become no-op inserts. Also serves
+-- known-message lookups (backfill) through its message_id prefix.
+-- Migration 3 removes existing duplicates before this runs.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_files_message_file ON files (message_id, file_name);
+DROP INDEX IF EXISTS idx_files_message_id;
+
+-- Full-text index over the searchable columns (external content: rows live in files)
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+    file_name,
+    project,
+    user,
+    department,
+    content = 'files',
+    content_rowid = 'id',
+    prefix = '2 3'
+);
+
+-- Keep files_fts in sync with files
+CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts (rowid, file_name, project, user, department)
+    VALUES (new.id, new.file_name, new.project, new.user, new.department);
+END;
+
+CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, file_name, project, user, department)
+    VALUES ('delete', old.id, old.file_name, old.project, old.user, old.department);
+END;
+
+CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE OF file_name, project, user, department ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, file_name, project, user, department)
+    VALUES ('delete', old.id, old.file_name, old.project, old.user, old.department);
+    INSERT INTO files_fts (rowid, file_name, project, user, department)
+    VALUES (new.id, new.file_name, new.project, new.user, new.department);
+END;
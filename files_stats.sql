@@ -0,0 +1,44 @@
+-- files_stats.sql
+
+-- Aggregates for the dashboard, kept current by triggers on files so reading
+-- them never scans the files table.
+-- Safe to run on new and existing databases (everything is IF NOT EXISTS);
+-- migration 7 fills the tables from the existing rows.
+
+CREATE TABLE IF NOT EXISTS file_stats_department (
+    department TEXT PRIMARY KEY,
+    file_count INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- month is 'YYYY-MM' of files.time_stamp
+CREATE TABLE IF NOT EXISTS file_stats_month (
+    month TEXT PRIMARY KEY,
+    file_count INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS file_stats_insert AFTER INSERT ON files BEGIN
+    INSERT INTO file_stats_department (department, file_count) VALUES (new.department, 1)
+        ON CONFLICT (department) DO UPDATE SET file_count = file_count + 1;
+    INSERT INTO file_stats_month (month, file_count)
+        VALUES (COALESCE(strftime('%Y-%m', new.time_stamp), 'unknown'), 1)
+        ON CONFLICT (month) DO UPDATE SET file_count = file_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS file_stats_delete AFTER DELETE ON files BEGIN
+    UPDATE file_stats_department SET file_count = file_count - 1 WHERE department = old.department;
+    DELETE FROM file_stats_department WHERE department = old.department AND file_count <= 0;
+    UPDATE file_stats_month SET file_count = file_count - 1
+        WHERE month = COALESCE(strftime('%Y-%m', old.time_stamp), 'unknown');
+END;
+
+CREATE TRIGGER IF NOT EXISTS file_stats_update AFTER UPDATE OF department, time_stamp ON files BEGIN
+    UPDATE file_stats_department SET file_count = file_count - 1 WHERE department = old.department;
+    DELETE FROM file_stats_department WHERE department = old.department AND file_count <= 0;
+    INSERT INTO file_stats_department (department, file_count) VALUES (new.department, 1)
+        ON CONFLICT (department) DO UPDATE SET file_count = file_count + 1;
+    UPDATE file_stats_month SET file_count = file_count - 1
+        WHERE month = COALESCE(strftime('%Y-%m', old.time_stamp), 'unknown');
+    INSERT INTO file_stats_month (month, file_count)
+        VALUES (COALESCE(strftime('%Y-%m', new.time_stamp), 'unknown'), 1)
+        ON CONFLICT (month) DO UPDATE SET file_count = file_count + 1;
+END;
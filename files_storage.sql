@@ -0,0 +1,32 @@
+-- files_storage.sql
+
+-- Content-addressed storage bookkeeping (see blob_store.py).
+-- Safe to run on new and existing databases (everything is IF NOT EXISTS).
+-- Requires files.content_hash (added by migration 2 on old databases).
+
+-- One row per stored blob; ref_count = number of files rows pointing at it
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files (content_hash);
+
+-- Keep blobs.ref_count in step with the files rows that reference each blob
+CREATE TRIGGER IF NOT EXISTS blobs_ref_insert AFTER INSERT ON files
+WHEN new.content_hash IS NOT NULL BEGIN
+    UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = new.content_hash;
+END;
+
+CREATE TRIGGER IF NOT EXISTS blobs_ref_delete AFTER DELETE ON files
+WHEN old.content_hash IS NOT NULL BEGIN
+    UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = old.content_hash;
+END;
+
+CREATE TRIGGER IF NOT EXISTS blobs_ref_update AFTER UPDATE OF content_hash ON files
+WHEN old.content_hash IS NOT new.content_hash BEGIN
+    UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = old.content_hash;
+    UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = new.content_hash;
+END;
@@ -0,0 +1,75 @@
+"""
+gunicorn settings for the web tier:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every value can be overridden from the environment (or .env). With
+RUN_BOT_WITH_WEB=1 the master also starts bot_runner.py as a child process
+and stops it on shutdown, so one command runs the whole app.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import sys
+import subprocess
+import multiprocessing
+
+from dotenv import load_dotenv
+
+from metrics import clear_metrics_directory
+
+load_dotenv()
+
+
+#      -----      {{{     SERVER SETTINGS     }}}      -----      #
+
+bind = f"{os.getenv('WEB_HOST', '0.0.0.0')}:{os.getenv('WEB_PORT', '5000')}"
+
+# Processes serving requests (each has its own DB pool and caches)
+workers = int(os.getenv("WEB_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+
+# Threads per worker; downloads stream for a while, so threads keep a worker responsive
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "4"))
+
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+accesslog = os.getenv("WEB_ACCESS_LOG") or None
+errorlog = "-"
+
+# Start the Discord bot as a sibling process of the workers
+RUN_BOT_WITH_WEB = os.getenv("RUN_BOT_WITH_WEB", "0").strip().lower() in ("1", "true", "yes")
+
+PROJECT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+#      -----      {{{     SERVER HOOKS     }}}      -----      #
+
+def on_starting(server):
+    # Create / migrate the databases once, in a throwaway process, so workers don't
+    # race on a fresh database and the master never holds SQLite connections or
+    # logging threads that forked workers would inherit
+    subprocess.run([sys.executable, "-c", "import wsgi"], cwd=PROJECT_DIRECTORY, check=True)
+
+    # Start the /metrics totals from zero; every process rewrites its own snapshot
+    clear_metrics_directory()
+
+
+def when_ready(server):
+    server.bot_process = None
+    if RUN_BOT_WITH_WEB:
+        server.bot_process = subprocess.Popen([sys.executable, "bot_runner.py"], cwd=PROJECT_DIRECTORY)
+        server.log.info("Started Discord bot process (pid %s)", server.bot_process.pid)
+
+
+def on_exit(server):
+    bot_process = getattr(server, "bot_process", None)
+    if bot_process is not None and bot_process.poll() is None:
+        bot_process.terminate()
+        try:
+            bot_process.wait(timeout=graceful_timeout)
+        except subprocess.TimeoutExpired:
+            bot_process.kill()
@@ -0,0 +1,262 @@
+"""
+Size-aware ingest policy and byte quotas for Discord attachments.
+
+Discord tells us each attachment's size and content type up front, so the
+collector decides before downloading anything:
+
+    download    fetch and store it as usual
+    metadata    save the files row (pointing at the Discord URL) without downloading;
+                the URL expires, so downloads re-resolve it (see discord_cdn.py)
+    skip        ignore the attachment
+
+An attachment is downloaded only if its type is allowed, it is under the
+max size, and neither the uploader nor the department would go over their
+byte quota. Otherwise the rule's action ('metadata' or 'skip') applies.
+
+Limits come from the environment, with optional per-department and
+per-channel rules in INGEST_POLICY_FILE (JSON):
+
+    {
+      "default":     {"max_size_mb": 25, "allowed_types": ["image/*", "application/pdf"]},
+      "departments": {"MARKETING": {"max_size_mb": 200, "allowed_types": null}},
+      "channels":    {"123456789012345678": {"max_size_mb": 0, "action": "skip"}}
+    }
+
+A channel rule wins over its department's, which wins over the default;
+keys left out inherit, max_size_mb 0 means no limit and allowed_types null
+allows everything. Rules are merged once (a channel's onto the rule of the
+message's department, the first time that pair comes up), and quota usage is
+kept in memory (reloaded from the trigger-maintained ingest_usage table),
+so checking an attachment is a few dict lookups and no I/O.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import json
+import time
+import logging
+import mimetypes
+import threading
+
+from dotenv import load_dotenv
+
+from connection_pool import get_pool
+from database_helpers import FILES_DATABASE
+
+load_dotenv()
+
+
+#      -----      {{{     POLICY CONSTANTS     }}}      -----      #
+
+DOWNLOAD = 'download'
+METADATA_ONLY = 'metadata'
+SKIP = 'skip'
+
+# Optional JSON file with per-department / per-channel rules
+INGEST_POLICY_FILE = os.getenv("INGEST_POLICY_FILE", "ingest_policy.json")
+
+# Defaults for every attachment (0 = no limit)
+INGEST_MAX_FILE_MB = float(os.getenv("INGEST_MAX_FILE_MB", "0"))
+INGEST_USER_QUOTA_MB = float(os.getenv("INGEST_USER_QUOTA_MB", "0"))
+INGEST_DEPARTMENT_QUOTA_MB = float(os.getenv("INGEST_DEPARTMENT_QUOTA_MB", "0"))
+
+# Comma-separated MIME types, 'image/*' style wildcards allowed; empty allows all
+INGEST_ALLOWED_TYPES = os.getenv("INGEST_ALLOWED_TYPES", "").strip()
+
+# What happens to an attachment the policy won't download: 'metadata' or 'skip'
+INGEST_REJECT_ACTION = os.getenv("INGEST_REJECT_ACTION", METADATA_ONLY).strip().lower()
+
+# Seconds between reloads of the quota usage from the database
+INGEST_USAGE_REFRESH = float(os.getenv("INGEST_USAGE_REFRESH", "60"))
+
+MB = 1024 * 1024
+
+
+#      -----      {{{     RULES     }}}      -----      #
+
+def _parse_types(types) -> tuple[frozenset, frozenset] | None:
+    """Split MIME types into exact types and wildcard major types; None allows all."""
+    if types is None:
+        return None
+    if isinstance(types, str):
+        types = [t for t in types.split(',')]
+    exact, major = set(), set()
+    for content_type in (t.strip().lower() for t in types):
+        if content_type.endswith('/*'):
+            major.add(content_type[:-2])
+        elif content_type:
+            exact.add(content_type)
+    return frozenset(exact), frozenset(major)
+
+
+class IngestRule:
+    """Max size, allowed types and reject action for one scope (default, department or channel)."""
+
+    def __init__(self, max_bytes: int = 0, allowed_types: tuple[frozenset, frozenset] | None = None,
+                 action: str = METADATA_ONLY):
+        if action not in (METADATA_ONLY, SKIP):
+            raise ValueError(f"Unknown ingest action: {action!r} (use 'metadata' or 'skip')")
+        self.max_bytes = max_bytes
+        self.allowed_types = allowed_types
+        self.action = action
+
+    def merged(self, config: dict) -> 'IngestRule':
+        """This rule with the keys present in a JSON rule overriding it."""
+        return IngestRule(
+            max_bytes=int(float(config['max_size_mb']) * MB) if 'max_size_mb' in config else self.max_bytes,
+            allowed_types=_parse_types(config['allowed_types']) if 'allowed_types' in config else self.allowed_types,
+            action=str(config.get('action', self.action)).lower(),
+        )
+
+    def allows_type(self, content_type: str) -> bool:
+        if self.allowed_types is None:
+            return True
+        exact, major = self.allowed_types
+        return content_type in exact or content_type.partition('/')[0] in major
+
+
+#      -----      {{{     QUOTA USAGE     }}}      -----      #
+
+class QuotaUsage:
+    """Stored bytes per uploader and department, held in memory.
+
+    Admitted downloads are charged right away so a burst can't overshoot a
+    quota while its files are still downloading, and refunded if the
+    download fails or turns out to be stored already. load() replaces the
+    numbers with the database totals (which also picks up deletions);
+    attachments still in the download queue at that moment are missing
+    from them until the next load, so quotas are soft by at most the
+    queue's worth of bytes.
+    """
+
+    def __init__(self):
+        self.users: dict[str, int] = {}
+        self.departments: dict[str, int] = {}
+        self.loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        with get_pool(FILES_DATABASE).connection() as database:
+            rows = database.execute('SELECT scope, key, bytes FROM ingest_usage').fetchall()
+        users, departments = {}, {}
+        for scope, key, used in rows:
+            (users if scope == 'user' else departments)[key] = used
+        with self._lock:
+            self.users, self.departments = users, departments
+            self.loaded_at = time.monotonic()
+
+    def is_stale(self) -> bool:
+        return time.monotonic() - self.loaded_at > INGEST_USAGE_REFRESH
+
+    def charge(self, user_id: str, department: str, size: int) -> None:
+        with self._lock:
+            self.users[user_id] = self.users.get(user_id, 0) + size
+            self.departments[department] = self.departments.get(department, 0) + size
+
+    def refund(self, user_id: str, department: str, size: int) -> None:
+        with self._lock:
+            self.users[user_id] = max(0, self.users.get(user_id, 0) - size)
+            self.departments[department] = max(0, self.departments.get(department, 0) - size)
+
+
+#      -----      {{{     POLICY     }}}      -----      #
+
+class IngestPolicy:
+    """Decides per attachment whether to download it, keep only its metadata, or skip it."""
+
+    def __init__(self, default: IngestRule, departments: dict[str, IngestRule] | None = None,
+                 channels: dict[str, dict] | None = None,
+                 user_quota: int = 0, department_quota: int = 0):
+        self.default = default
+        self.departments = departments or {}
+        # Channel rules stay as their JSON overrides, merged onto the department rule in use
+        self.channels = channels or {}
+        self._channel_rules: dict[tuple[str, str], IngestRule] = {}
+        self.user_quota = user_quota
+        self.department_quota = department_quota
+        self.usage = QuotaUsage()
+        self.decisions = {DOWNLOAD: 0, METADATA_ONLY: 0, SKIP: 0}
+
+    def rule_for(self, channel_id: str, department: str) -> IngestRule:
+        base = self.departments.get(department) or self.default
+        config = self.channels.get(channel_id)
+        if config is None:
+            return base
+        rule = self._channel_rules.get((channel_id, department))
+        if rule is None:
+            rule = self._channel_rules[(channel_id, department)] = base.merged(config)
+        return rule
+
+    def decide(self, channel_id: str, department: str, user_id: str,
+               file_name: str, content_type: str | None, size: int) -> tuple[str, str]:
+        """(action, reason) for one attachment; a 'download' is charged to the quotas."""
+        rule = self.rule_for(channel_id, department)
+        content_type = (content_type or mimetypes.guess_type(file_name)[0] or '').split(';')[0].lower()
+
+        if not rule.allows_type(content_type):
+            reason = f"type {content_type or 'unknown'} not allowed"
+        elif rule.max_bytes and size > rule.max_bytes:
+            reason = f"{size / MB:.1f} MiB over the {rule.max_bytes / MB:.0f} MiB limit"
+        elif self.user_quota and self.usage.users.get(user_id, 0) + size > self.user_quota:
+            reason = "uploader quota full"
+        elif self.department_quota and self.usage.departments.get(department, 0) + size > self.department_quota:
+            reason = f"{department} quota full"
+        else:
+            self.usage.charge(user_id, department, size)
+            self.decisions[DOWNLOAD] += 1
+            return DOWNLOAD, ''
+
+        self.decisions[rule.action] += 1
+        return rule.action, reason
+
+
+def load_policy(path: str = INGEST_POLICY_FILE) -> IngestPolicy:
+    """Build the policy from the environment and the optional JSON rules file."""
+    default = IngestRule(int(INGEST_MAX_FILE_MB * MB),
+                         _parse_types(INGEST_ALLOWED_TYPES) if INGEST_ALLOWED_TYPES else None,
+                         INGEST_REJECT_ACTION)
+    config = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+
+    default = default.merged(config.get('default', {}))
+    # Channel names are stored upper-case as the department, so match them that way
+    departments = {name.upper(): default.merged(rule) for name, rule in config.get('departments', {}).items()}
+    channels = {}
+    for channel_id, rule in config.get('channels', {}).items():
+        # Merged at decide time onto the rule of the message's department;
+        # merging onto the default here only checks the rule is valid
+        default.merged(rule)
+        channels[str(channel_id)] = rule
+
+    return IngestPolicy(
+        default, departments, channels,
+        user_quota=int(float(config.get('user_quota_mb', INGEST_USER_QUOTA_MB)) * MB),
+        department_quota=int(float(config.get('department_quota_mb', INGEST_DEPARTMENT_QUOTA_MB)) * MB),
+    )
+
+
+_policy: IngestPolicy | None = None
+_policy_lock = threading.Lock()
+
+
+# Get (or lazily load) the process-wide ingest policy.
+def get_ingest_policy() -> IngestPolicy:
+    global _policy
+    if _policy is None:
+        with _policy_lock:
+            if _policy is None:
+                policy = load_policy()
+                policy.usage.load()
+                logging.info(f"Ingest policy loaded: {len(policy.departments)} department and "
+                             f"{len(policy.channels)} channel rule(s)")
+                _policy = policy
+    return _policy
+
+
+# Give back the quota charged for a download whose row was not stored (no-op until a policy is loaded).
+def refund_quota(record: dict) -> None:
+    if _policy is not None and record.get('file_size'):
+        _policy.usage.refund(record.get('user_id'), record.get('department'), record['file_size'])
@@ -1,56 +1,184 @@
-import logging
+"""
+Logging setup for the web app and the Discord bot.
+
+Records are written as one compact JSON object per line. Loggers only push
+records onto an in-memory queue (QueueHandler); a background QueueListener
+thread formats them and does the file/console I/O, so request handlers and
+the bot's event loop never wait on disk. Log files rotate by size, or by
+time when LOG_ROTATE_WHEN is set.
+
+The web workers and the bot process append to the same files, so only one
+of them may rotate: the bot process (or the single `python app.py`
+process). The others use a WatchedFileHandler, which reopens the file once
+it has been renamed, so no process keeps writing into a rotated backup.
+With LOG_EXTERNAL_ROTATION=1 nobody rotates and logrotate (or similar, with
+the same `<file>.1`, `<file>.2` names and no compression, so /logs can read
+them) takes over, e.g. for a web tier running without the bot.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
 import os
+import json
+import queue
+import atexit
+import logging
+from datetime import datetime
+from logging.handlers import (QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler,
+                              WatchedFileHandler)
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+#      -----      {{{     LOGGING CONSTANTS     }}}      -----      #
+
+LOG_DIRECTORY = os.getenv("LOG_DIRECTORY", "Logs")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Web app / bot activity and the per-file ingestion log
+APP_LOG_FILE = "app_activity.jsonl"
+FILE_OPS_LOG_FILE = "file_operations.jsonl"
+
+# Records the write-behind queues gave up on, kept whole so they can be replayed
+DEAD_LETTER_LOG_FILE = "dead_letters.jsonl"
+
+# Size-based rotation (bytes per file, rotated files kept)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+
+# Time-based rotation instead, e.g. 'midnight' or 'H' (see TimedRotatingFileHandler)
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "").strip()
+
+# Leave rotation to an external tool in every process
+LOG_EXTERNAL_ROTATION = os.getenv("LOG_EXTERNAL_ROTATION", "0").strip().lower() in ("1", "true", "yes")
+
+# Also print app activity to the console
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "1").strip().lower() not in ("0", "false", "no")
+
+# Fields of a file record that go into its ingestion log line
+FILE_LOG_FIELDS = ('file_name', 'file_type', 'file_path', 'user', 'user_id',
+                   'group_name', 'message_id', 'channel_id')
+
+
+#      -----      {{{     JSON FORMATTER     }}}      -----      #
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as a single JSON line.
+
+    Structured values passed as `extra={'fields': {...}}` become top-level keys.
+    """
 
-def setup_logging():
-    log_dir = "Logs"
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+#      -----      {{{     QUEUE HANDLER     }}}      -----      #
+
+class _QueueHandler(QueueHandler):
+    """QueueHandler that skips the copy/format step for plain records.
+
+    Records with no args or exception are already final, so they are queued
+    as they are and the listener thread does all of the formatting.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args or record.exc_info or record.stack_info:
+            return super().prepare(record)
+        return record
+
+
+#      -----      {{{     SETUP     }}}      -----      #
+
+_listeners: list[QueueListener] = []
+
+
+def _file_handler(file_name: str, rotate: bool) -> logging.Handler:
+    path = os.path.join(LOG_DIRECTORY, file_name)
+    if not rotate or LOG_EXTERNAL_ROTATION:
+        # Follows renames by whichever process does rotate
+        handler = WatchedFileHandler(path, encoding="utf-8")
+    elif LOG_ROTATE_WHEN:
+        handler = TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT,
+                                           encoding="utf-8")
+    else:
+        handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                      encoding="utf-8")
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+# Route a logger through a queue to handlers run by a background listener thread.
+def _attach_queue(logger: logging.Logger, *handlers: logging.Handler) -> None:
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(_QueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+
+
+def setup_logging(rotate: bool = True) -> None:
+    """Configure the root and file_ops loggers (safe to call more than once).
+
+    rotate: this process rotates the log files (only one process sharing them may).
+    """
+    if _listeners:
+        return
+    os.makedirs(LOG_DIRECTORY, exist_ok=True)
 
     # 1. Main App Logger
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s %(levelname)s: %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S',
-        handlers=[
-            logging.FileHandler(os.path.join(log_dir, "app_activity.txt")),
-            logging.StreamHandler()
-        ]
-    )
+    app_handlers = [_file_handler(APP_LOG_FILE, rotate)]
+    if LOG_CONSOLE:
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s', '%Y-%m-%d %H:%M:%S'))
+        app_handlers.append(console)
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(LOG_LEVEL)
+    _attach_queue(root_logger, *app_handlers)
 
     # 2. Database Logger
     file_logger = logging.getLogger("file_ops")
     file_logger.setLevel(logging.INFO)
-    file_logger.propagate = False 
+    file_logger.propagate = False
+    _attach_queue(file_logger, _file_handler(FILE_OPS_LOG_FILE, rotate))
+
+    # 3. Dead-letter Logger
+    dead_letter_logger = logging.getLogger("dead_letters")
+    dead_letter_logger.setLevel(logging.INFO)
+    dead_letter_logger.propagate = False
+    _attach_queue(dead_letter_logger, _file_handler(DEAD_LETTER_LOG_FILE, rotate))
 
-    if not file_logger.handlers:
-        fh = logging.FileHandler(os.path.join(log_dir, "file_operations.txt"))
-        fh.setFormatter(logging.Formatter('%(asctime)s | %(message)s', '%Y-%m-%d %H:%M:%S'))
-        file_logger.addHandler(fh)
+    atexit.register(stop_logging)
+
+
+# Write out queued records and stop the listener threads.
+def stop_logging() -> None:
+    while _listeners:
+        _listeners.pop().stop()
 
 
 # Logs data into the files logger (SPECIFICALLY FOR THE DISCORD BOT FILES)
 
 def log_db_entry(data: dict) -> None:
-    db_logger = logging.getLogger("file_ops")
-    
-    # Using a list and join() is often cleaner for multi-line reports
-    report_lines = [
-        f"\n{'__'*45}",
-        "\n"
-
-        f"DATABASE ENTRY LOG",
-        f"{'-'*45}",
-        f"FILE NAME:    {data.get('file_name')}",
-        f"FILE TYPE:    {data.get('file_type')}",
-        f"FILE PATH:    {data.get('file_path')}",
-        f"USER:         {data.get('user')} (ID: {data.get('user_id')})",
-        f"GROUP/DM:     {data.get('group_name')}",
-        f"MESSAGE ID:   {data.get('message_id')}",
-        f"CHANNEL ID:   {data.get('channel_id')}",
-
-        "\n"
-        f"{'- '*45}\n"
-    ]
-    
-    report = "\n".join(report_lines)
-    db_logger.info(report)
\ No newline at end of file
+    fields = {key: data[key] for key in FILE_LOG_FIELDS if data.get(key) is not None}
+    logging.getLogger("file_ops").info("file saved", extra={"fields": fields})
+
+
+# Logs a record a write-behind queue could not write (SPECIFICALLY FOR REPLAYING IT LATER)
+
+def log_dead_letter(queue_name: str, record: dict, error: Exception) -> None:
+    fields = {"queue": queue_name, "error": repr(error), "record": record}
+    logging.getLogger("dead_letters").error("record dropped", extra={"fields": fields})
@@ -0,0 +1,216 @@
+"""
+Paged, filtered reading of the JSON-lines logs for the /logs page.
+
+Pages are read backwards from the end of the file in fixed-size blocks, so
+the newest entries of a multi-GB log come back without reading the rest of
+it. The page cursor is a byte offset (plus the file it belongs to, by inode), so
+"older" links seek straight to where the previous page stopped, and paging
+continues into the rotated backups once the current file is exhausted.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import json
+import logging
+from typing import Iterator
+
+from log_handler import LOG_DIRECTORY, APP_LOG_FILE, FILE_OPS_LOG_FILE, DEAD_LETTER_LOG_FILE
+
+
+#      -----      {{{     VIEWER CONSTANTS     }}}      -----      #
+
+LOG_SOURCES = {
+    'app': APP_LOG_FILE,
+    'files': FILE_OPS_LOG_FILE,
+    'dead_letters': DEAD_LETTER_LOG_FILE,
+}
+
+DEFAULT_LOG_PAGE_SIZE = 100
+MAX_LOG_PAGE_SIZE = 500
+
+READ_BLOCK_SIZE = 64 * 1024
+
+# Max bytes examined per request, so a filter that matches nothing still answers
+# quickly; the page then ends early with a cursor to keep searching from
+MAX_SCAN_BYTES = 16 * 1024 * 1024
+
+
+#      -----      {{{     FILES / CURSORS     }}}      -----      #
+
+def log_files(source: str) -> list[str]:
+    """The source's current file followed by its rotated backups, newest first."""
+    base_name = LOG_SOURCES[source]
+    try:
+        names = [name for name in os.listdir(LOG_DIRECTORY)
+                 if name == base_name or name.startswith(base_name + '.')]
+    except FileNotFoundError:
+        return []
+    paths = [os.path.join(LOG_DIRECTORY, name) for name in names]
+    return sorted(paths, key=lambda path: (os.path.basename(path) != base_name, -os.path.getmtime(path)))
+
+
+def encode_log_cursor(path: str, offset: int) -> str:
+    # The inode identifies the file: rotation renames it, so the name alone goes stale
+    return f"{os.path.basename(path)}:{os.stat(path).st_ino}:{offset}"
+
+
+def decode_log_cursor(cursor: str, paths: list[str]) -> tuple[int, int]:
+    """Turn a cursor into (index into paths, byte offset); raises ValueError if malformed or stale.
+
+    The file is found by inode, so a cursor keeps pointing at the same bytes
+    after rotation has renamed its file to the next backup name.
+    """
+    parts = cursor.rsplit(':', 2)
+    if len(parts) != 3:
+        raise ValueError(f"Malformed log cursor: {cursor!r}")
+    name, inode, offset = parts[0], int(parts[1]), int(parts[2])
+    for index, path in enumerate(paths):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if stat.st_ino == inode:
+            if offset > stat.st_size:
+                # Same file but truncated (copy-truncate rotation): the offset means nothing now
+                raise ValueError(f"Log file in cursor was truncated: {name!r}")
+            return index, offset
+    # Rotated past the last backup since the cursor was made
+    raise ValueError(f"Log file in cursor no longer exists: {name!r}")
+
+
+#      -----      {{{     BACKWARD READER     }}}      -----      #
+
+def read_lines_backwards(path: str, end: int | None = None) -> Iterator[tuple[int, bytes]]:
+    """Yield (start offset, line) pairs from `end` (default EOF) back to the start of the file.
+
+    A final line without its newline is still being written and is skipped.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        position = size if end is None else min(end, size)
+        remainder = b''
+        skip_partial = end is None or end >= size
+
+        while position > 0:
+            read_size = min(READ_BLOCK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            lines = block.split(b'\n')
+            # The first piece may continue in the previous block
+            remainder = lines.pop(0)
+
+            line_end = position + len(block)
+            for line in reversed(lines):
+                line_start = line_end - len(line)
+                if skip_partial:
+                    # Text after the last newline has no terminator yet
+                    skip_partial = False
+                    if line:
+                        line_end = line_start - 1
+                        continue
+                if line:
+                    yield line_start, line
+                line_end = line_start - 1
+
+        if remainder:
+            yield 0, remainder
+
+
+#      -----      {{{     FILTERING     }}}      -----      #
+
+class LogFilter:
+    """Minimum level plus exact user / channel matches over parsed log entries."""
+
+    def __init__(self, level: str = '', user: str = '', channel: str = ''):
+        self.min_level = logging.getLevelName(level.upper()) if level else 0
+        if not isinstance(self.min_level, int):
+            raise ValueError(f"Unknown log level: {level!r}")
+        self.user = user
+        self.channel = channel
+        # Cheap byte check that rules most lines out before parsing them
+        self._needles = [value.encode('utf-8') for value in (user, channel) if value]
+
+    @property
+    def active(self) -> bool:
+        return bool(self.min_level or self.user or self.channel)
+
+    def might_match(self, line: bytes) -> bool:
+        return all(needle in line for needle in self._needles)
+
+    def matches(self, entry: dict) -> bool:
+        if self.min_level:
+            level = logging.getLevelName(entry.get('level') or 'NOTSET')
+            if not isinstance(level, int) or level < self.min_level:
+                return False
+        if self.user and self.user not in (entry.get('user'), entry.get('user_id')):
+            return False
+        if self.channel and self.channel not in (entry.get('channel_id'), entry.get('group_name')):
+            return False
+        return True
+
+
+def parse_log_line(line: bytes) -> dict | None:
+    """Parse one JSON log line; older plain-text lines come back as just a message."""
+    text = line.decode('utf-8', errors='replace')
+    try:
+        entry = json.loads(text)
+    except ValueError:
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+#      -----      {{{     LOG PAGE     }}}      -----      #
+
+class LogPage:
+    """One page of log entries, newest first."""
+
+    def __init__(self, entries: list[dict], next_cursor: str | None, scanned: int, truncated: bool):
+        self.entries = entries
+        self.next_cursor = next_cursor
+        self.scanned = scanned
+        # True when the scan budget ran out before the page filled up
+        self.truncated = truncated
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def get_log_page(source: str, log_filter: LogFilter, before: str | None = None,
+                 page_size: int = DEFAULT_LOG_PAGE_SIZE) -> LogPage:
+    """Read up to page_size matching entries older than the `before` cursor.
+
+    Raises KeyError for an unknown source and ValueError for a bad cursor.
+    """
+    page_size = max(1, min(page_size, MAX_LOG_PAGE_SIZE))
+    paths = log_files(source)
+    file_index, end = decode_log_cursor(before, paths) if before else (0, None)
+
+    entries = []
+    scanned = 0
+    for index in range(file_index, len(paths)):
+        path = paths[index]
+        for offset, line in read_lines_backwards(path, end if index == file_index else None):
+            scanned += len(line) + 1
+            if scanned > MAX_SCAN_BYTES:
+                return LogPage(entries, encode_log_cursor(path, offset + len(line) + 1), scanned, True)
+
+            if log_filter.active and not log_filter.might_match(line):
+                continue
+            entry = parse_log_line(line)
+            if entry is None:
+                if log_filter.active:
+                    continue
+                entry = {'msg': line.decode('utf-8', errors='replace')}
+            elif not log_filter.matches(entry):
+                continue
+
+            entries.append(entry)
+            if len(entries) == page_size:
+                return LogPage(entries, encode_log_cursor(path, offset), scanned, False)
+
+    return LogPage(entries, None, scanned, False)
@@ -0,0 +1,368 @@
+"""
+In-process metrics with a Prometheus text endpoint (/metrics).
+
+Counters, gauges and histograms are plain dicts behind a lock, cheap enough
+for the hot paths and safe to update from the Flask threads, the bot's
+event loop and the worker threads alike. Metrics are declared next to the
+code they measure:
+
+    DOWNLOAD_BYTES = Counter('discord_download_bytes_total', 'Bytes downloaded')
+    DOWNLOAD_BYTES.inc(size)
+
+In production the web workers and the bot are separate processes, so each
+one writes a snapshot of its metrics to METRICS_DIRECTORY every few seconds
+and /metrics adds them up: counters and histograms across every snapshot,
+gauges only across processes that are still writing. gunicorn clears the
+folder on start; processes started on their own drop only the snapshots
+of processes that have stopped.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import hmac
+import json
+import math
+import time
+import atexit
+import bisect
+import asyncio
+import logging
+import threading
+
+from dotenv import load_dotenv
+from flask import Flask, g, request
+
+load_dotenv()
+
+
+#      -----      {{{     METRICS CONSTANTS     }}}      -----      #
+
+# Where each process leaves its snapshot (empty = this process only)
+METRICS_DIRECTORY = os.getenv("METRICS_DIRECTORY", "metrics_snapshots")
+
+# Seconds between snapshots; a process silent for 3 intervals no longer counts for gauges
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+# Bearer token required for /metrics; without one only local scrapers are allowed
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "").strip()
+
+# Seconds between event loop lag probes
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+# Headers a reverse proxy adds to the requests it passes on
+FORWARDED_HEADERS = ('Forwarded', 'X-Forwarded-For', 'X-Real-IP')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+#      -----      {{{     METRIC TYPES     }}}      -----      #
+
+class MetricsRegistry:
+    """Every metric declared in this process, by name."""
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: 'Metric') -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def snapshot(self) -> dict:
+        """JSON-ready values of every metric."""
+        return {name: {
+            'kind': metric.kind,
+            'help': metric.documentation,
+            'labels': list(metric.label_names),
+            'buckets': list(getattr(metric, 'buckets', ())),
+            'samples': [[list(key), value] for key, value in metric.samples().items()],
+        } for name, metric in self._metrics.items()}
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Metric:
+    """Values keyed by a tuple of label values, given positionally after the value."""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 registry: MetricsRegistry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: dict[tuple, float | list] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def samples(self) -> dict[tuple, float | list]:
+        with self._lock:
+            return {key: list(value) if isinstance(value, list) else value
+                    for key, value in self._values.items()}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down; set directly or read from a function at collection time."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), function=None,
+                 registry: MetricsRegistry = REGISTRY):
+        super().__init__(name, documentation, labels, registry)
+        self._function = function
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    # function returns a number, or {label tuple: number} for a labelled gauge
+    def set_function(self, function) -> None:
+        self._function = function
+
+    def samples(self) -> dict[tuple, float | list]:
+        if self._function is None:
+            return super().samples()
+        try:
+            value = self._function()
+        except Exception as e:
+            logging.warning(f"Metric {self.name} could not be read: {e}")
+            return {}
+        return value if isinstance(value, dict) else {(): value}
+
+
+class Histogram(Metric):
+    """Observations counted into buckets (upper bounds, inclusive) plus their sum."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS, registry: MetricsRegistry = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels, registry)
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # One count per bucket, one for +Inf, then the sum
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+
+#      -----      {{{     SHARED METRICS     }}}      -----      #
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time to produce a response (until headers for streamed ones)',
+    ('endpoint', 'method', 'status'))
+
+EVENT_LOOP_LAG = Gauge('discord_event_loop_lag_seconds', 'Latest delay of the bot event loop')
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    'discord_event_loop_lag_distribution_seconds', 'Delays of the bot event loop',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+
+#      -----      {{{     SNAPSHOTS     }}}      -----      #
+
+_writer: threading.Thread | None = None
+_writer_lock = threading.Lock()
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_DIRECTORY, f"{pid}.json")
+
+
+def write_snapshot() -> None:
+    """Write this process's metrics for the other processes' /metrics."""
+    os.makedirs(METRICS_DIRECTORY, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'time': time.time(), 'metrics': REGISTRY.snapshot()}, f)
+    # Atomic, so a scrape never reads half a file
+    os.replace(path + '.tmp', path)
+
+
+def _write_periodically() -> None:
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            write_snapshot()
+        except OSError as e:
+            logging.warning(f"Could not write metrics snapshot: {e}")
+
+
+def start_metrics_writer() -> None:
+    """Start sharing this process's metrics (once per process; no-op without METRICS_DIRECTORY)."""
+    global _writer
+    if not METRICS_DIRECTORY:
+        return
+    with _writer_lock:
+        if _writer is not None:
+            return
+        _writer = threading.Thread(target=_write_periodically, name='metrics-writer', daemon=True)
+        _writer.start()
+    # A process that exits keeps its final counts in the totals
+    atexit.register(write_snapshot)
+
+
+def _is_alive(snapshot_time: float) -> bool:
+    # A running process rewrites its snapshot every METRICS_FLUSH_SECONDS
+    return time.time() - snapshot_time <= METRICS_FLUSH_SECONDS * 3
+
+
+def clear_metrics_directory(stale_only: bool = False) -> None:
+    """Drop the snapshots of a previous run.
+
+    The gunicorn master clears everything before its workers start. A
+    process started on its own (python app.py / wsgi.py / bot_runner.py)
+    passes stale_only, dropping just the snapshots no running process
+    writes any more, so a sibling process that is already up keeps its counts.
+    """
+    if not METRICS_DIRECTORY or not os.path.isdir(METRICS_DIRECTORY):
+        return
+    for entry in os.scandir(METRICS_DIRECTORY):
+        if not entry.name.endswith(('.json', '.tmp')):
+            continue
+        try:
+            if stale_only and _is_alive(entry.stat().st_mtime):
+                continue
+            os.remove(entry.path)
+        except FileNotFoundError:
+            # Replaced or removed meanwhile
+            continue
+
+
+def _other_snapshots() -> list[dict]:
+    snapshots = []
+    if not METRICS_DIRECTORY or not os.path.isdir(METRICS_DIRECTORY):
+        return snapshots
+    own = os.path.basename(_snapshot_path(os.getpid()))
+    for entry in os.scandir(METRICS_DIRECTORY):
+        if not entry.name.endswith('.json') or entry.name == own:
+            continue
+        try:
+            with open(entry.path, encoding='utf-8') as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            # Removed meanwhile
+            continue
+    return snapshots
+
+
+#      -----      {{{     EXPOSITION     }}}      -----      #
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs: list[tuple[str, str]]) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _merge(snapshots: list[dict]) -> dict:
+    merged = {}
+    for snapshot in snapshots:
+        alive = _is_alive(snapshot.get('time', 0))
+        for name, metric in snapshot['metrics'].items():
+            if metric['kind'] == 'gauge' and not alive:
+                continue
+            samples = merged.setdefault(name, {**metric, 'samples': {}})['samples']
+            for labels, value in metric['samples']:
+                key = tuple(labels)
+                previous = samples.get(key)
+                if previous is None:
+                    samples[key] = value
+                elif isinstance(value, list):
+                    samples[key] = [a + b for a, b in zip(previous, value)]
+                else:
+                    samples[key] = previous + value
+    return merged
+
+
+def render_metrics() -> str:
+    """Every process's metrics in the Prometheus text format."""
+    own = {'time': time.time(), 'metrics': REGISTRY.snapshot()}
+    lines = []
+    for name, metric in sorted(_merge([own] + _other_snapshots()).items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for key, value in sorted(metric['samples'].items()):
+            labels = list(zip(metric['labels'], key))
+            if metric['kind'] != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric['buckets'] + [math.inf], value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_request_allowed() -> bool:
+    """Scrapers need the bearer token, or without one, to be on this machine.
+
+    Behind a reverse proxy on the same host every request comes from
+    127.0.0.1, so a request the proxy forwarded (it adds one of
+    FORWARDED_HEADERS) never counts as local; set METRICS_TOKEN to scrape
+    through the proxy.
+    """
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}")
+    if any(header in request.headers for header in FORWARDED_HEADERS):
+        return False
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+#      -----      {{{     INSTRUMENTATION     }}}      -----      #
+
+def instrument_app(app: Flask) -> None:
+    """Time every request by endpoint; register before other hooks so redirects are timed too."""
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_time(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.endpoint or 'unmatched',
+                                         request.method, str(response.status_code))
+        return response
+
+    start_metrics_writer()
+
+
+async def monitor_event_loop_lag(interval: float = METRICS_LOOP_LAG_INTERVAL) -> None:
+    """Measure how late the loop wakes a sleeping task (anything blocking it shows up here)."""
+    start_metrics_writer()
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_SECONDS.observe(lag)
@@ -0,0 +1,211 @@
+"""
+Versioned schema migrations for the users and files databases.
+
+Each database records the migrations it has applied in a `schema_version`
+table. `migrate_databases()` runs once at startup (app.py, wsgi.py,
+bot_runner.py) and applies whatever is missing, each migration in its own
+transaction, so request handlers never check or change the schema.
+
+To change the schema, append a Migration with the next version number; never
+edit one that has shipped. Databases created before versioning existed are
+recognised by their tables and stamped at version 1 (the base schema), after
+which the remaining migrations, all written to be safe on such databases,
+bring them up to date.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import time
+import sqlite3
+import logging
+from typing import Callable
+
+from connection_pool import get_pool
+from database_helpers import USER_DATABASE, FILES_DATABASE
+
+SCHEMA_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+#      -----      {{{     MIGRATION     }}}      -----      #
+
+class Migration:
+    """One schema change: a SQL script and/or a Python step, plus optional follow-up SQL."""
+
+    def __init__(self, version: int, name: str, script: str | None = None,
+                 apply: Callable[[sqlite3.Connection], None] | None = None, sql: str = ''):
+        self.version = version
+        self.name = name
+        self.script = script
+        self.apply = apply
+        self.sql = sql
+
+    def statements(self) -> list[str]:
+        text = ''
+        if self.script:
+            with open(os.path.join(SCHEMA_DIRECTORY, self.script), encoding='utf-8') as f:
+                text = f.read()
+        return _split_statements(text + '\n' + self.sql)
+
+
+# Split a SQL script into statements (trigger bodies keep their inner semicolons).
+def _split_statements(script: str) -> list[str]:
+    statements = []
+    buffer = ''
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statement = buffer.strip()
+            if any(not part.strip().startswith('--') for part in statement.splitlines() if part.strip()):
+                statements.append(statement)
+            buffer = ''
+    return statements
+
+
+def _has_table(database: sqlite3.Connection, name: str) -> bool:
+    return database.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+#      -----      {{{     FILES MIGRATIONS     }}}      -----      #
+
+# Databases created before content-addressed storage lack the hash column
+def _add_content_hash(database: sqlite3.Connection) -> None:
+    columns = [row[1] for row in database.execute('PRAGMA table_info(files)')]
+    if 'content_hash' not in columns:
+        database.execute('ALTER TABLE files ADD COLUMN content_hash TEXT')
+
+
+# Replayed gateway events left duplicate rows behind; drop them (oldest row wins)
+# before the unique (message_id, file_name) index is created
+def _remove_duplicate_files(database: sqlite3.Connection) -> None:
+    cursor = database.execute(
+        'DELETE FROM files WHERE message_id IS NOT NULL AND id NOT IN '
+        '(SELECT min(id) FROM files WHERE message_id IS NOT NULL GROUP BY message_id, file_name)'
+    )
+    if cursor.rowcount:
+        print(f"Removed {cursor.rowcount} duplicate file row(s)")
+
+
+FILES_MIGRATIONS = [
+    Migration(1, 'base schema', script='files_schema.sql'),
+    Migration(2, 'content hash column', apply=_add_content_hash),
+    Migration(3, 'remove duplicate attachments', apply=_remove_duplicate_files),
+    # Rows inserted before the sync triggers existed are indexed by the rebuild
+    Migration(4, 'indexes and full-text search', script='files_search.sql',
+              sql="INSERT INTO files_fts (files_fts) VALUES ('rebuild');"),
+    Migration(5, 'blob storage', script='files_storage.sql'),
+    Migration(6, 'links', script='files_links.sql'),
+    # Rows inserted before the stats triggers existed are counted here
+    Migration(7, 'dashboard stats', script='files_stats.sql', sql="""
+        DELETE FROM file_stats_department;
+        DELETE FROM file_stats_month;
+        INSERT INTO file_stats_department (department, file_count)
+            SELECT department, COUNT(*) FROM files GROUP BY department;
+        INSERT INTO file_stats_month (month, file_count)
+            SELECT COALESCE(strftime('%Y-%m', time_stamp), 'unknown'), COUNT(*) FROM files GROUP BY 1;
+    """),
+    # Files stored before the usage triggers existed are counted here
+    Migration(8, 'ingest quotas', script='files_quota.sql', sql="""
+        DELETE FROM ingest_usage;
+        INSERT INTO ingest_usage (scope, key, bytes, file_count)
+            SELECT 'user', COALESCE(files.user_id, ''), SUM(blobs.size), COUNT(*)
+            FROM files JOIN blobs ON blobs.sha256 = files.content_hash GROUP BY 2;
+        INSERT INTO ingest_usage (scope, key, bytes, file_count)
+            SELECT 'department', files.department, SUM(blobs.size), COUNT(*)
+            FROM files JOIN blobs ON blobs.sha256 = files.content_hash GROUP BY 2;
+    """),
+]
+
+
+#      -----      {{{     USER MIGRATIONS     }}}      -----      #
+
+USER_MIGRATIONS = [
+    Migration(1, 'base schema', script='user_schema.sql'),
+    Migration(2, 'dashboard stats', script='user_stats.sql', sql="""
+        DELETE FROM user_stats_role;
+        INSERT INTO user_stats_role (user_role, user_count)
+            SELECT user_role, COUNT(*) FROM users GROUP BY user_role;
+    """),
+]
+
+# Database -> (migrations, table that proves the base schema already exists)
+DATABASE_MIGRATIONS = {
+    USER_DATABASE: (USER_MIGRATIONS, 'users'),
+    FILES_DATABASE: (FILES_MIGRATIONS, 'files'),
+}
+
+
+#      -----      {{{     RUNNER     }}}      -----      #
+
+SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def current_version(database: sqlite3.Connection) -> int:
+    return database.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate_database(db_name: str) -> list[Migration]:
+    """Apply the database's pending migrations in order; returns the ones applied."""
+    migrations, base_table = DATABASE_MIGRATIONS[db_name]
+    applied = []
+
+    with get_pool(db_name).connection() as database:
+        # Up to date (the usual case): one read, no write lock
+        if _has_table(database, 'schema_version') and current_version(database) >= migrations[-1].version:
+            return applied
+
+        # IMMEDIATE takes the write lock up front, so concurrent processes
+        # starting together apply each migration exactly once
+        database.execute('BEGIN IMMEDIATE')
+        try:
+            database.execute(SCHEMA_VERSION_TABLE)
+            if current_version(database) == 0 and _has_table(database, base_table):
+                # Created before versioning: the base schema is already there
+                database.execute('INSERT INTO schema_version (version, name) VALUES (1, ?)',
+                                 (migrations[0].name + ' (existing)',))
+            database.commit()
+        except Exception:
+            database.rollback()
+            raise
+
+        for migration in migrations:
+            database.execute('BEGIN IMMEDIATE')
+            try:
+                if migration.version <= current_version(database):
+                    database.rollback()
+                    continue
+                if migration.apply is not None:
+                    migration.apply(database)
+                for statement in migration.statements():
+                    database.execute(statement)
+                database.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)',
+                                 (migration.version, migration.name))
+                database.commit()
+            except Exception:
+                database.rollback()
+                raise
+            applied.append(migration)
+
+    return applied
+
+
+def migrate_databases() -> None:
+    """Bring every database up to the latest schema and report how long startup took."""
+    start = time.perf_counter()
+    summary = []
+    for db_name, (migrations, _) in DATABASE_MIGRATIONS.items():
+        applied = migrate_database(db_name)
+        for migration in applied:
+            print(f"{db_name}: applied migration {migration.version} ({migration.name})")
+        summary.append(f"{db_name} v{migrations[-1].version} ({len(applied)} applied)")
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    logging.info(f"Databases ready in {elapsed_ms:.1f} ms: {', '.join(summary)}")
@@ -1,20 +1,71 @@
 # STORE UR CLASSES HERE
 
-from flask_login import UserMixin
+# Both models use __slots__: no per-instance __dict__, so a page of files (or the
+# user cache) costs a fraction of the memory and attribute access is faster.
 
 # User class
 
 
-class User(UserMixin):
-    def __init__(self, id, username, user_role, department=None):
+class User:
+    """Logged-in user. Implements the Flask-Login user API (what UserMixin
+    provides) itself, because subclassing UserMixin would bring back a __dict__."""
+
+    __slots__ = ('id', 'username', 'role', 'department', 'email', 'phone_number')
+
+    def __init__(self, id, username, user_role, department=None,
+                 email=None, phone_number=None):
         self.id = id
         self.username = username
         self.role = user_role
         self.department = department
+        self.email = email
+        self.phone_number = phone_number
+
+    @classmethod
+    def from_row(cls, row):
+        """Create a User from a users row (sqlite3.Row or dict)."""
+        return cls(row['id'], row['username'], row['user_role'], row['department'],
+                   row['email'], row['phone_number'])
+
+    # ---------- Flask-Login ----------
+
+    @property
+    def is_active(self):
+        return True
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    # Same as UserMixin: defining __eq__ would otherwise make User unhashable
+    __hash__ = object.__hash__
 
 
 # File class
 class File:
+    __slots__ = ('id', 'file_name', 'file_type', 'file_path', 'department',
+                 'time_stamp', 'user', 'project', 'source')
+
+    # files columns in constructor order, for SELECTs read with row_factory
+    COLUMNS = __slots__
+    SELECT_COLUMNS = ', '.join(f'files.{column}' for column in COLUMNS)
+
     def __init__(self, id, file_name, file_type, file_path, department,
                  time_stamp=None, user=None, project=None, source=None):
         self.id = id
@@ -30,18 +81,16 @@ class File:
     @classmethod
     def from_row(cls, row):
         """Factory method to create a File object from a sqlite3.Row."""
-        return cls(
-            id=row['id'],
-            file_name=row['file_name'],
-            file_type=row['file_type'],
-            file_path=row['file_path'],
-            department=row['department'],
-            time_stamp=row['time_stamp'],
-            user=row['user'],
-            project=row['project'],
-            source=row['source']
-        )
+        return cls(*[row[column] for column in cls.COLUMNS])
+
+    @staticmethod
+    def row_factory(cursor, row):
+        """sqlite3 row factory for `SELECT File.SELECT_COLUMNS ...`: builds the File straight from the tuple."""
+        return File(*row)
 
     def to_dict(self):
-        """Helper to convert the object back to a dict (useful for JSON responses)."""
-        return self.__dict__
+        """Helper to convert the object to a new dict (useful for JSON responses)."""
+        return {column: getattr(self, column) for column in self.COLUMNS}
+
+    def __repr__(self):
+        return f"File(id={self.id!r}, file_name={self.file_name!r})"
@@ -0,0 +1,323 @@
+"""
+Thumbnails for the /files page, rendered in a process pool off the web path.
+
+Images (Pillow) and the first page of PDFs (PyMuPDF) are scaled down to a
+small JPEG. New attachments are queued for a thumbnail as soon as they are
+stored; files ingested before that get theirs on the first request to
+/preview/<id>. Both libraries are optional: without them the page keeps its
+emoji icons.
+
+Thumbnails live in downloads/previews/, keyed by content hash and size, and
+the folder is kept under PREVIEW_CACHE_MAX_MB by evicting the least recently
+served ones.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import time
+import atexit
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from dotenv import load_dotenv
+from flask import Response, send_file
+
+from blob_store import UPLOAD_DIRECTORY, new_temp_path
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+load_dotenv()
+
+
+#      -----      {{{     PREVIEW CONSTANTS     }}}      -----      #
+
+PREVIEW_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, 'previews')
+
+# Longest side of a thumbnail in pixels (part of the cache key, so changing it re-renders)
+PREVIEW_MAX_SIDE = int(os.getenv("PREVIEW_MAX_SIDE", "320"))
+PREVIEW_JPEG_QUALITY = int(os.getenv("PREVIEW_JPEG_QUALITY", "80"))
+
+# Rendering processes (per web worker / bot process)
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+
+# Size the previews folder is kept under
+PREVIEW_CACHE_MAX_BYTES = int(os.getenv("PREVIEW_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# Eviction trims the folder down to this share of the limit, so it runs rarely
+PREVIEW_CACHE_LOW_WATER = 0.9
+
+# Seconds a request waits for a thumbnail rendered on demand
+PREVIEW_WAIT_SECONDS = float(os.getenv("PREVIEW_WAIT_SECONDS", "10"))
+
+# Sources bigger than this are not opened at all
+PREVIEW_MAX_SOURCE_BYTES = int(os.getenv("PREVIEW_MAX_SOURCE_MB", "100")) * 1024 * 1024
+
+# A thumbnail only changes if the file does, so browsers can keep it for a day
+PREVIEW_CACHE_CONTROL = os.getenv("PREVIEW_CACHE_CONTROL", "private, max-age=86400")
+
+# Serving a thumbnail refreshes its mtime (the LRU clock) at most this often
+PREVIEW_TOUCH_INTERVAL = 3600
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp', 'tif', 'tiff'}
+
+
+#      -----      {{{     KEYS / PATHS     }}}      -----      #
+
+def preview_kind(file_type: str | None, file_name: str | None) -> str | None:
+    """'image' or 'pdf' if a thumbnail can be rendered for this file here, else None."""
+    file_type = (file_type or '').lower()
+    extension = os.path.splitext(file_name or '')[1].lstrip('.').lower()
+
+    # file_type is a MIME type for Discord attachments and an extension for older rows
+    if file_type.startswith('image/') or file_type in IMAGE_EXTENSIONS or extension in IMAGE_EXTENSIONS:
+        return 'image' if Image is not None else None
+    if file_type in ('application/pdf', 'pdf') or extension == 'pdf':
+        return 'pdf' if pymupdf is not None else None
+    return None
+
+
+def preview_key(content_hash: str | None, source_path: str) -> str:
+    """The content hash, or for files stored before hashing, a hash of path, size and mtime."""
+    if content_hash:
+        return content_hash
+    stat = os.stat(source_path)
+    return hashlib.sha256(f"{os.path.abspath(source_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+
+
+def preview_path(key: str) -> str:
+    return os.path.join(PREVIEW_DIRECTORY, key[:2], f"{key}-{PREVIEW_MAX_SIDE}.jpg")
+
+
+# Empty marker left when rendering failed, so a broken file isn't retried on every page view
+def _failed_marker(key: str) -> str:
+    return preview_path(key)[:-len('.jpg')] + '.failed'
+
+
+#      -----      {{{     RENDERING (WORKER PROCESS)     }}}      -----      #
+
+def _render_image(source_path: str, temp_path: str) -> None:
+    with Image.open(source_path) as image:
+        # JPEG can decode straight at a reduced scale, far cheaper than a full decode
+        image.draft('RGB', (PREVIEW_MAX_SIDE, PREVIEW_MAX_SIDE))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((PREVIEW_MAX_SIDE, PREVIEW_MAX_SIDE))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # JPEG has no alpha: flatten transparent images onto white
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        image.convert('RGB').save(temp_path, 'JPEG', quality=PREVIEW_JPEG_QUALITY, optimize=True)
+
+
+def _render_pdf(source_path: str, temp_path: str) -> None:
+    with pymupdf.open(source_path) as document:
+        page = document[0]
+        zoom = PREVIEW_MAX_SIDE / max(page.rect.width, page.rect.height)
+        pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+        pixmap.save(temp_path, output='jpeg', jpg_quality=PREVIEW_JPEG_QUALITY)
+
+
+def render_preview(source_path: str, kind: str, key: str) -> int:
+    """Render one thumbnail (runs in a pool process); returns its size, 0 on failure."""
+    destination = preview_path(key)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    temp_path = new_temp_path()
+    try:
+        if os.path.getsize(source_path) > PREVIEW_MAX_SOURCE_BYTES:
+            raise ValueError("source too large to preview")
+        if kind == 'pdf':
+            _render_pdf(source_path, temp_path)
+        else:
+            _render_image(source_path, temp_path)
+        # Atomic: readers see either no thumbnail or a complete one
+        os.replace(temp_path, destination)
+        return os.path.getsize(destination)
+    except Exception as e:
+        logging.warning(f"Preview failed for {source_path}: {e}")
+        open(_failed_marker(key), 'wb').close()
+        return 0
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+#      -----      {{{     CACHE DIRECTORY     }}}      -----      #
+
+class PreviewCache:
+    """Keeps the previews folder under a byte limit, least recently served out first.
+
+    File mtimes are the LRU clock (refreshed when a thumbnail is served), so
+    the order survives restarts and is shared by every process using the
+    folder. The running total is per process and re-counted on each eviction.
+    """
+
+    def __init__(self, max_bytes: int = PREVIEW_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._total: int | None = None
+        self._lock = threading.Lock()
+
+    def _scan(self) -> list[tuple[float, int, str]]:
+        entries = []
+        if not os.path.isdir(PREVIEW_DIRECTORY):
+            return entries
+        for shard in os.scandir(PREVIEW_DIRECTORY):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Evicted or discarded by another process meanwhile
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def record(self, size: int) -> None:
+        """Count a newly written thumbnail and evict if the folder is over the limit."""
+        with self._lock:
+            if self._total is None:
+                self._total = sum(file_size for _, file_size, _ in self._scan())
+            else:
+                self._total += size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(self._scan())
+        total = sum(file_size for _, file_size, _ in entries)
+        target = self.max_bytes * PREVIEW_CACHE_LOW_WATER
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._total = total
+        logging.info(f"Preview cache evicted {removed} thumbnail(s), {total} bytes left")
+
+    @staticmethod
+    def touch(path: str, mtime: float, now: float) -> None:
+        if now - mtime > PREVIEW_TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+
+preview_cache = PreviewCache()
+
+
+#      -----      {{{     WORKER POOL     }}}      -----      #
+
+class PreviewWorker:
+    """Process pool that renders thumbnails, started on first use.
+
+    A thumbnail already being rendered is not queued twice; callers share
+    its future.
+    """
+
+    def __init__(self, max_workers: int = PREVIEW_WORKERS):
+        self.max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: the bot and web processes run threads (and an event loop)
+            self._executor = ProcessPoolExecutor(self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def submit(self, source_path: str, kind: str, key: str) -> Future:
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._get_executor().submit(render_preview, source_path, kind, key)
+                self._pending[key] = future
+                future.add_done_callback(lambda done: self._finished(key, done))
+            return future
+
+    def _finished(self, key: str, future: Future) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+        if not future.cancelled() and future.exception() is None and future.result():
+            preview_cache.record(future.result())
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+preview_worker = PreviewWorker()
+atexit.register(preview_worker.shutdown)
+
+
+#      -----      {{{     PUBLIC API     }}}      -----      #
+
+def queue_preview(source_path: str, content_hash: str | None, file_type: str | None,
+                  file_name: str | None) -> None:
+    """Render a thumbnail in the background if there isn't one yet (ingest time)."""
+    kind = preview_kind(file_type, file_name)
+    if kind is None:
+        return
+    key = preview_key(content_hash, source_path)
+    if not os.path.exists(preview_path(key)):
+        preview_worker.submit(source_path, kind, key)
+
+
+def get_preview(source_path: str, content_hash: str | None, file_type: str | None,
+                file_name: str | None, wait: float = PREVIEW_WAIT_SECONDS) -> tuple[str, str] | None:
+    """(thumbnail path, key), rendering it now if needed; None if there is no preview."""
+    kind = preview_kind(file_type, file_name)
+    if kind is None:
+        return None
+    key = preview_key(content_hash, source_path)
+    path = preview_path(key)
+    if os.path.exists(path):
+        return path, key
+    if os.path.exists(_failed_marker(key)):
+        return None
+
+    # Files ingested before thumbnails existed are rendered on first request
+    try:
+        size = preview_worker.submit(source_path, kind, key).result(timeout=wait)
+    except FutureTimeoutError:
+        # Still rendering; it will be there for the next page view
+        return None
+    return (path, key) if size else None
+
+
+def discard_preview(content_hash: str) -> None:
+    """Drop the thumbnail of a blob that was deleted."""
+    for path in (preview_path(content_hash), _failed_marker(content_hash)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def serve_preview(path: str, key: str) -> Response:
+    """Send a thumbnail with a strong ETag, answering revalidation with 304."""
+    mtime = os.path.getmtime(path)
+    response = send_file(path, mimetype='image/jpeg', etag=f"{key}-{PREVIEW_MAX_SIDE}", conditional=True)
+    response.headers['Cache-Control'] = PREVIEW_CACHE_CONTROL
+    PreviewCache.touch(path, mtime, time.time())
+    return response
@@ -0,0 +1,459 @@
+"""
+Incremental garbage collection and reconciliation of downloads/ against the files database.
+
+Three sorted streams are merged by content hash, each read in batches so
+memory does not grow with the size of the store:
+
+    blob files on disk   downloads/blobs/<aa>/<bb>/<sha256>, walked in order
+    blobs rows           keyset pages ordered by sha256
+    files references     COUNT(*) per content_hash, keyset pages of the index
+
+and every hash is checked for:
+
+    orphan blob          on disk, referenced by no files row    -> deleted (after a grace period)
+    stale blobs row      no files row and no file on disk       -> deleted
+    wrong ref_count      blobs.ref_count != actual references    -> recounted
+    unregistered blob    referenced and on disk, no blobs row    -> row added
+    dangling files rows  referenced content missing from disk    -> reported (deleted with --delete-dangling,
+                                                                     once past the grace period)
+
+Files stored before content-addressed storage are checked by name: rows
+whose downloads/ file is gone are dangling, and downloads/ files no row
+names are reported (never deleted, they may have been put there by hand).
+Leftover partial downloads in downloads/tmp/ are removed.
+
+Run it by hand (a dry run unless --repair is given):
+
+    python storage_gc.py [--repair] [--delete-dangling]
+
+The process that runs the bot also runs it every GC_INTERVAL_HOURS with
+repairs on: bot_runner.py in production, or `python app.py` in development,
+where the bot shares the process with Flask. The web tier (wsgi.py) never
+does, so there is one GC per deployment. It runs in a low-priority thread
+throttled to GC_MAX_OPS_PER_SECOND filesystem operations.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import time
+import heapq
+import logging
+import argparse
+import threading
+from itertools import groupby
+from typing import Iterator
+
+from dotenv import load_dotenv
+
+from blob_store import BLOB_DIRECTORY, TEMP_DIRECTORY, UPLOAD_DIRECTORY, blob_path, remove_blob, stored_file_path
+from connection_pool import get_pool
+from database_helpers import FILES_DATABASE, file_facets
+from previews import PREVIEW_DIRECTORY, discard_preview
+
+load_dotenv()
+
+
+#      -----      {{{     GC CONSTANTS     }}}      -----      #
+
+# Rows / hashes handled per database round trip
+GC_BATCH_SIZE = int(os.getenv("GC_BATCH_SIZE", "500"))
+
+# Filesystem operations (stat, unlink) per second; 0 turns throttling off
+GC_MAX_OPS_PER_SECOND = float(os.getenv("GC_MAX_OPS_PER_SECOND", "200"))
+
+# Files younger than this are never deleted: a download may have just been
+# stored while its files row still waits in the write-behind queue
+GC_GRACE_SECONDS = float(os.getenv("GC_GRACE_SECONDS", "3600"))
+
+# Hours between scheduled runs in the bot process; 0 disables them
+GC_INTERVAL_HOURS = float(os.getenv("GC_INTERVAL_HOURS", "24"))
+
+# Delay before the first scheduled run, so it stays clear of startup
+GC_INITIAL_DELAY = float(os.getenv("GC_INITIAL_DELAY", "600"))
+
+# Examples of each finding kept for the report
+GC_REPORT_EXAMPLES = 10
+
+# downloads/ folders that are not legacy files
+MANAGED_DIRECTORIES = {os.path.basename(BLOB_DIRECTORY), os.path.basename(TEMP_DIRECTORY),
+                       os.path.basename(PREVIEW_DIRECTORY)}
+
+# Sort order of the merge streams when the same hash appears in several
+DISK, ROW, REFS = 0, 1, 2
+
+
+#      -----      {{{     THROTTLE / REPORT     }}}      -----      #
+
+class Throttle:
+    """Spaces filesystem operations out to at most `rate` per second."""
+
+    def __init__(self, rate: float = GC_MAX_OPS_PER_SECOND):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+
+    def tick(self, ops: int = 1) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next, now) + ops * self.interval
+
+
+class GCReport:
+    """Counts of what a run found and fixed, with a few examples of each."""
+
+    def __init__(self, repair: bool):
+        self.repair = repair
+        self.counts: dict[str, int] = {}
+        self.examples: dict[str, list[str]] = {}
+        self.bytes_freed = 0
+        self.started = time.monotonic()
+
+    def note(self, finding: str, detail: str) -> None:
+        self.counts[finding] = self.counts.get(finding, 0) + 1
+        examples = self.examples.setdefault(finding, [])
+        if len(examples) < GC_REPORT_EXAMPLES:
+            examples.append(detail)
+
+    def summary(self) -> str:
+        mode = 'repair' if self.repair else 'dry run'
+        elapsed = time.monotonic() - self.started
+        if not self.counts:
+            return f"Storage GC ({mode}): no problems found in {elapsed:.1f}s"
+        lines = [f"Storage GC ({mode}) in {elapsed:.1f}s, {self.bytes_freed} bytes freed:"]
+        for finding, count in sorted(self.counts.items()):
+            lines.append(f"  {finding}: {count}  e.g. {', '.join(self.examples[finding][:3])}")
+        return '\n'.join(lines)
+
+
+#      -----      {{{     SORTED STREAMS     }}}      -----      #
+
+def _sorted_entries(directory: str, throttle: Throttle) -> list[os.DirEntry]:
+    throttle.tick()
+    try:
+        with os.scandir(directory) as entries:
+            return sorted(entries, key=lambda entry: entry.name)
+    except FileNotFoundError:
+        return []
+
+
+def _disk_blobs(throttle: Throttle) -> Iterator[tuple[str, int, tuple]]:
+    """(sha256, DISK, (size, mtime)) for every blob file, in hash order.
+
+    The two shard levels make this one small directory listing at a time.
+    """
+    for first in _sorted_entries(BLOB_DIRECTORY, throttle):
+        if not first.is_dir():
+            continue
+        for second in _sorted_entries(first.path, throttle):
+            if not second.is_dir():
+                continue
+            for entry in _sorted_entries(second.path, throttle):
+                throttle.tick()
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.name, DISK, (stat.st_size, stat.st_mtime)
+
+
+def _blob_rows(batch_size: int) -> Iterator[tuple[str, int, tuple]]:
+    """(sha256, ROW, (size, ref_count)) for every blobs row, in hash order."""
+    last = ''
+    while True:
+        with get_pool(FILES_DATABASE).connection() as database:
+            rows = database.execute(
+                'SELECT sha256, size, ref_count FROM blobs WHERE sha256 > ? ORDER BY sha256 LIMIT ?',
+                (last, batch_size)
+            ).fetchall()
+        for sha256, size, ref_count in rows:
+            yield sha256, ROW, (size, ref_count)
+        if len(rows) < batch_size:
+            return
+        last = rows[-1][0]
+
+
+def _file_references(batch_size: int) -> Iterator[tuple[str, int, tuple]]:
+    """(sha256, REFS, (count,)) for every content hash used by files rows, in hash order."""
+    last = ''
+    while True:
+        # Walks idx_files_content_hash; each page is a short read of its own
+        with get_pool(FILES_DATABASE).connection() as database:
+            rows = database.execute(
+                'SELECT content_hash, COUNT(*) FROM files WHERE content_hash > ? '
+                'GROUP BY content_hash ORDER BY content_hash LIMIT ?',
+                (last, batch_size)
+            ).fetchall()
+        for content_hash, count in rows:
+            yield content_hash, REFS, (count,)
+        if len(rows) < batch_size:
+            return
+        last = rows[-1][0]
+
+
+#      -----      {{{     BLOB CHECKS     }}}      -----      #
+
+def _is_recent(path: str) -> bool:
+    try:
+        return time.time() - os.path.getmtime(path) < GC_GRACE_SECONDS
+    except FileNotFoundError:
+        return False
+
+
+def _delete_unreferenced(sha256: str, report: GCReport) -> None:
+    """Delete a blob's row and file, re-checking under the write lock that nothing uses it."""
+    path = blob_path(sha256)
+    with get_pool(FILES_DATABASE).connection() as database:
+        # IMMEDIATE holds off ingestion, so no files row can appear between the check and the delete
+        database.execute('BEGIN IMMEDIATE')
+        try:
+            if database.execute('SELECT 1 FROM files WHERE content_hash = ? LIMIT 1', (sha256,)).fetchone() \
+                    or _is_recent(path):
+                database.rollback()
+                return
+            database.execute('DELETE FROM blobs WHERE sha256 = ?', (sha256,))
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                size = 0
+            database.commit()
+        except Exception:
+            database.rollback()
+            raise
+
+    # Unlinked only after the commit, so a failed commit never leaves a row without its file
+    if remove_blob(sha256):
+        report.bytes_freed += size
+        discard_preview(sha256)
+
+
+def _recount(sha256: str, size: int) -> None:
+    """Set a blob's ref_count from the files table (adding the row if it is missing)."""
+    with get_pool(FILES_DATABASE).connection() as database:
+        database.execute(
+            'INSERT INTO blobs (sha256, size, ref_count) '
+            'VALUES (?, ?, (SELECT COUNT(*) FROM files WHERE content_hash = ?)) '
+            'ON CONFLICT (sha256) DO UPDATE SET ref_count = excluded.ref_count',
+            (sha256, size, sha256)
+        )
+        database.commit()
+
+
+def _delete_dangling_rows(where: str, params: tuple) -> int:
+    """Delete the matching files rows whose content is still missing, re-checked under the write lock.
+
+    Rows added within the grace period are kept: their download may be stored
+    by the time they are read again.
+    """
+    with get_pool(FILES_DATABASE).connection() as database:
+        # IMMEDIATE holds off ingestion, so a blob stored meanwhile is seen by the re-check
+        database.execute('BEGIN IMMEDIATE')
+        try:
+            rows = database.execute(
+                f"SELECT id, file_name, content_hash, file_path FROM files WHERE ({where}) "
+                f"AND time_stamp < datetime('now', ?)", (*params, f'-{int(GC_GRACE_SECONDS)} seconds')
+            ).fetchall()
+            missing = [file_id for file_id, file_name, content_hash, file_path in rows
+                       if stored_file_path(file_name, content_hash, file_path) is None]
+            if missing:
+                database.execute(f"DELETE FROM files WHERE id IN ({', '.join('?' * len(missing))})",
+                                 tuple(missing))
+            database.commit()
+        except Exception:
+            database.rollback()
+            raise
+    return len(missing)
+
+
+def _check_blob(sha256: str, disk: tuple | None, row: tuple | None, refs: int,
+                report: GCReport, delete_dangling: bool, throttle: Throttle) -> None:
+    if refs == 0:
+        if disk is not None:
+            if time.time() - disk[1] < GC_GRACE_SECONDS:
+                return
+            report.note('orphan blob', sha256[:12])
+        elif row is not None:
+            report.note('stale blobs row', sha256[:12])
+        else:
+            return
+        if report.repair:
+            throttle.tick()
+            _delete_unreferenced(sha256, report)
+        return
+
+    if disk is None:
+        report.note('dangling files rows', f"{sha256[:12]} x{refs}")
+        if report.repair and delete_dangling:
+            _delete_dangling_rows('content_hash = ?', (sha256,))
+            _delete_unreferenced(sha256, report)
+        return
+
+    if row is None:
+        report.note('unregistered blob', sha256[:12])
+    elif row[1] != refs:
+        report.note('wrong ref_count', f"{sha256[:12]} {row[1]}->{refs}")
+    else:
+        if row[0] != disk[0]:
+            report.note('size mismatch', f"{sha256[:12]} {row[0]}!={disk[0]}")
+        return
+    if report.repair:
+        _recount(sha256, disk[0])
+
+
+def reconcile_blobs(report: GCReport, delete_dangling: bool = False,
+                    batch_size: int = GC_BATCH_SIZE, throttle: Throttle | None = None) -> None:
+    """Merge the disk, blobs and files streams by hash and check each hash once."""
+    throttle = throttle or Throttle()
+    streams = heapq.merge(_disk_blobs(throttle), _blob_rows(batch_size), _file_references(batch_size))
+    for sha256, items in groupby(streams, key=lambda item: item[0]):
+        found = {source: payload for _, source, payload in items}
+        refs = found[REFS][0] if REFS in found else 0
+        _check_blob(sha256, found.get(DISK), found.get(ROW), refs, report, delete_dangling, throttle)
+
+
+#      -----      {{{     LEGACY FILES     }}}      -----      #
+
+def _legacy_name_batches(batch_size: int, throttle: Throttle) -> Iterator[list[str]]:
+    """Names of the files directly in downloads/, streamed from the directory in batches."""
+    batch = []
+    try:
+        with os.scandir(UPLOAD_DIRECTORY) as entries:
+            for entry in entries:
+                throttle.tick()
+                if entry.name in MANAGED_DIRECTORIES or not entry.is_file():
+                    continue
+                batch.append(entry.name)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+    except FileNotFoundError:
+        pass
+    if batch:
+        yield batch
+
+
+def reconcile_legacy_files(report: GCReport, delete_dangling: bool = False,
+                           batch_size: int = GC_BATCH_SIZE, throttle: Throttle | None = None) -> None:
+    """Check files stored by name in downloads/ (before content-addressed storage)."""
+    throttle = throttle or Throttle()
+
+    # Rows whose file is gone, paged by id (metadata-only rows point at Discord, not disk)
+    last_id = 0
+    while True:
+        with get_pool(FILES_DATABASE).connection() as database:
+            rows = database.execute(
+                "SELECT id, file_name, file_path FROM files WHERE content_hash IS NULL AND id > ? "
+                "AND COALESCE(file_path, '') NOT LIKE 'http%' ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).fetchall()
+        missing = []
+        for file_id, file_name, file_path in rows:
+            throttle.tick()
+            if stored_file_path(file_name, None, file_path) is None:
+                report.note('dangling legacy row', f"#{file_id} {file_name}")
+                missing.append(file_id)
+        if missing and report.repair and delete_dangling:
+            _delete_dangling_rows(f"id IN ({', '.join('?' * len(missing))})", tuple(missing))
+        if len(rows) < batch_size:
+            break
+        last_id = rows[-1][0]
+
+    # downloads/ files no row points at, looked up a batch of names at a time
+    for batch in _legacy_name_batches(batch_size, throttle):
+        paths = [f"{prefix}{name}" for name in batch
+                 for prefix in (UPLOAD_DIRECTORY + '/', '/' + UPLOAD_DIRECTORY + '/')]
+        with get_pool(FILES_DATABASE).connection() as database:
+            known = database.execute(
+                f"SELECT file_name, file_path FROM files WHERE content_hash IS NULL AND "
+                f"(file_name IN ({', '.join('?' * len(batch))}) OR file_path IN ({', '.join('?' * len(paths))}))",
+                (*batch, *paths)
+            ).fetchall()
+        referenced = {file_name for file_name, _ in known} | \
+                     {os.path.basename(file_path.replace('\\', '/')) for _, file_path in known}
+        for name in batch:
+            if name not in referenced:
+                report.note('unreferenced legacy file', name)
+
+
+def clean_temp_files(report: GCReport, throttle: Throttle | None = None) -> None:
+    """Remove partial downloads / renders that were abandoned (e.g. by a crash)."""
+    throttle = throttle or Throttle()
+    for entry in _sorted_entries(TEMP_DIRECTORY, throttle):
+        throttle.tick()
+        if entry.name.endswith('.part') and not _is_recent(entry.path):
+            report.note('abandoned temp file', entry.name)
+            if report.repair:
+                report.bytes_freed += entry.stat().st_size
+                os.remove(entry.path)
+
+
+#      -----      {{{     RUN     }}}      -----      #
+
+def reconcile(repair: bool = False, delete_dangling: bool = False,
+              batch_size: int = GC_BATCH_SIZE, max_ops_per_second: float = GC_MAX_OPS_PER_SECOND) -> GCReport:
+    """Run every check once; with repair=False nothing is changed, only reported."""
+    report = GCReport(repair)
+    throttle = Throttle(max_ops_per_second)
+    reconcile_blobs(report, delete_dangling, batch_size, throttle)
+    reconcile_legacy_files(report, delete_dangling, batch_size, throttle)
+    clean_temp_files(report, throttle)
+
+    if repair and delete_dangling and any(finding.startswith('dangling') for finding in report.counts):
+        file_facets.invalidate()
+    logging.info(report.summary(), extra={'fields': {'gc_counts': report.counts,
+                                                      'gc_bytes_freed': report.bytes_freed}})
+    return report
+
+
+def _lower_thread_priority() -> None:
+    # Linux schedules threads individually, so this lowers only the GC thread
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+_scheduler_stop = threading.Event()
+
+
+def start_gc_scheduler(interval_hours: float = GC_INTERVAL_HOURS) -> threading.Thread | None:
+    """Run reconcile(repair=True) periodically in a low-priority background thread."""
+    if interval_hours <= 0:
+        return None
+
+    def run():
+        _lower_thread_priority()
+        delay = GC_INITIAL_DELAY
+        while not _scheduler_stop.wait(delay):
+            try:
+                reconcile(repair=True)
+            except Exception as e:
+                logging.error(f"Storage GC failed: {e}")
+            delay = interval_hours * 3600
+
+    thread = threading.Thread(target=run, name="storage-gc", daemon=True)
+    thread.start()
+    return thread
+
+
+def stop_gc_scheduler() -> None:
+    _scheduler_stop.set()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Reconcile downloads/ with the files database.')
+    parser.add_argument('--repair', action='store_true', help='fix what can be fixed (default: report only)')
+    parser.add_argument('--delete-dangling', action='store_true',
+                        help='with --repair, also delete files rows whose content is gone')
+    parser.add_argument('--batch-size', type=int, default=GC_BATCH_SIZE)
+    parser.add_argument('--max-ops', type=float, default=GC_MAX_OPS_PER_SECOND,
+                        help='filesystem operations per second, 0 for unthrottled')
+    args = parser.parse_args()
+
+    report = reconcile(args.repair, args.delete_dangling, args.batch_size, args.max_ops)
+    print(report.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+In-process LRU + TTL cache of User objects for Flask-Login's user_loader.
+
+Every authenticated request loads the current user, so caching the row saves
+the most frequently executed query. Routes that change a user call
+`user_cache.invalidate(user_id)`.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from dotenv import load_dotenv
+
+from models import User
+
+load_dotenv()
+
+
+#      -----      {{{     CACHE CONSTANTS     }}}      -----      #
+
+# Max number of users kept in memory
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+
+# Seconds a cached user is trusted before reloading (bounds staleness across processes)
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+
+#      -----      {{{     USER CACHE     }}}      -----      #
+
+class UserCache:
+    """Thread-safe LRU cache of User objects keyed by user id, with expiry."""
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[float, User]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, loader: Callable[[int], User | None]) -> User | None:
+        """Return the cached user, or load, cache and return it on a miss."""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Load outside the lock so a slow query doesn't block other lookups
+        user = loader(user_id)
+        if user is None:
+            self.invalidate(user_id)
+            return None
+
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id) -> None:
+        """Forget one user (call after any change to their row)."""
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+user_cache = UserCache()
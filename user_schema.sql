@@ -1,7 +1,7 @@
 -- user_schema.sql
 
--- Schema for users table
-DROP TABLE IF EXISTS users;
+-- Base schema for the users table (migration 1 in migrations.py, applied once
+-- to a new database). Dashboard aggregates live in user_stats.sql.
 
 CREATE TABLE users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -0,0 +1,28 @@
+-- user_stats.sql
+
+-- User counts per role for the dashboard, kept current by triggers on users.
+-- Safe to run on new and existing databases (everything is IF NOT EXISTS);
+-- migration 2 fills the table from the existing rows.
+
+CREATE TABLE IF NOT EXISTS user_stats_role (
+    user_role TEXT PRIMARY KEY,
+    user_count INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS user_stats_insert AFTER INSERT ON users BEGIN
+    INSERT INTO user_stats_role (user_role, user_count) VALUES (new.user_role, 1)
+        ON CONFLICT (user_role) DO UPDATE SET user_count = user_count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_stats_delete AFTER DELETE ON users BEGIN
+    UPDATE user_stats_role SET user_count = user_count - 1 WHERE user_role = old.user_role;
+    DELETE FROM user_stats_role WHERE user_role = old.user_role AND user_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_stats_update AFTER UPDATE OF user_role ON users
+WHEN old.user_role IS NOT new.user_role BEGIN
+    UPDATE user_stats_role SET user_count = user_count - 1 WHERE user_role = old.user_role;
+    DELETE FROM user_stats_role WHERE user_role = old.user_role AND user_count <= 0;
+    INSERT INTO user_stats_role (user_role, user_count) VALUES (new.user_role, 1)
+        ON CONFLICT (user_role) DO UPDATE SET user_count = user_count + 1;
+END;
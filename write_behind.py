@@ -0,0 +1,185 @@
+"""
+Write-behind buffering for high-volume inserts.
+
+Records are collected in memory and written by a background thread in one
+transaction per batch, so a busy channel costs one commit per batch instead of
+one commit (and fsync) per record. A batch that keeps failing is split up
+and retried record by record; records that still fail are dead-lettered
+(see log_handler.log_dead_letter) so one bad record can't stall the rest.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import atexit
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+from connection_pool import get_pool
+from log_handler import log_dead_letter
+from metrics import Counter
+
+
+#      -----      {{{     WRITE-BEHIND QUEUE     }}}      -----      #
+
+# Seconds to wait before retrying a batch that failed to commit
+RETRY_DELAY = 1.0
+
+# Failed attempts of a whole batch before its records are written one at a time
+MAX_BATCH_ATTEMPTS = 5
+
+DEAD_LETTERS = Counter('write_behind_dead_letters_total', 'Records dropped after failing to be written',
+                       ('queue',))
+
+
+class WriteBehindQueue:
+    """Buffers records and flushes them by size or time through `write_batch`.
+
+    `write_batch(database, records)` runs inside a transaction and must be safe
+    to repeat: a batch that fails stays buffered and is retried, so every record
+    is written at least once. After MAX_BATCH_ATTEMPTS failures the batch is
+    written one record per transaction and any record that still fails is
+    dead-lettered and dropped. `on_flushed(records, result)` runs after each
+    commit with whatever `write_batch` returned.
+    """
+
+    def __init__(self, name: str, db_name: str,
+                 write_batch: Callable[[sqlite3.Connection, list[dict]], object],
+                 on_flushed: Callable[[list[dict], object], None] | None = None,
+                 batch_size: int = 50, flush_interval: float = 1.0,
+                 max_pending: int = 1000):
+        self.name = name
+        self.db_name = db_name
+        self.write_batch = write_batch
+        self.on_flushed = on_flushed
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.batch_size, max_pending)
+        self.flushed: int = 0
+        self.failed_batches: int = 0
+        self.dead_letters: int = 0
+        self._attempts = 0
+
+        self._pending: list[dict] = []
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"{name}-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------- producers ----------
+
+    def submit(self, record: dict) -> None:
+        """Buffer a record, blocking while the buffer is full (backpressure)."""
+        with self._condition:
+            while len(self._pending) >= self.max_pending and not self._closed:
+                self._condition.wait()
+
+            if self._closed:
+                raise RuntimeError(f"{self.name} queue is closed")
+
+            self._pending.append(record)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify_all()
+
+    def submit_many(self, records: list[dict]) -> None:
+        """Buffer several records (e.g. every link in one message)."""
+        for record in records:
+            self.submit(record)
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.depth,
+            "max_pending": self.max_pending,
+            "flushed": self.flushed,
+            "failed_batches": self.failed_batches,
+            "dead_letters": self.dead_letters,
+        }
+
+    # ---------- flushing ----------
+
+    def flush(self) -> None:
+        """Write everything buffered so far before returning."""
+        while self._write_next():
+            pass
+
+    def close(self) -> None:
+        """Stop the writer thread and flush what is left (runs at exit too)."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.flush()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._pending) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                if self._closed:
+                    return
+                has_pending = bool(self._pending)
+
+            if has_pending and not self._write_next():
+                time.sleep(RETRY_DELAY)
+
+    # write the oldest batch in a single transaction; records stay buffered until it commits
+    def _write_next(self) -> bool:
+        with self._write_lock:
+            with self._condition:
+                batch = self._pending[:self.batch_size]
+            if not batch:
+                return False
+
+            try:
+                written = [(batch, self._write(batch))]
+            except Exception as e:
+                self.failed_batches += 1
+                self._attempts += 1
+                print(f"Error flushing {len(batch)} record(s) from {self.name}: {e}")
+                if self._attempts < MAX_BATCH_ATTEMPTS:
+                    return False
+                written = self._write_one_by_one(batch)
+            self._attempts = 0
+
+            # Only the holder of the write lock removes from the front of the buffer
+            with self._condition:
+                del self._pending[:len(batch)]
+                self.flushed += sum(len(records) for records, _ in written)
+                self._condition.notify_all()
+
+        if self.on_flushed is not None:
+            for records, result in written:
+                self.on_flushed(records, result)
+        return True
+
+    def _write(self, records: list[dict]) -> object:
+        with get_pool(self.db_name).connection() as database:
+            with database:
+                return self.write_batch(database, records)
+
+    # isolate the record(s) that keep a batch from committing; the rest are written
+    def _write_one_by_one(self, batch: list[dict]) -> list[tuple[list[dict], object]]:
+        written = []
+        for record in batch:
+            try:
+                written.append(([record], self._write([record])))
+            except Exception as e:
+                self.dead_letters += 1
+                DEAD_LETTERS.inc(1, self.name)
+                print(f"Dropping a record from {self.name} after repeated failures: {e}")
+                log_dead_letter(self.name, record, e)
+        return written
@@ -0,0 +1,55 @@
+"""
+Production entry point for the web app.
+
+`python app.py` runs Flask's single-threaded debug server with the Discord bot
+in a thread of the same process. In production the two are split:
+
+    gunicorn -c gunicorn.conf.py wsgi:app      # web tier, several workers (Linux/macOS)
+    python wsgi.py                             # web tier on waitress threads (any OS)
+    python bot_runner.py                       # collector bot, its own process
+
+gunicorn can also start the bot for you (RUN_BOT_WITH_WEB=1, see gunicorn.conf.py).
+Both processes share the SQLite databases, which run in WAL mode, so the web
+workers read while the bot writes.
+"""
+
+#      -----      {{{     IMPORTS     }}}      -----      #
+
+import os
+
+from dotenv import load_dotenv
+
+from app import create_app
+from metrics import clear_metrics_directory
+from migrations import migrate_databases
+
+load_dotenv()
+
+
+#      -----      {{{     SERVER CONSTANTS     }}}      -----      #
+
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", "5000"))
+
+# Request threads for waitress (gunicorn reads its own settings from gunicorn.conf.py)
+WEB_THREADS = int(os.getenv("WEB_THREADS", "8"))
+
+
+# The web tier only: no bot token needed, and the bot process rotates the logs
+app = create_app()
+
+# Create / migrate the databases before the first request (a no-op read once
+# they are current; gunicorn already ran it before forking the workers)
+migrate_databases()
+
+
+#      -----      {{{     RUN APP     }}}      -----      #
+
+if __name__ == '__main__':
+    from waitress import serve
+
+    # Drop the /metrics snapshots of processes from an earlier run
+    clear_metrics_directory(stale_only=True)
+
+    print(f"Serving on http://{WEB_HOST}:{WEB_PORT} with {WEB_THREADS} waitress threads")
+    serve(app, host=WEB_HOST, port=WEB_PORT, threads=WEB_THREADS)